@@ -1,33 +1,74 @@
 # core/admin.py
 from .models import Product, Order, Review
-from reportlab.lib.pagesizes import A4
 from django.contrib import admin
 from django.urls import path
 from django.utils.translation import gettext_lazy as _
 from django.shortcuts import render
-from django.http import HttpResponse
 from django.utils.safestring import mark_safe
-from .models import Report
-from .utils import generate_sales_report
-import matplotlib.pyplot as plt
+from .models import Report, StockReservation
+from .reports import ReportQuery, cached_report
+from .exports import sales_lines_csv_response
+from .pdf import sales_report_pdf_response
+from .charts import line_chart_url
+from . import search
+from .images import schedule_image_derivatives
+from .forms import ProductImportForm
+from .product_import import detect_format, import_products, read_rows
+from django.core.exceptions import PermissionDenied
 import io
-import base64
-import csv
-from reportlab.pdfgen import canvas
-from django.utils import timezone
-from django.conf import settings
-import os
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'category', 'rating', 'is_popular', 'created_by')
+    change_list_template = "admin/product_change_list.html"
+    list_display = ('name', 'sku', 'price', 'stock', 'category', 'rating', 'is_popular', 'popularity_score', 'created_by')
     list_filter = ('category', 'is_popular', 'rating')
     search_fields = ('name',)
+    readonly_fields = ('popularity_score',)
     verbose_name = _('Продукт')
     verbose_name_plural = _('Продукты')
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='core_product_import'),
+        ]
+        return custom_urls + urls
+
+    def import_view(self, request):
+        if not self.has_change_permission(request) or not self.has_add_permission(request):
+            raise PermissionDenied
+        result = None
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            # Файл читается потоком, без загрузки в память целиком
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_products(read_rows(stream, detect_format(upload.name)), request.user,
+                                         dry_run=form.cleaned_data['dry_run'])
+            except ValueError as e:
+                form.add_error('file', f'Некорректный файл: {e}')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': _('Загрузка товаров'),
+            'form': form,
+            'result': result,
+            'dry_run': result is not None and form.cleaned_data['dry_run'],
+        }
+        return render(request, 'admin/product_import.html', context)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_image_derivatives(obj)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу (название, описание, категория) вместо icontains по всей таблице
+        if not search_term or search.search_backend() is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=search.search_product_ids(search_term, search.ADMIN_SEARCH_LIMIT)), False
+
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
@@ -37,6 +78,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at')
     search_fields = ('user__username',)
     ordering = ('-created_at',)
+    list_select_related = ('user',)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -56,6 +98,13 @@ class OrderAdmin(admin.ModelAdmin):
         return obj.user.username if obj.user else "Анонимный пользователь"
     get_user.short_description = _('Пользователь')
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'owner', 'quantity', 'expires_at')
+    list_select_related = ('product',)
+    search_fields = ('owner', 'product__name')
+    ordering = ('-expires_at',)
+
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'rating', 'created_at')
@@ -68,8 +117,9 @@ class ReviewAdmin(admin.ModelAdmin):
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
     change_list_template = "admin/sales_report.html"
-    list_display = ('created_at', 'total_sales', 'total_orders', 'total_customers')
-    ordering = ('-created_at',)
+    list_display = ('period_start', 'period_end', 'granularity', 'total_sales', 'total_orders', 'total_customers', 'updated_at')
+    list_filter = ('granularity',)
+    ordering = ('-period_start', '-created_at')
 
     def get_urls(self):
         urls = super().get_urls()
@@ -84,20 +134,11 @@ class ReportAdmin(admin.ModelAdmin):
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
 
-        print(f"Received start_date: {start_date}, end_date: {end_date}")  # Отладка
-
         # Генерируем отчёт по продажам
-        report = generate_sales_report(start_date, end_date)
-
-        print(f"Generated report: {report}")  # Отладка
-
-        # Проверяем наличие ключа 'sales_data'
-        if 'sales_data' not in report:
-            print("Error: 'sales_data' not in report")
-            # Здесь можно добавить обработку ошибки или избежать перенаправления
+        report = cached_report(ReportQuery.from_params(request.GET))
 
         # Генерируем график продаж
-        graph_html = self.get_sales_graph(report.get('sales_data', []))
+        graph_html = self.get_sales_graph(report.series)
 
         context = {
             **self.admin_site.each_context(request),
@@ -113,106 +154,24 @@ class ReportAdmin(admin.ModelAdmin):
         if not sales_data:
             return "<p>Нет данных для отображения графика.</p>"
 
-        # Пример генерации графика с использованием matplotlib
-        dates = [data['date_only'].strftime('%Y-%m-%d') for data in sales_data]
-        totals = [float(data['total']) for data in sales_data]  # Убедитесь, что это числа
-
-        plt.figure(figsize=(10, 5))
-        plt.plot(dates, totals, marker='o', linestyle='-', color='b')
-        plt.title('Продажи по дням')
-        plt.xlabel('Дата')
-        plt.ylabel('Общая сумма продаж')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-
-        graph = base64.b64encode(image_png).decode('utf-8')
-        plt.close()
-
-        return mark_safe(f'<img src="data:image/png;base64,{graph}"/>')
+        # PNG строится сервисом графиков один раз для одинаковых данных и отдаётся по ссылке
+        chart_url = line_chart_url(
+            [point.label for point in sales_data],
+            [point.total_sales for point in sales_data],
+            title='Продажи по дням', xlabel='Дата', ylabel='Общая сумма продаж',
+        )
+        return format_html('<img src="{}" alt="Продажи по дням"/>', chart_url)
 
     def download_sales_report_csv(self, request):
-        import codecs
-
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        report = generate_sales_report(start_date, end_date)
-
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-
-        # Добавляем BOM для корректного отображения в Excel
-        response.write(codecs.BOM_UTF8)
-
-        writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-
-        # Записываем заголовки с кодировкой
-        writer.writerow(['Дата', 'Общий объем продаж', 'Общее количество заказов', 'Общее количество клиентов'])
-
-        writer.writerow([timezone.now().strftime('%Y-%m-%d'), report['total_sales'], report['total_orders'],
-                         report['total_customers']])
-
-        # Проверяем наличие данных о продажах
-        if 'sales_data' in report and report['sales_data']:
-            writer.writerow([])
-            writer.writerow(['Дата', 'Сумма продаж'])
-            for data in report['sales_data']:
-                writer.writerow([data['date_only'].strftime('%Y-%m-%d'), data['total']])
-        else:
-            writer.writerow([])
-            writer.writerow(['Нет данных о продажах за выбранный период.'])
-
-        return response
+        # Построчная выгрузка всех позиций заказов за период, отдаётся потоком
+        return sales_lines_csv_response(ReportQuery.from_params(request.GET))
 
     def download_sales_report_pdf(self, request):
-        # Регистрация шрифта, поддерживающего кириллицу
-        font_path = os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans.ttf')
-        pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
-
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        report = generate_sales_report(start_date, end_date)
-
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="sales_report.pdf"'
-
-        p = canvas.Canvas(response, pagesize=A4)
-        p.setFont('DejaVuSans', 12)
-
-        p.drawString(100, 800, "Отчет по продажам")
-
-        # Выводим общие показатели
-        p.drawString(100, 780, f"Общий объем продаж: {report['total_sales']}")
-        p.drawString(100, 760, f"Общее количество заказов: {report['total_orders']}")
-        p.drawString(100, 740, f"Общее количество клиентов: {report['total_customers']}")
-
-        # Проверяем наличие данных о продажах
-        y = 700
-        if 'sales_data' in report and report['sales_data']:
-            p.drawString(100, y, "Продажи по дням:")
-            y -= 20
-            for data in report['sales_data']:
-                p.drawString(100, y, f"{data['date_only'].strftime('%Y-%m-%d')}: {data['total']}")
-                y -= 20
-                if y < 50:
-                    p.showPage()
-                    p.setFont('DejaVuSans', 12)
-                    y = 800
-        else:
-            p.drawString(100, y, "Нет данных о продажах за выбранный период.")
-
-        p.showPage()
-        p.save()
-
-        return response
+        # PDF строится в фоновой задаче, повторный запрос того же отчёта отдаёт готовый файл
+        return sales_report_pdf_response(ReportQuery.from_params(request.GET))
 
     def changelist_view(self, request, extra_context=None):
-        report = generate_sales_report()
+        report = cached_report(ReportQuery())
         extra_context = extra_context or {}
         extra_context['report'] = report
         return super().changelist_view(request, extra_context=extra_context)
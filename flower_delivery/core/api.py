@@ -0,0 +1,156 @@
+# core/api.py
+"""
+JSON API каталога только для чтения (версия v1): список товаров, товары категории, товар.
+
+Ответы зависят только от версии пространства имён catalog (core.catalog) и параметров запроса,
+поэтому ETag вычисляется из них без обращения к базе данных, а Last-Modified - время последнего
+изменения каталога. Запрос с совпадающим If-None-Match (или не изменившимся If-Modified-Since)
+получает 304 без SQL-запросов; тело ответа 200 тоже кэшируется под версией каталога.
+
+Параметры: fields - список полей через запятую; limit - размер страницы (до API_MAX_LIMIT);
+cursor - курсор следующей/предыдущей страницы из полей next/previous ответа.
+"""
+import hashlib
+
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .caching import get_or_compute, get_version, last_modified, versioned_key
+from .catalog import CATALOG_CACHE, CATALOG_CACHE_TIMEOUT, CATALOG_ORDERING
+from .images import derivative_url, product_derivatives
+from .models import Product
+from .pagination import KeysetPaginator
+
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 100
+# Ответ можно показывать из кэша клиента минуту, затем - перепроверка по ETag
+API_MAX_AGE = 60
+
+
+def _image_url(product):
+    sizes = product_derivatives(product)
+    if sizes:
+        return derivative_url(sizes['card']['jpeg'])
+    return product.image.url if product.image else None
+
+
+# Поле ответа: функция, вычисляющая его значение по товару
+API_FIELDS = {
+    'id': lambda product: product.id,
+    'name': lambda product: product.name,
+    'description': lambda product: product.description,
+    'price': lambda product: str(product.price),
+    'category': lambda product: product.category,
+    'category_display': lambda product: str(product.get_category_display()),
+    'stock': lambda product: product.stock,
+    'in_stock': lambda product: product.stock > 0,
+    'rating': lambda product: round(product.current_rating, 2),
+    'rating_count': lambda product: product.rating_count,
+    'is_popular': lambda product: product.is_popular,
+    'image': _image_url,
+    'url': lambda product: reverse('product_detail', args=[product.id]),
+}
+DEFAULT_FIELDS = ('id', 'name', 'price', 'category', 'in_stock', 'rating', 'image', 'url')
+
+
+class ApiError(Exception):
+    pass
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown or not fields:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(API_FIELDS)}")
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', API_DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return min(max(limit, 1), API_MAX_LIMIT)
+
+
+def _serialize(product, fields):
+    return {field: API_FIELDS[field](product) for field in fields}
+
+
+def _etag(request, *args, **kwargs):
+    # Версия каталога + путь + параметры: одинаковый ETag - одинаковое тело ответа
+    query = '&'.join(sorted(request.GET.urlencode().split('&')))
+    payload = f'{get_version(CATALOG_CACHE)}|{request.path}|{query}'
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _last_modified(request, *args, **kwargs):
+    return last_modified(CATALOG_CACHE)
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def _product_page(request, category=None):
+    fields, limit = _fields(request), _limit(request)
+    products = Product.objects.all() if category is None else Product.objects.filter(category=category)
+    page = KeysetPaginator(products, CATALOG_ORDERING, limit).get_page(request.GET.get('cursor'))
+    return {
+        'results': [_serialize(product, fields) for product in page],
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+    }
+
+
+def _cached_json(request, kind, compute):
+    key = versioned_key(CATALOG_CACHE, 'api', kind, _etag(request))
+    try:
+        data = get_or_compute(CATALOG_CACHE, key, compute, CATALOG_CACHE_TIMEOUT)
+    except ApiError as e:
+        return _error(str(e))
+    if data is None:
+        return _error('Не найдено', status=404)
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view):
+    """Общие заголовки API: только GET/HEAD, условные запросы, публичное кэширование."""
+    return require_safe(cache_control(public=True, max_age=API_MAX_AGE)(
+        condition(etag_func=_etag, last_modified_func=_last_modified)(view)
+    ))
+
+
+@api_view
+def product_list(request):
+    return _cached_json(request, 'list', lambda: _product_page(request))
+
+
+@api_view
+def category_products(request, category):
+    if category not in dict(Product.CATEGORY_CHOICES):
+        return _error('Неизвестная категория', status=404)
+    return _cached_json(request, 'category', lambda: _product_page(request, category))
+
+
+@api_view
+def product_detail(request, product_id):
+    def compute():
+        fields = _fields(request) if request.GET.get('fields') else tuple(API_FIELDS)
+        product = Product.objects.filter(pk=product_id).first()
+        return _serialize(product, fields) if product else None
+
+    return _cached_json(request, 'detail', compute)
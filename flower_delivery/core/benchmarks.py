@@ -0,0 +1,271 @@
+# core/benchmarks.py
+"""
+Сквозные замеры производительности основных страниц.
+
+Каждая точка запрашивается тестовым клиентом Django: сначала один «холодный» запрос после
+сброса версий кэшей приложения, затем несколько «тёплых». Кэш целиком не очищается: в общем
+Redis это стёрло бы сессии и чужие данные. Для тёплых запросов фиксируются число SQL-запросов
+(максимум) и время ответа (медиана и максимум) и сравниваются с бюджетами точки.
+Запросы, изменяющие данные (добавление в корзину, оформление заказа), выполняются
+в транзакции, которая откатывается, поэтому замеры повторяемы.
+
+Данные для замеров создаёт команда seed_load_data, запуск - команда run_benchmarks.
+"""
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .caching import CACHE_NAMESPACES, invalidate
+from .cart import invalidate_cart_summary
+from .models import Cart, Order, OrderItem, Product, Review
+from .pdf import build_sales_report_pdf
+from .reports import ReportQuery
+from .reviews import invalidate_product_reviews
+
+ANONYMOUS = 'anonymous'
+CUSTOMER = 'customer'
+STAFF = 'staff'
+
+# Служебные запросы транзакции, в которой выполняется замер, не относятся к работе страницы
+_TRANSACTION_SQL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url: Callable
+    user: str = ANONYMOUS
+    method: str = 'get'
+    data: Optional[Callable] = None
+    max_queries: int = 10
+    max_ms: float = 500
+    mutates: bool = False
+    statuses: tuple = (200,)
+    setup: Optional[Callable] = None
+
+
+@dataclass
+class EndpointResult:
+    name: str
+    url: str
+    status: int
+    cold_queries: int
+    cold_ms: float
+    queries: int
+    median_ms: float
+    max_ms: float
+    max_queries_budget: int
+    max_ms_budget: float
+    failures: list = field(default_factory=list)
+
+
+class BenchmarkContext:
+    """Объекты, на которых выполняются замеры: покупатель с корзиной и заказами, сотрудник, товар."""
+
+    def __init__(self):
+        self.staff = User.objects.filter(is_superuser=True).order_by('id').first()
+        # Покупатель с самой большой корзиной: страницы корзины делают запрос на каждую позицию
+        self.customer = (
+            User.objects.filter(cart__items__isnull=False, orders__isnull=False, is_staff=False)
+            .annotate(cart_lines=Count('cart__items', distinct=True)).order_by('-cart_lines', 'id').first()
+        )
+        self.product = Product.objects.filter(stock__gt=10).order_by('id').first()
+        self.order = Order.objects.filter(user=self.customer).order_by('-created_at').first() if self.customer else None
+        if not all([self.staff, self.customer, self.product, self.order]):
+            raise ValueError('Недостаточно данных для замеров, сначала выполните seed_load_data')
+
+    def counts(self):
+        return {
+            'users': User.objects.count(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+            'order_items': OrderItem.objects.count(),
+            'reviews': Review.objects.count(),
+            'carts': Cart.objects.count(),
+        }
+
+
+# Бюджеты - текущий потолок на данных seed_load_data по умолчанию; при оптимизациях их нужно снижать
+ENDPOINTS = [
+    # Каталог (product_list, маршрут catalog); тёплые запросы отдаются из кэша фрагментов
+    Endpoint('catalog', lambda ctx: reverse('catalog'), max_queries=0, max_ms=200),
+    Endpoint('catalog_category_page', lambda ctx: reverse('catalog') + '?category=roses&page=2',
+             max_queries=0, max_ms=200),
+    Endpoint('product_detail', lambda ctx: reverse('product_detail', args=[ctx.product.pk]), max_queries=3, max_ms=200),
+    # JSON API каталога: тёплые запросы отдаются из кэша
+    Endpoint('api_product_list', lambda ctx: reverse('api_product_list'), max_queries=0, max_ms=100),
+    Endpoint('api_product_detail', lambda ctx: reverse('api_product_detail', args=[ctx.product.pk]),
+             max_queries=0, max_ms=100),
+    # Корзина и заказы; сводка корзины строится одним запросом и кэшируется, оформление заказа -
+    # постоянное число запросов. Добавление в корзину и форма заказа резервируют товары
+    Endpoint('view_cart', lambda ctx: reverse('view_cart'), user=CUSTOMER, max_queries=3, max_ms=200),
+    Endpoint('add_to_cart', lambda ctx: reverse('add_to_cart', args=[ctx.product.pk]), user=CUSTOMER,
+             method='post', data=lambda ctx: {'quantity': 1}, max_queries=10, max_ms=200, mutates=True,
+             statuses=(302,)),
+    Endpoint('checkout_form', lambda ctx: reverse('checkout'), user=CUSTOMER, max_queries=10, max_ms=200),
+    Endpoint('checkout', lambda ctx: reverse('checkout'), user=CUSTOMER, method='post',
+             data=lambda ctx: {'address': 'Москва, ул. Цветочная, 1'}, max_queries=12, max_ms=1000,
+             mutates=True, statuses=(302,)),
+    Endpoint('order_history', lambda ctx: reverse('order_history'), user=CUSTOMER, max_queries=5, max_ms=300),
+    Endpoint('order_detail', lambda ctx: reverse('order_detail', args=[ctx.order.pk]), user=CUSTOMER,
+             max_queries=5, max_ms=200),
+    # Админка
+    Endpoint('admin_product_changelist', lambda ctx: reverse('admin:core_product_changelist'), user=STAFF,
+             max_queries=6, max_ms=600),
+    Endpoint('admin_order_changelist', lambda ctx: reverse('admin:core_order_changelist'), user=STAFF,
+             max_queries=7, max_ms=600),
+    Endpoint('admin_review_changelist', lambda ctx: reverse('admin:core_review_changelist'), user=STAFF,
+             max_queries=6, max_ms=600),
+    Endpoint('admin_report_changelist', lambda ctx: reverse('admin:core_report_changelist'), user=STAFF,
+             max_queries=5, max_ms=300),
+    # Отчёты (тёплые запросы читаются из кэша отчётов)
+    Endpoint('admin_sales_report', lambda ctx: reverse('admin:sales_report'), user=STAFF, max_queries=2, max_ms=300),
+    Endpoint('sales_report', lambda ctx: '/reports/sales/', user=STAFF, max_queries=2, max_ms=300),
+    Endpoint('popular_products_report', lambda ctx: reverse('popular_products_report'), user=STAFF,
+             max_queries=2, max_ms=300),
+    Endpoint('reports_list', lambda ctx: reverse('reports_list'), user=STAFF, max_queries=2, max_ms=300),
+    Endpoint('sales_report_csv', lambda ctx: '/reports/sales/download/csv/', user=STAFF, max_queries=3, max_ms=2000),
+    # Выдача готового PDF; сама генерация выполняется фоновой задачей и здесь не замеряется
+    Endpoint('sales_report_pdf', lambda ctx: '/reports/sales/download/pdf/', user=STAFF, max_queries=3, max_ms=300,
+             setup=lambda ctx: build_sales_report_pdf(ReportQuery.last_days(30))),
+]
+
+
+def _page_queries(captured):
+    return [query for query in captured if not query['sql'].startswith(_TRANSACTION_SQL)]
+
+
+def _request(client, endpoint, ctx):
+    url = endpoint.url(ctx)
+    data = endpoint.data(ctx) if endpoint.data else None
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        with transaction.atomic():
+            response = getattr(client, endpoint.method)(url, data) if data else getattr(client, endpoint.method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            if endpoint.mutates:
+                transaction.set_rollback(True)
+        elapsed = (time.perf_counter() - started) * 1000
+    return url, response.status_code, len(_page_queries(captured.captured_queries)), elapsed
+
+
+def _reset_caches(ctx):
+    # Новые версии пространств имён делают недействительными только данные приложения
+    for namespace in CACHE_NAMESPACES:
+        invalidate(namespace)
+    if ctx.product:
+        invalidate_product_reviews(ctx.product.pk)
+    for user in (ctx.customer, ctx.staff):
+        if user:
+            invalidate_cart_summary(user)
+
+
+def measure(endpoint, ctx, clients, iterations=5):
+    client = clients[endpoint.user]
+    if endpoint.setup:
+        endpoint.setup(ctx)
+    _reset_caches(ctx)
+    url, status, cold_queries, cold_ms = _request(client, endpoint, ctx)
+    runs = [_request(client, endpoint, ctx) for _ in range(max(iterations, 1))]
+    timings = [elapsed for _, _, _, elapsed in runs]
+
+    result = EndpointResult(
+        name=endpoint.name,
+        url=url,
+        status=status,
+        cold_queries=cold_queries,
+        cold_ms=round(cold_ms, 2),
+        queries=max(queries for _, _, queries, _ in runs),
+        median_ms=round(statistics.median(timings), 2),
+        max_ms=round(max(timings), 2),
+        max_queries_budget=endpoint.max_queries,
+        max_ms_budget=endpoint.max_ms,
+    )
+    if status not in endpoint.statuses:
+        result.failures.append(f'статус {status}, ожидался {endpoint.statuses}')
+    if result.queries > endpoint.max_queries:
+        result.failures.append(f'SQL-запросов {result.queries} > {endpoint.max_queries}')
+    if result.median_ms > endpoint.max_ms:
+        result.failures.append(f'время {result.median_ms} мс > {endpoint.max_ms} мс')
+    return result
+
+
+def _clients(ctx):
+    clients = {ANONYMOUS: Client(), CUSTOMER: Client(), STAFF: Client()}
+    clients[CUSTOMER].force_login(ctx.customer)
+    clients[STAFF].force_login(ctx.staff)
+    return clients
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, iterations=5):
+    """Выполняет замеры для выбранных точек (по умолчанию - всех) и возвращает словарь для JSON."""
+    endpoints = [endpoint for endpoint in ENDPOINTS if not names or endpoint.name in names]
+    ctx = BenchmarkContext()
+    # Без уведомлений в Telegram и ограничения рабочих часов, PDF - во временный каталог
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        ADMIN_TELEGRAM_CHAT_ID='', WORKING_HOURS_START=0, WORKING_HOURS_END=24,
+        ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=media_root,
+    ):
+        clients = _clients(ctx)
+        results = [measure(endpoint, ctx, clients, iterations) for endpoint in endpoints]
+
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'commit': _git_commit(),
+            'iterations': iterations,
+            'data': ctx.counts(),
+        },
+        'results': {result.name: asdict(result) for result in results},
+    }
+
+
+def compare(current, baseline, tolerance=0.25):
+    """
+    Сравнивает результаты с сохранёнными ранее. Возвращает строки отчёта и список регрессий:
+    рост числа SQL-запросов или медианного времени больше чем на tolerance.
+    """
+    lines, regressions = [], []
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            lines.append(f'{name}: новая точка')
+            continue
+        line = (f"{name}: запросы {previous['queries']} -> {result['queries']}, "
+                f"медиана {previous['median_ms']} -> {result['median_ms']} мс")
+        lines.append(line)
+        if result['queries'] > previous['queries'] or result['median_ms'] > previous['median_ms'] * (1 + tolerance):
+            regressions.append(line)
+    return lines, regressions
+
+
+def save(data, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(data, output, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
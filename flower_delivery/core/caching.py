@@ -0,0 +1,166 @@
+# core/caching.py
+"""
+Версионируемый кэш с защитой от «лавины» запросов и счётчиками попаданий.
+
+Данные кэшируются под ключами, в которые входит версия пространства имён (например, reports).
+При изменении исходных данных версия увеличивается (bump_version), и старые ключи просто
+перестают использоваться - удалять их не нужно, они вытесняются по таймауту.
+
+Если значения нет в кэше, вычисляет его только один процесс (блокировка через cache.add),
+остальные ждут результат. Счётчики hits/misses/waits по пространствам имён доступны
+через cache_stats() и представление core.views.cache_metrics.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Пространства имён, для которых собирается статистика
+CACHE_NAMESPACES = []
+
+DEFAULT_TIMEOUT = 15 * 60
+LOCK_TIMEOUT = 60
+WAIT_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+STAT_EVENTS = ('hits', 'misses', 'waits')
+
+_MISSING = object()
+
+
+def register_namespace(namespace):
+    if namespace not in CACHE_NAMESPACES:
+        CACHE_NAMESPACES.append(namespace)
+    return namespace
+
+
+def _version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def _initial_version():
+    # Начальное значение зависит от времени, чтобы после вытеснения ключа версии
+    # не вернуться к номеру, под которым в кэше лежат устаревшие данные
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), _initial_version(), None)
+        version = cache.get(_version_key(namespace), _initial_version())
+    return version
+
+
+def _modified_key(namespace):
+    return f'cache_modified:{namespace}'
+
+
+def bump_version(namespace):
+    """Делает недействительными все данные пространства имён."""
+    cache.set(_modified_key(namespace), time.time(), None)
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        version = _initial_version()
+        cache.set(_version_key(namespace), version, None)
+        return version
+
+
+def last_modified(namespace):
+    """Время последнего изменения данных пространства имён (для заголовка Last-Modified)."""
+    timestamp = cache.get(_modified_key(namespace))
+    if timestamp is None:
+        # Отметка вытеснена из кэша - считаем, что данные изменились только что
+        cache.add(_modified_key(namespace), time.time(), None)
+        timestamp = cache.get(_modified_key(namespace), time.time())
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def invalidate(namespace):
+    """
+    Увеличивает версию сразу и ещё раз после фиксации транзакции: иначе параллельный запрос
+    может успеть закэшировать под новой версией данные, прочитанные до коммита.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def _stat_key(namespace, event):
+    return f'cache_stats:{namespace}:{event}'
+
+
+def _count(namespace, event):
+    key = _stat_key(namespace, event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cache_stats():
+    """Счётчики по всем зарегистрированным пространствам имён: {namespace: {event: count}}."""
+    keys = [_stat_key(namespace, event) for namespace in CACHE_NAMESPACES for event in STAT_EVENTS]
+    values = cache.get_many(keys)
+    return {
+        namespace: {event: values.get(_stat_key(namespace, event), 0) for event in STAT_EVENTS}
+        for namespace in CACHE_NAMESPACES
+    }
+
+
+def versioned_key(namespace, *parts):
+    """Ключ с текущей версией пространства имён."""
+    return ':'.join([namespace, f'v{get_version(namespace)}', *(str(part) for part in parts)])
+
+
+def get_or_compute(namespace, key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Возвращает значение из кэша или вычисляет его.
+    Одновременные промахи по одному ключу вычисляются один раз: остальные запросы
+    ждут результат до WAIT_TIMEOUT секунд, после чего считают сами.
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(namespace, 'hits')
+        return value
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, True, LOCK_TIMEOUT):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                _count(namespace, 'waits')
+                return value
+            if cache.add(lock_key, True, LOCK_TIMEOUT):
+                break
+        else:
+            logger.warning(f"Не дождались вычисления значения кэша {key}")
+            _count(namespace, 'misses')
+            return compute()
+
+    _count(namespace, 'misses')
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def metrics_text():
+    """Счётчики в текстовом формате Prometheus."""
+    lines = [
+        '# HELP flower_cache_events_total Обращения к кэшу по пространствам имён.',
+        '# TYPE flower_cache_events_total counter',
+    ]
+    for namespace, events in cache_stats().items():
+        for event, count in events.items():
+            lines.append(f'flower_cache_events_total{{namespace="{namespace}",event="{event}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,373 @@
+# core/cart.py
+"""
+Корзина покупателя.
+
+Корзина вошедшего пользователя хранится в Cart/CartItem. Корзина анонимного посетителя -
+только в подписанной cookie ({id товара: количество}): открытие /cart/ и добавление товаров
+не создают ни строк Cart, ни сессии в базе данных. При входе (сигнал user_logged_in, core.signals)
+анонимная корзина переносится в корзину пользователя, а cookie удаляется - оформление заказа
+доступно только после входа, поэтому до этого момента писать корзину в базу не нужно.
+
+Изменения анонимной корзины записываются в ответ AnonymousCartMiddleware. В той же cookie
+хранится случайный токен - владелец резервов товаров анонимной корзины (core.reservations).
+
+Сводка корзины (позиции с товарами, сумма, количество для значка в шапке) строится одним
+запросом с select_related и кэшируется: для пользователя - под версией cart:user:<id>, которую
+увеличивает каждое изменение корзины (invalidate_cart_summary), для анонимной корзины - по хэшу
+её содержимого. В ключ входит и версия каталога, чтобы сводка не показывала старые цены.
+"""
+import hashlib
+import json
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib import messages
+from django.core import signing
+from django.db import transaction
+
+from .caching import get_or_compute, get_version, invalidate, register_namespace, versioned_key
+from .catalog import CATALOG_CACHE
+from .models import Cart, CartItem, Product
+from . import reservations
+
+ANONYMOUS_CART_COOKIE = 'cart'
+ANONYMOUS_CART_SALT = 'core.cart'
+ANONYMOUS_CART_MAX_AGE = settings.SESSION_COOKIE_AGE
+# Cookie ограничена ~4 КБ: столько позиций помещается с запасом
+ANONYMOUS_CART_MAX_LINES = 50
+# Не больше стольких операций в одном запросе пакетного изменения корзины
+MAX_BATCH_OPERATIONS = 100
+CART_CACHE = register_namespace('cart')
+CART_SUMMARY_TIMEOUT = 30 * 60
+
+
+class CartError(ValueError):
+    pass
+
+
+def _load_anonymous_cart(request):
+    lines, token = {}, None
+    try:
+        value = request.get_signed_cookie(ANONYMOUS_CART_COOKIE, salt=ANONYMOUS_CART_SALT,
+                                          max_age=ANONYMOUS_CART_MAX_AGE)
+        data = json.loads(value)
+        lines = {int(product_id): int(quantity) for product_id, quantity in data['l'].items()}
+        lines = {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+        token = str(data['o'])
+    except (KeyError, signing.BadSignature, ValueError, TypeError, AttributeError):
+        lines, token = {}, None
+    request._anonymous_cart = lines
+    request._anonymous_cart_token = token
+
+
+def anonymous_lines(request):
+    """Позиции анонимной корзины: {id товара: количество}. Повреждённая cookie - пустая корзина."""
+    if not hasattr(request, '_anonymous_cart'):
+        _load_anonymous_cart(request)
+    return request._anonymous_cart
+
+
+def save_anonymous_lines(request, lines):
+    """Запоминает новое содержимое анонимной корзины; в cookie его запишет AnonymousCartMiddleware."""
+    anonymous_lines(request)
+    request._anonymous_cart = lines
+    request._anonymous_cart_changed = True
+
+
+def cart_owner(request):
+    """Владелец резервов корзины: пользователь или токен анонимной корзины (создаётся при первом резерве)."""
+    if request.user.is_authenticated:
+        return reservations.user_owner(request.user)
+    anonymous_lines(request)
+    if not request._anonymous_cart_token:
+        request._anonymous_cart_token = secrets.token_urlsafe(16)
+        request._anonymous_cart_changed = True
+    return reservations.anonymous_owner(request._anonymous_cart_token)
+
+
+class AnonymousCartMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, '_anonymous_cart_changed', False):
+            lines = request._anonymous_cart
+            if lines:
+                data = {'o': request._anonymous_cart_token or secrets.token_urlsafe(16), 'l': lines}
+                response.set_signed_cookie(
+                    ANONYMOUS_CART_COOKIE, json.dumps(data, separators=(',', ':')), salt=ANONYMOUS_CART_SALT,
+                    max_age=ANONYMOUS_CART_MAX_AGE, httponly=True, samesite='Lax',
+                    secure=settings.SESSION_COOKIE_SECURE,
+                )
+            else:
+                response.delete_cookie(ANONYMOUS_CART_COOKIE, samesite='Lax')
+        return response
+
+
+def get_user_cart(user):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    return cart
+
+
+def add_product(request, product, quantity):
+    """
+    Добавляет товар в корзину (пользователя или анонимную) и резервирует новое количество.
+    Возвращает новое количество в корзине; при нехватке - InsufficientStock.
+    """
+    owner = cart_owner(request)
+    if not request.user.is_authenticated:
+        lines = dict(anonymous_lines(request))
+        if product.pk not in lines and len(lines) >= ANONYMOUS_CART_MAX_LINES:
+            raise CartError('В корзине слишком много позиций. Войдите, чтобы добавить ещё.')
+        lines[product.pk] = lines.get(product.pk, 0) + quantity
+        reservations.hold(owner, {product.pk: lines[product.pk]})
+        save_anonymous_lines(request, lines)
+        return lines[product.pk]
+
+    cart = get_user_cart(request.user)
+    new_quantity = (cart.items.filter(product=product).values_list('quantity', flat=True).first() or 0) + quantity
+    reservations.hold(owner, {product.pk: new_quantity})
+    CartItem.objects.update_or_create(cart=cart, product=product, defaults={'quantity': new_quantity})
+    invalidate_cart_summary(request.user)
+    return new_quantity
+
+
+def add_order_lines(user, order):
+    """
+    Добавляет позиции заказа в корзину пользователя (повтор заказа): строки заказа читаются одним
+    запросом, остатки всех товаров проверяются и резервируются одним вызовом reservations.hold,
+    позиции записываются одним bulk_create с обновлением количества при конфликте (cart, product).
+    При нехватке корзина не меняется (InsufficientStock). Возвращает число позиций.
+    """
+    added = {}
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        added[product_id] = added.get(product_id, 0) + quantity
+    if not added:
+        return 0
+    with transaction.atomic():
+        cart = get_user_cart(user)
+        current = dict(cart.items.filter(product_id__in=added.keys()).values_list('product_id', 'quantity'))
+        quantities = {product_id: current.get(product_id, 0) + quantity for product_id, quantity in added.items()}
+        reservations.hold(reservations.user_owner(user), quantities)
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items()],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+        invalidate_cart_summary(user)
+    return len(quantities)
+
+
+def hold_cart(user):
+    """Резервирует (продлевает резервы) все позиции корзины пользователя - при начале оформления заказа."""
+    quantities = {}
+    for product_id, quantity in get_user_cart(user).items.values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    reservations.hold(reservations.user_owner(user), quantities)
+
+
+def _user_namespace(user_id):
+    return f'{CART_CACHE}:user:{user_id}'
+
+
+def invalidate_cart_summary(user):
+    """Вызывается при каждом изменении корзины пользователя (в том числе через bulk-операции)."""
+    invalidate(_user_namespace(user.pk))
+
+
+def _summary(items):
+    lines = [
+        {'id': item.id, 'product': item.product, 'quantity': item.quantity,
+         'total': item.product.price * item.quantity}
+        for item in items
+    ]
+    return {
+        'lines': lines,
+        'total': sum((line['total'] for line in lines), Decimal('0')),
+        'count': sum(line['quantity'] for line in lines),
+    }
+
+
+def summary_json(summary):
+    """Сводка корзины для JSON-ответов."""
+    return {
+        'lines': [
+            {'id': line['id'], 'product_id': line['product'].id, 'name': line['product'].name,
+             'price': str(line['product'].price), 'quantity': line['quantity'], 'total': str(line['total'])}
+            for line in summary['lines']
+        ],
+        'total': str(summary['total']),
+        'count': summary['count'],
+    }
+
+
+def cart_summary(request):
+    """
+    Сводка корзины: {'lines': [{'id', 'product', 'quantity', 'total'}], 'total', 'count'}.
+    У позиций анонимной корзины id = None. Строится одним запросом и берётся из кэша.
+    """
+    if request.user.is_authenticated:
+        user = request.user
+        key = versioned_key(_user_namespace(user.pk), 'summary', get_version(CATALOG_CACHE))
+
+        def compute():
+            # Без get_or_create: просмотр корзины не создаёт строку Cart
+            return _summary(CartItem.objects.filter(cart__user=user).select_related('product').order_by('id'))
+    else:
+        lines = anonymous_lines(request)
+        if not lines:
+            return _summary([])
+        digest = hashlib.sha1(json.dumps(sorted(lines.items())).encode()).hexdigest()
+        key = versioned_key(CATALOG_CACHE, 'anonymous_cart', digest)
+
+        def compute():
+            products = Product.objects.in_bulk(lines.keys())
+            return _summary([
+                CartItem(product=products[product_id], quantity=quantity)
+                for product_id, quantity in lines.items() if product_id in products
+            ])
+
+    return get_or_compute(CART_CACHE, key, compute, CART_SUMMARY_TIMEOUT)
+
+
+def parse_operations(operations):
+    """
+    Проверяет операции [{'item_id' или 'product_id', 'quantity'}] (quantity 0 - удалить позицию).
+    Возвращает список пар (('item', id) или ('product', id), количество).
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartError('Ожидается непустой список операций')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise CartError(f'Не больше {MAX_BATCH_OPERATIONS} операций за запрос')
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise CartError('Операция должна быть объектом')
+        try:
+            quantity = int(operation['quantity'])
+            target = ('item', int(operation['item_id'])) if 'item_id' in operation \
+                else ('product', int(operation['product_id']))
+        except (KeyError, TypeError, ValueError):
+            raise CartError('В операции нужны item_id или product_id и целое quantity')
+        if quantity < 0:
+            raise CartError('Количество не может быть отрицательным')
+        parsed.append((target, quantity))
+    return parsed
+
+
+def _final_quantities(parsed, item_products):
+    # Операции применяются по порядку: для товара действует последняя
+    quantities = {}
+    for (kind, target_id), quantity in parsed:
+        if kind == 'item':
+            if target_id not in item_products:
+                raise CartError(f'Позиция {target_id} не найдена в корзине')
+            target_id = item_products[target_id]
+        quantities[target_id] = quantity
+    return quantities
+
+
+def apply_operations(request, operations):
+    """
+    Пакетно меняет корзину: остатки всех товаров проверяются и резервируются одним запросом
+    (core.reservations.hold), позиции пишутся bulk_update/bulk_create/delete в одной транзакции.
+    Возвращает новую сводку корзины; при ошибке корзина не меняется (CartError, InsufficientStock).
+    """
+    parsed = parse_operations(operations)
+    owner = cart_owner(request)
+    if not request.user.is_authenticated:
+        if any(kind == 'item' for (kind, _), _ in parsed):
+            raise CartError('В корзине без входа позиции задаются product_id')
+        quantities = _final_quantities(parsed, {})
+        lines = dict(anonymous_lines(request))
+        for product_id, quantity in quantities.items():
+            if quantity:
+                lines[product_id] = quantity
+            else:
+                lines.pop(product_id, None)
+        if len(lines) > ANONYMOUS_CART_MAX_LINES:
+            raise CartError('В корзине слишком много позиций. Войдите, чтобы добавить ещё.')
+        with transaction.atomic():
+            missing = set(quantities) - reservations.hold(owner, quantities)
+            if missing:
+                raise CartError(f"Товары не найдены: {', '.join(map(str, sorted(missing)))}")
+        save_anonymous_lines(request, lines)
+        return cart_summary(request)
+
+    with transaction.atomic():
+        cart = get_user_cart(request.user)
+        items = {item.product_id: item for item in cart.items.all()}
+        quantities = _final_quantities(parsed, {item.id: product_id for product_id, item in items.items()})
+        missing = set(quantities) - reservations.hold(owner, quantities)
+        if missing:
+            raise CartError(f"Товары не найдены: {', '.join(map(str, sorted(missing)))}")
+
+        to_update, to_create, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.id)
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                to_update.append(item)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_delete:
+            CartItem.objects.filter(id__in=to_delete).delete()
+        invalidate_cart_summary(request.user)
+    return cart_summary(request)
+
+
+def cart_context(request):
+    """Контекстный процессор: количество товаров для значка корзины, вычисляется только при выводе."""
+    return {'cart_count': lambda: cart_summary(request)['count']}
+
+
+def merge_anonymous_cart(request, user):
+    """
+    Переносит анонимную корзину в корзину пользователя: количества одинаковых товаров
+    складываются, запись - один bulk_create с обновлением при конфликте. Позиции, которых
+    не хватает, уменьшаются до доступного остатка (или удаляются), о чём пользователь получает
+    сообщение. Возвращает число позиций.
+    """
+    lines = anonymous_lines(request)
+    if not lines:
+        return 0
+    product_ids = set(Product.objects.filter(pk__in=lines.keys()).values_list('id', flat=True))
+    cart = get_user_cart(user)
+    current = dict(cart.items.filter(product_id__in=product_ids).values_list('product_id', 'quantity'))
+    quantities = {product_id: current.get(product_id, 0) + lines[product_id] for product_id in product_ids}
+
+    # Резервы переходят к пользователю
+    if request._anonymous_cart_token:
+        reservations.release(reservations.anonymous_owner(request._anonymous_cart_token))
+    owner = reservations.user_owner(user)
+    try:
+        reservations.hold(owner, quantities)
+    except reservations.InsufficientStock as e:
+        for shortage in e.shortages:
+            quantities[shortage.product_id] = shortage.available
+        try:
+            reservations.hold(owner, quantities)
+        except reservations.InsufficientStock:
+            # Остаток успели зарезервировать другие - проверка повторится при оформлении
+            pass
+        messages.warning(request, f'Количество некоторых товаров уменьшено до доступного: {e}', fail_silently=True)
+
+    CartItem.objects.bulk_create(
+        [CartItem(cart=cart, product_id=product_id, quantity=quantity)
+         for product_id, quantity in quantities.items() if quantity > 0],
+        update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+    )
+    emptied = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+    if emptied:
+        cart.items.filter(product_id__in=emptied).delete()
+    invalidate_cart_summary(user)
+    save_anonymous_lines(request, {})
+    return len(quantities) - len(emptied)
@@ -0,0 +1,105 @@
+# core/catalog.py
+"""
+Каталог товаров.
+
+Список товаров (фильтры + страница) рендерится во фрагмент, который кэшируется под версией
+пространства имён catalog. Версия увеличивается при изменении товаров (в том числе остатков)
+и отзывов (core.signals), поэтому повторные показы каталога не обращаются к базе данных.
+
+При CATALOG_KEYSET_PAGINATION (или если в запросе передан cursor) страницы выбираются
+по ключу (name, id) / (category, name, id) без OFFSET и COUNT(*), см. core.pagination.
+Фильтры приводятся к каноническому виду (core.facets), поэтому эквивалентные наборы
+параметров используют одну запись кэша.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+
+from .caching import get_or_compute, register_namespace, versioned_key
+from .facets import CatalogFilters, compute_facets
+from .models import Product
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
+
+CATALOG_CACHE = register_namespace('catalog')
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_PAGE_SIZE = 6
+# Порядок каталога; вместе с фильтром по категории покрыт индексами модели Product
+CATALOG_ORDERING = ('name', 'id')
+
+
+def _page_number(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _render_catalog_page(filters, page_number, user, cursor=None):
+    products = Product.objects.filter(filters.q()).select_related('created_by')
+    if cursor is not None:
+        page_obj = KeysetPaginator(products, CATALOG_ORDERING, CATALOG_PAGE_SIZE).get_page(cursor)
+    else:
+        page_obj = Paginator(products.order_by(*CATALOG_ORDERING), CATALOG_PAGE_SIZE).get_page(page_number)
+
+    return render_to_string('catalog_products.html', {
+        'page_obj': page_obj,
+        'products': page_obj.object_list,
+        'is_paginated': True,
+        # Ссылки пагинации строятся от канонических параметров фильтра
+        'base_query': filters.query(),
+        'facets': catalog_facets(filters),
+        # Фрагмент общий для всех пользователей: шаблон использует только user.is_authenticated
+        'user': user,
+    })
+
+
+def catalog_facets(filters):
+    """Фасеты со счётчиками для набора фильтров; кэшируются под версией каталога."""
+    key = versioned_key(CATALOG_CACHE, 'facets', filters.key)
+    return get_or_compute(CATALOG_CACHE, key, lambda: compute_facets(filters), CATALOG_CACHE_TIMEOUT)
+
+
+def _page_position(request):
+    """
+    Курсор (keyset) или номер страницы (OFFSET) из запроса: (cursor, page_number).
+    Курсор приводится к каноническому виду; повреждённый курсор означает первую страницу ('').
+    """
+    cursor = request.GET.get('cursor')
+    if cursor is None and settings.CATALOG_KEYSET_PAGINATION and 'page' not in request.GET:
+        cursor = ''
+    if cursor is not None:
+        decoded = decode_cursor(cursor, len(CATALOG_ORDERING))
+        return (encode_cursor(*decoded) if decoded else ''), None
+    return None, _page_number(request.GET.get('page'))
+
+
+def canonical_query(request, filters):
+    """Канонические параметры страницы каталога (для rel=canonical)."""
+    query = filters.query()
+    cursor, page_number = _page_position(request)
+    if cursor:
+        query['cursor'] = cursor
+    elif page_number and page_number > 1:
+        query['page'] = page_number
+    return query.urlencode()
+
+
+def catalog_page_html(request, filters=None):
+    """HTML списка товаров для страницы каталога (из кэша или отрендеренный заново)."""
+    if filters is None:
+        filters = CatalogFilters.from_query(request.GET)
+    authenticated = int(request.user.is_authenticated)
+    cursor, page_number = _page_position(request)
+    if cursor is not None:
+        # Ключ строится по разобранной позиции: произвольные строки из запроса не создают
+        # новых записей кэша, а длинное название в позиции сворачивается в хэш
+        digest = hashlib.sha1(cursor.encode()).hexdigest() if cursor else 'first'
+        key = versioned_key(CATALOG_CACHE, 'cursor', filters.key, digest, authenticated)
+    else:
+        key = versioned_key(CATALOG_CACHE, 'page', filters.key, page_number, authenticated)
+    return get_or_compute(
+        CATALOG_CACHE, key, lambda: _render_catalog_page(filters, page_number, request.user, cursor),
+        CATALOG_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,108 @@
+# core/charts.py
+"""
+Сервис построения графиков для отчётов.
+
+Графики рисуются через объектный API matplotlib (Figure + FigureCanvasAgg), без глобального
+состояния pyplot, поэтому безопасны в многопоточном сервере. Результат кэшируется по хэшу
+входных данных: страница отчёта получает только ссылку на PNG, а сам PNG строится один раз.
+Интерактивные графики Plotly отдаются без встроенного plotly.js - библиотека подключается
+отдельным версионированным файлом (см. plotly_js_url).
+"""
+import hashlib
+import json
+from io import BytesIO
+
+import plotly.graph_objects as go
+from django.core.cache import cache
+from django.urls import reverse
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+CHART_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _chart_key(kind, spec):
+    payload = json.dumps([kind, spec], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _line_spec(labels, values, title, xlabel, ylabel):
+    return {
+        'labels': [str(label) for label in labels],
+        'values': [float(value) for value in values],
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+    }
+
+
+def render_line_chart_png(spec):
+    figure = Figure(figsize=(10, 5))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(spec['labels'], spec['values'], marker='o', linestyle='-', color='b')
+    axes.set_title(spec['title'])
+    axes.set_xlabel(spec['xlabel'])
+    axes.set_ylabel(spec['ylabel'])
+    axes.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+    buffer = BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def line_chart(labels, values, title, xlabel, ylabel):
+    """Регистрирует линейный график и возвращает его ключ; PNG строится при первом обращении."""
+    spec = _line_spec(labels, values, title, xlabel, ylabel)
+    key = _chart_key('line', spec)
+    cache.add(f'chart:spec:{key}', spec, CHART_CACHE_TIMEOUT)
+    return key
+
+
+def chart_png(key):
+    """PNG графика по ключу (из кэша или построенный заново); None, если график неизвестен."""
+    png = cache.get(f'chart:png:{key}')
+    if png is None:
+        spec = cache.get(f'chart:spec:{key}')
+        if spec is None:
+            return None
+        png = render_line_chart_png(spec)
+        cache.set(f'chart:png:{key}', png, CHART_CACHE_TIMEOUT)
+    return png
+
+
+def line_chart_png(labels, values, title, xlabel, ylabel):
+    return chart_png(line_chart(labels, values, title, xlabel, ylabel))
+
+
+def line_chart_url(labels, values, title, xlabel, ylabel):
+    return reverse('chart_png', args=[line_chart(labels, values, title, xlabel, ylabel)])
+
+
+def plotly_line_html(labels, values, title, xlabel, ylabel):
+    """HTML-фрагмент графика Plotly без встроенного plotly.js (подключается через plotly_js_url)."""
+    spec = _line_spec(labels, values, title, xlabel, ylabel)
+    cache_key = f"chart:plotly:{_chart_key('plotly-line', spec)}"
+    html = cache.get(cache_key)
+    if html is None:
+        fig = go.Figure(go.Scatter(x=spec['labels'], y=spec['values'], mode='lines+markers'))
+        fig.update_layout(title=spec['title'], xaxis_title=spec['xlabel'], yaxis_title=spec['ylabel'])
+        html = fig.to_html(full_html=False, include_plotlyjs=False)
+        cache.set(cache_key, html, CHART_CACHE_TIMEOUT)
+    return html
+
+
+PLOTLY_JS_VERSION = get_plotlyjs_version()
+_plotly_js = None
+
+
+def plotly_js_source():
+    global _plotly_js
+    if _plotly_js is None:
+        _plotly_js = get_plotlyjs().encode('utf-8')
+    return _plotly_js
+
+
+def plotly_js_url():
+    return reverse('plotly_js', args=[PLOTLY_JS_VERSION])
@@ -0,0 +1,98 @@
+# core/checkout.py
+"""
+Оформление заказа из корзины пользователя.
+
+Всё выполняется в одной транзакции за постоянное число запросов, независимо от размера корзины:
+позиции корзины с товарами, одно условное списание остатков по всем товарам
+(UPDATE ... SET stock = stock - q WHERE stock >= q + чужие резервы, см. core.reservations),
+создание заказа, bulk_create позиций заказа, очистка корзины и снятие резервов покупателя.
+Если какого-то товара не хватает, списание откатывается, а исключение InsufficientStock
+содержит нехватку по каждой позиции.
+
+Остатки меняются через update(), без сигналов Product, поэтому кэш каталога сбрасывается явно;
+позиции заказа создаются bulk_create - кэш отчётов тоже.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .caching import invalidate
+from .cart import invalidate_cart_summary
+from .catalog import CATALOG_CACHE
+from .models import Order, OrderItem, Product
+from .reports import REPORTS_CACHE
+from .reservations import InsufficientStock, Shortage, held_subquery, release, user_owner
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+def _requested(quantities):
+    # Количество для каждого товара внутри одного UPDATE
+    return Case(
+        *(When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()),
+        output_field=IntegerField(),
+    )
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def reserve_stock(quantities, owner=None):
+    """
+    Списывает остатки {id товара: количество} одним UPDATE с учётом действующих резервов других
+    владельцев. Если хотя бы одного товара не хватает, ничего не списывается и выбрасывается
+    InsufficientStock.
+    """
+    requested = _requested(quantities)
+    held = held_subquery(owner)
+    try:
+        # Точка сохранения: при нехватке откатываются и уже списанные строки
+        with transaction.atomic():
+            updated = Product.objects.filter(pk__in=quantities.keys(), stock__gte=requested + held).update(
+                stock=F('stock') - requested,
+            )
+            if updated != len(quantities):
+                raise _Shortfall
+    except _Shortfall:
+        shortages = [
+            Shortage(product_id, name, quantities[product_id], max(stock - held_quantity, 0))
+            for product_id, name, stock, held_quantity in Product.objects.filter(pk__in=quantities.keys())
+            .annotate(held=held).exclude(stock__gte=requested + F('held')).order_by('name')
+            .values_list('id', 'name', 'stock', 'held')
+        ]
+        raise InsufficientStock(shortages)
+
+
+def place_order(user, cart, address, comments=''):
+    """
+    Создаёт заказ из корзины, списывает остатки и очищает корзину; резервы покупателя
+    превращаются в списание и снимаются. Возвращает заказ.
+    """
+    owner = user_owner(user)
+    with transaction.atomic():
+        items = list(cart.items.select_related('product'))
+        if not items:
+            raise EmptyCart('Корзина пуста')
+        quantities = {}
+        for item in items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        reserve_stock(quantities, owner)
+
+        order = Order.objects.create(user=user, address=address, comments=comments)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, unit_price=item.product.price,
+                      line_total=item.product.price * item.quantity)
+            for item in items
+        ])
+        cart.items.all().delete()
+        invalidate_cart_summary(user)
+        release(owner)
+        invalidate(CATALOG_CACHE)
+        invalidate(REPORTS_CACHE)
+    return order
@@ -0,0 +1,166 @@
+# core/facets.py
+"""
+Фасетный фильтр каталога: категория, цена, наличие, рейтинг.
+
+Параметры запроса приводятся к каноническому виду (CatalogFilters): неизвестные значения
+отбрасываются, значения упорядочиваются, порядок параметров фиксирован. Поэтому
+?price=0-500&category=tulips&category=roses и ?category=roses&category=tulips&price=0-500
+дают один и тот же ключ кэша и одну каноническую ссылку.
+
+Внутри фасета значения объединяются через ИЛИ, фасеты между собой - через И.
+Число товаров у варианта фасета считается с учётом остальных фасетов, но без своего
+(иначе выбранная категория обнуляла бы счётчики соседних). Все счётчики набора фильтров -
+один запрос с условными Count; кэширует их core.catalog под версией каталога.
+"""
+import hashlib
+from dataclasses import dataclass, replace
+from decimal import Decimal
+
+from django.db.models import Count, Q
+from django.http import QueryDict
+
+from .models import Product
+
+FACET_CATEGORY = 'category'
+FACET_PRICE = 'price'
+FACET_RATING = 'rating'
+FACET_IN_STOCK = 'in_stock'
+
+# Диапазоны цен: значение параметра, подпись, от (включительно), до (не включительно)
+PRICE_BUCKETS = [
+    ('0-500', 'до 500 ₽', None, 500),
+    ('500-1500', '500 - 1 500 ₽', 500, 1500),
+    ('1500-3000', '1 500 - 3 000 ₽', 1500, 3000),
+    ('3000-', 'от 3 000 ₽', 3000, None),
+]
+# Рейтинг «не ниже»: значение параметра и подпись
+RATING_BANDS = [('4', 'от 4'), ('3', 'от 3'), ('2', 'от 2')]
+
+
+def _price_q(value):
+    for bucket, _, low, high in PRICE_BUCKETS:
+        if bucket == value:
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=Decimal(low))
+            if high is not None:
+                condition &= Q(price__lt=Decimal(high))
+            return condition
+    raise KeyError(value)
+
+
+@dataclass(frozen=True)
+class CatalogFilters:
+    categories: tuple = ()
+    prices: tuple = ()
+    rating: str = ''
+    in_stock: bool = False
+
+    @classmethod
+    def from_query(cls, query):
+        """Канонический набор фильтров из GET-параметров; неизвестные значения отбрасываются."""
+        categories = set(query.getlist(FACET_CATEGORY))
+        prices = set(query.getlist(FACET_PRICE))
+        rating = query.get(FACET_RATING, '')
+        return cls(
+            categories=tuple(value for value, _ in Product.CATEGORY_CHOICES if value in categories),
+            prices=tuple(bucket for bucket, *_ in PRICE_BUCKETS if bucket in prices),
+            rating=rating if rating in dict(RATING_BANDS) else '',
+            in_stock=query.get(FACET_IN_STOCK) == '1',
+        )
+
+    def q(self, exclude=None):
+        """Условие для Product; exclude - фасет, который не учитывается (для его счётчиков)."""
+        condition = Q()
+        if self.categories and exclude != FACET_CATEGORY:
+            condition &= Q(category__in=self.categories)
+        if self.prices and exclude != FACET_PRICE:
+            prices = Q()
+            for bucket in self.prices:
+                prices |= _price_q(bucket)
+            condition &= prices
+        if self.rating and exclude != FACET_RATING:
+            condition &= Q(current_rating__gte=int(self.rating))
+        if self.in_stock and exclude != FACET_IN_STOCK:
+            condition &= Q(stock__gt=0)
+        return condition
+
+    def query(self):
+        """Канонические GET-параметры (изменяемая копия)."""
+        query = QueryDict(mutable=True)
+        query.setlist(FACET_CATEGORY, list(self.categories))
+        query.setlist(FACET_PRICE, list(self.prices))
+        if self.rating:
+            query[FACET_RATING] = self.rating
+        if self.in_stock:
+            query[FACET_IN_STOCK] = '1'
+        return query
+
+    @property
+    def key(self):
+        """Часть ключа кэша: одинаковая для эквивалентных наборов фильтров."""
+        canonical = self.query().urlencode()
+        return hashlib.sha1(canonical.encode()).hexdigest()[:16] if canonical else 'all'
+
+    def toggle(self, facet, value):
+        """Набор фильтров с включённым или выключенным вариантом фасета (для ссылок)."""
+        if facet == FACET_CATEGORY:
+            return CatalogFilters.from_query(self._toggled(FACET_CATEGORY, self.categories, value))
+        if facet == FACET_PRICE:
+            return CatalogFilters.from_query(self._toggled(FACET_PRICE, self.prices, value))
+        if facet == FACET_RATING:
+            return replace(self, rating='' if self.rating == value else value)
+        return replace(self, in_stock=not self.in_stock)
+
+    def _toggled(self, facet, selected, value):
+        query = self.query()
+        query.setlist(facet, [item for item in selected if item != value] + ([] if value in selected else [value]))
+        return query
+
+    def is_selected(self, facet, value):
+        return {
+            FACET_CATEGORY: value in self.categories,
+            FACET_PRICE: value in self.prices,
+            FACET_RATING: value == self.rating,
+            FACET_IN_STOCK: self.in_stock,
+        }[facet]
+
+
+def _facet_options():
+    """Фасеты и их варианты: (фасет, заголовок, [(значение, подпись, условие)])."""
+    return [
+        (FACET_CATEGORY, 'Категория',
+         [(value, str(label), Q(category=value)) for value, label in Product.CATEGORY_CHOICES]),
+        (FACET_PRICE, 'Цена', [(bucket, label, _price_q(bucket)) for bucket, label, *_ in PRICE_BUCKETS]),
+        (FACET_RATING, 'Рейтинг', [(value, label, Q(current_rating__gte=int(value))) for value, label in RATING_BANDS]),
+        (FACET_IN_STOCK, 'Наличие', [('1', 'В наличии', Q(stock__gt=0))]),
+    ]
+
+
+def compute_facets(filters):
+    """Фасеты с числом товаров и ссылками на переключение вариантов (один SQL-запрос)."""
+    facets = _facet_options()
+    aggregates = {
+        f'{facet}_{index}': Count('pk', filter=filters.q(exclude=facet) & condition)
+        for facet, _, options in facets
+        for index, (_, _, condition) in enumerate(options)
+    }
+    counts = Product.objects.aggregate(**aggregates)
+    return [
+        {
+            'name': facet,
+            'title': title,
+            'options': [
+                {
+                    'value': value,
+                    'label': label,
+                    'count': counts[f'{facet}_{index}'],
+                    'selected': filters.is_selected(facet, value),
+                    'query': filters.toggle(facet, value).query().urlencode(),
+                }
+                for index, (value, label, _) in enumerate(options)
+            ],
+        }
+        for facet, title, options in facets
+    ]
+
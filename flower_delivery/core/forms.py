@@ -110,6 +110,10 @@ class ProductForm(forms.ModelForm):
             'image': forms.ClearableFileInput(attrs={'class': 'form-control'}),
         }
 
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или JSON')
+    dry_run = forms.BooleanField(label='Только проверить, без записи', required=False)
+
 class AddressForm(forms.Form):
     address = forms.CharField(
         max_length=255,
@@ -0,0 +1,118 @@
+# core/images.py
+"""
+Уменьшенные копии изображений товаров.
+
+После сохранения нового Product.image (ProductForm, ProductAdmin) фоновая задача
+core.tasks.generate_product_image_derivatives строит копии thumb/card/detail в WebP и JPEG.
+Имена файлов содержат хэш исходника и параметров обработки, поэтому файл под одним именем
+никогда не меняется. Копии отдаются напрямую из хранилища (MEDIA_URL или CDN), минуя Django,
+и их можно кэшировать бессрочно.
+Список копий хранится в Product.image_derivatives; тег {% product_picture %} выводит их через srcset,
+а пока копий нет (или они построены для прежнего изображения) - исходный файл.
+"""
+import hashlib
+import json
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .caching import invalidate
+from .catalog import CATALOG_CACHE
+from .models import Product
+
+# Ширина копий в пикселях; изображения меньше нужной ширины не увеличиваются
+IMAGE_DERIVATIVES = {'thumb': 160, 'card': 480, 'detail': 1200}
+# Формат: (формат Pillow, расширение)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+DERIVATIVE_QUALITY = 82
+DERIVATIVE_DIR = 'products/derivatives'
+
+
+def derivative_path(name):
+    return f'{DERIVATIVE_DIR}/{name}'
+
+
+def _digest(source):
+    # В хэш входят и параметры обработки: при их изменении копии получают новые имена
+    params = json.dumps([IMAGE_DERIVATIVES, sorted(DERIVATIVE_FORMATS), DERIVATIVE_QUALITY])
+    return hashlib.sha256(source + params.encode()).hexdigest()[:20]
+
+
+def _flatten(image):
+    # JPEG не поддерживает прозрачность: прозрачные области заливаются белым
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_derivatives(source):
+    """Строит копии из байтов исходного изображения и сохраняет их. Возвращает описание копий."""
+    digest = _digest(source)
+    with Image.open(BytesIO(source)) as original:
+        image = _flatten(ImageOps.exif_transpose(original))
+
+    sizes = {}
+    for size, width in IMAGE_DERIVATIVES.items():
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, max(round(image.height * width / image.width), 1)), Image.Resampling.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for key, (pil_format, extension) in DERIVATIVE_FORMATS.items():
+            name = f'{digest}-{size}.{extension}'
+            # Имя зависит от содержимого: существующий файл уже содержит нужную копию
+            if not default_storage.exists(derivative_path(name)):
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, quality=DERIVATIVE_QUALITY, optimize=True)
+                default_storage.save(derivative_path(name), ContentFile(buffer.getvalue()))
+            entry[key] = name
+        sizes[size] = entry
+    return sizes
+
+
+def generate_product_derivatives(product_id):
+    """Строит копии текущего изображения товара. Возвращает False, если изображения нет."""
+    product = Product.objects.filter(pk=product_id).only('id', 'image').first()
+    if product is None or not product.image:
+        return False
+    image_name = product.image.name
+    with product.image.open('rb') as image_file:
+        sizes = build_derivatives(image_file.read())
+
+    # Изображение могли заменить, пока строились копии, - тогда результат не записываем.
+    # update() не вызывает сигналы товара, кэш каталога сбрасывается явно
+    updated = Product.objects.filter(pk=product_id, image=image_name).update(
+        image_derivatives={'image': image_name, 'sizes': sizes},
+    )
+    if updated:
+        invalidate(CATALOG_CACHE)
+    return bool(updated)
+
+
+def schedule_image_derivatives(product):
+    """Ставит построение копий в очередь после фиксации транзакции."""
+    from .tasks import generate_product_image_derivatives
+
+    if product.image:
+        product_id = product.pk
+        transaction.on_commit(lambda: generate_product_image_derivatives.delay(product_id))
+
+
+def product_derivatives(product):
+    """Копии текущего изображения товара или None, если они ещё не построены."""
+    derivatives = product.image_derivatives or {}
+    if not product.image or derivatives.get('image') != product.image.name:
+        return None
+    return derivatives.get('sizes') or None
+
+
+def derivative_url(name):
+    return default_storage.url(derivative_path(name))
@@ -0,0 +1,19 @@
+# core/management/commands/generate_image_derivatives.py
+
+from django.core.management.base import BaseCommand
+from core.images import generate_product_derivatives, product_derivatives
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений товаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить копии у всех товаров')
+
+    def handle(self, *args, **options):
+        built = 0
+        for product in Product.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_derivatives'):
+            if options['force'] or product_derivatives(product) is None:
+                built += generate_product_derivatives(product.pk)
+        self.stdout.write(self.style.SUCCESS(f'Построены копии для товаров: {built}'))
@@ -1,31 +1,77 @@
 # core/management/commands/generate_reports.py
 
-from django.core.management.base import BaseCommand
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
-from core.models import Order, Report
-from django.db.models import Sum, F
+from core.reports import (
+    GROUP_DAY, PERIOD_GRANULARITIES, compute_period_totals, generate_incremental_reports,
+    generate_period_report, missing_period_starts, parse_date, save_period_report,
+)
+
+
+def _init_worker():
+    # Дочерний процесс не должен использовать соединения с БД, унаследованные от родителя
+    django.setup()
+    connections.close_all()
+
 
 class Command(BaseCommand):
-    help = 'Генерирует ежедневный отчет по продажам'
+    help = 'Генерирует отчеты по продажам за периоды (по умолчанию - за сегодня)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--granularity', choices=PERIOD_GRANULARITIES, default=GROUP_DAY,
+                            help='Периодичность отчётов: day, week или month')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--incremental', action='store_true',
+                          help='Пересчитать только периоды с заказами, изменёнными с прошлого запуска')
+        mode.add_argument('--backfill', nargs=2, metavar=('FROM', 'TO'),
+                          help='Построить недостающие отчёты за интервал ГГГГ-ММ-ДД ГГГГ-ММ-ДД')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов для --backfill')
 
     def handle(self, *args, **options):
-        today = timezone.now().date()
-        orders = Order.objects.filter(
-            created_at__date=today,
-            status='delivered'
-        )
-
-        total_sales = orders.aggregate(
-            total=Sum(F('items__quantity') * F('items__product__price'))
-        )['total'] or 0
-
-        total_orders = orders.count()
-        total_customers = orders.values('user').distinct().count()
-
-        Report.objects.create(
-            total_sales=total_sales,
-            total_orders=total_orders,
-            total_customers=total_customers
-        )
-
-        self.stdout.write(self.style.SUCCESS(f'Отчет за {today} создан'))
+        granularity = options['granularity']
+
+        if options['incremental']:
+            reports = generate_incremental_reports(granularity)
+            self.stdout.write(self.style.SUCCESS(f'Обновлено отчетов: {len(reports)}'))
+            return
+
+        if options['backfill']:
+            start, end = (parse_date(value) for value in options['backfill'])
+            if not start or not end or start > end:
+                raise CommandError('Укажите корректный интервал: --backfill ГГГГ-ММ-ДД ГГГГ-ММ-ДД')
+            created = self._backfill(granularity, start, end, max(options['workers'], 1))
+            self.stdout.write(self.style.SUCCESS(f'Создано отчетов: {created}'))
+            return
+
+        today = timezone.localdate()
+        report = generate_period_report(today, granularity)
+        self.stdout.write(self.style.SUCCESS(f'{report} сохранён'))
+
+    def _backfill(self, granularity, start, end, workers):
+        starts = missing_period_starts(start, end, granularity)
+        if not starts:
+            return 0
+        if workers == 1 or len(starts) == 1:
+            for period_start in starts:
+                save_period_report(compute_period_totals(granularity, period_start))
+            return len(starts)
+
+        # Итоги считаются параллельно, а сохраняются в основном процессе,
+        # чтобы не упираться в блокировки записи (SQLite)
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = executor.map(
+                compute_period_totals,
+                [granularity] * len(starts),
+                [period_start.isoformat() for period_start in starts],
+                chunksize=max(len(starts) // (workers * 4), 1),
+            )
+            for totals in results:
+                save_period_report(totals)
+        return len(starts)
@@ -0,0 +1,42 @@
+# core/management/commands/import_products.py
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.product_import import IMPORT_BATCH_SIZE, IMPORT_FORMATS, detect_format, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Загружает и обновляет товары из CSV или JSON по артикулу (sku)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV, JSON (массив объектов) или JSON Lines')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Формат файла; по умолчанию - по расширению')
+        parser.add_argument('--user', help='Пользователь, от имени которого создаются новые товары (по умолчанию - первый суперпользователь)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что изменится')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError('Не найден пользователь для новых товаров, укажите --user')
+
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = import_products(read_rows(stream, file_format), user,
+                                         batch_size=max(options['batch_size'], 1), dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+        except ValueError as e:
+            raise CommandError(f'Некорректный файл: {e}')
+
+        for error in result.errors:
+            self.stderr.write(error)
+        prefix = 'Проверка без записи. ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Добавлено: {result.inserted}, обновлено: {result.updated}, '
+            f'без изменений: {result.unchanged}, с ошибками: {result.failed}'
+        ))
@@ -0,0 +1,28 @@
+# core/management/commands/rebuild_sales_rollup.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from core.rollups import rebuild_sales_rollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную сводку продаж по доставленным заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start_date', help='Дата начала периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--to', dest='end_date', help='Дата окончания периода (ГГГГ-ММ-ДД)')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = self._parse_date(options['start_date'])
+            end_date = self._parse_date(options['end_date'])
+        except ValueError as e:
+            raise CommandError(f'Некорректный формат даты: {e}')
+
+        days = rebuild_sales_rollup(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'Сводка продаж пересчитана, дней с продажами: {days}'))
+
+    @staticmethod
+    def _parse_date(value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -0,0 +1,15 @@
+# core/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+from core.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс товаров (после массовой загрузки или восстановления БД)'
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            self.stdout.write(self.style.WARNING('Для этой СУБД индекс не поддерживается, поиск работает без него'))
+            return
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс перестроен, товаров: {count}'))
@@ -0,0 +1,12 @@
+# core/management/commands/reconcile_ratings.py
+
+from django.core.management.base import BaseCommand
+from core.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Сверяет рейтинги товаров с отзывами и исправляет расхождения'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Исправлено товаров: {fixed}'))
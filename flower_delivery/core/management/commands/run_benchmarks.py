@@ -0,0 +1,47 @@
+# core/management/commands/run_benchmarks.py
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import ENDPOINTS, compare, load, run_benchmarks, save
+
+
+class Command(BaseCommand):
+    help = 'Замеряет число SQL-запросов и время ответа основных страниц и сохраняет результаты в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=[endpoint.name for endpoint in ENDPOINTS],
+                            help='Замерить только указанные точки')
+        parser.add_argument('--iterations', type=int, default=5, help='Количество тёплых запросов на точку')
+        parser.add_argument('--output', default='benchmarks.json', help='Файл для результатов')
+        parser.add_argument('--compare', help='Файл с результатами предыдущего запуска для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимый рост медианного времени при сравнении (доля)')
+        parser.add_argument('--no-assert', action='store_true', help='Не завершаться с ошибкой при превышении бюджетов')
+
+    def handle(self, *args, **options):
+        try:
+            data = run_benchmarks(options['only'], options['iterations'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        failures = []
+        for result in data['results'].values():
+            line = (f"{result['name']:<28} {result['status']:>3}  SQL {result['queries']:>3} "
+                    f"(холодный {result['cold_queries']:>3})  медиана {result['median_ms']:>8} мс  "
+                    f"холодный {result['cold_ms']:>8} мс")
+            if result['failures']:
+                failures.append(f"{result['name']}: {'; '.join(result['failures'])}")
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        save(data, options['output'])
+        self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options['compare']:
+            lines, regressions = compare(data, load(options['compare']), options['tolerance'])
+            self.stdout.write('\n'.join(lines))
+            failures.extend(f'Регрессия: {line}' for line in regressions)
+
+        if failures and not options['no_assert']:
+            raise CommandError('Превышены бюджеты производительности:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Замеры завершены'))
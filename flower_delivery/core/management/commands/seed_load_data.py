@@ -0,0 +1,212 @@
+# core/management/commands/seed_load_data.py
+
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import Cart, CartItem, Order, OrderItem, Product, Review, UserProfile
+from core.ratings import reconcile_ratings
+from core.rollups import rebuild_sales_rollup, update_popular_products
+from core.search import rebuild_search_index
+
+# Все сгенерированные пользователи получают этот префикс, по нему данные удаляются (--clear)
+SEED_PREFIX = 'load_'
+SEED_PASSWORD = 'load-password'
+
+# Доля категорий в каталоге и базовая цена букета
+CATEGORY_WEIGHTS = {'roses': 35, 'bouquets': 25, 'tulips': 15, 'orchids': 10, 'other': 15}
+CATEGORY_BASE_PRICE = {'roses': 150, 'tulips': 90, 'orchids': 1200, 'bouquets': 2500, 'other': 500}
+PRODUCT_ADJECTIVES = ['Нежные', 'Алые', 'Белые', 'Весенние', 'Садовые', 'Пионовидные', 'Летние', 'Королевские']
+PRODUCT_NAMES = {
+    'roses': 'розы', 'tulips': 'тюльпаны', 'orchids': 'орхидеи', 'bouquets': 'букет', 'other': 'композиция',
+}
+
+# Праздники, на которые приходятся пики заказов (месяц, день): множитель спроса
+HOLIDAY_PEAKS = {(2, 14): 6, (3, 8): 10, (9, 1): 4, (12, 31): 3}
+HOLIDAY_RAMP_DAYS = 3
+
+ITEM_QUANTITIES = [1, 1, 1, 1, 2, 2, 3, 5]
+REVIEW_RATINGS = [5, 4, 3, 2, 1]
+REVIEW_RATING_WEIGHTS = [55, 25, 10, 5, 5]
+# Распределение статусов для заказов старше недели и для свежих
+OLD_STATUS_WEIGHTS = {'delivered': 85, 'canceled': 10, 'shipped': 5}
+RECENT_STATUS_WEIGHTS = {'pending': 30, 'confirmed': 25, 'shipped': 25, 'delivered': 15, 'canceled': 5}
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетические данные (пользователи, товары, корзины, заказы, отзывы) для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=None, help='По умолчанию - пятая часть пользователей')
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории заказов в днях')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора для воспроизводимости')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['products']) < 1:
+            raise CommandError('Нужен хотя бы один пользователь и один товар')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f'Удалено записей: {deleted}')
+
+        if User.objects.filter(username__startswith=SEED_PREFIX).exists():
+            raise CommandError('Сгенерированные данные уже есть, используйте --clear')
+
+        with transaction.atomic():
+            manager = User.objects.create_superuser(
+                username=f'{SEED_PREFIX}admin', password=SEED_PASSWORD, email='load_admin@example.com',
+            )
+            users = self._create_users(options['users'])
+            products = self._create_products(options['products'], manager)
+            orders, items = self._create_orders(options['orders'], options['days'], users, products)
+            reviews = self._create_reviews(options['reviews'], users, products)
+            carts = options['carts'] if options['carts'] is not None else len(users) // 5
+            cart_items = self._create_carts(carts, users, products)
+
+        # Сводки, популярность и поисковый индекс пересчитываются отдельно: bulk_create не вызывает сигналы
+        rebuild_sales_rollup()
+        update_popular_products()
+        rebuild_search_index()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, товаров {len(products)}, заказов {orders} '
+            f'(позиций {items}), отзывов {reviews}, корзин {carts} (позиций {cart_items}). '
+            f'Пароль пользователей {SEED_PREFIX}*: {SEED_PASSWORD}'
+        ))
+
+    def _bulk(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def _create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        users = self._bulk(User, [
+            User(username=f'{SEED_PREFIX}user_{i}', email=f'load_user_{i}@example.com', password=password)
+            for i in range(count)
+        ])
+        self._bulk(UserProfile, [
+            UserProfile(user=user, full_name=f'Покупатель {i}', delivery_address=f'Москва, ул. Цветочная, {i % 200 + 1}')
+            for i, user in enumerate(users)
+        ])
+        return users
+
+    def _create_products(self, count, manager):
+        categories = self.random.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()), k=count)
+        products = []
+        for i, category in enumerate(categories):
+            price = CATEGORY_BASE_PRICE[category] * self.random.lognormvariate(0, 0.35)
+            products.append(Product(
+                name=f'{self.random.choice(PRODUCT_ADJECTIVES)} {PRODUCT_NAMES[category]} №{i + 1}',
+                description='Свежие цветы с доставкой в день заказа.',
+                price=Decimal(max(round(price, -1), 10)),
+                category=category,
+                stock=0 if self.random.random() < 0.05 else self.random.randint(1, 200),
+                created_by=manager,
+            ))
+        return self._bulk(Product, products)
+
+    def _day_weights(self, days):
+        today = timezone.localdate()
+        dates, weights = [], []
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            weight = 1.3 if day.weekday() >= 5 else 1.0
+            for ramp in range(HOLIDAY_RAMP_DAYS + 1):
+                peak = HOLIDAY_PEAKS.get(((day + timedelta(days=ramp)).month, (day + timedelta(days=ramp)).day))
+                if peak:
+                    weight = max(weight, peak / (ramp + 1))
+            dates.append(day)
+            weights.append(weight)
+        return dates, weights
+
+    @staticmethod
+    def _rank_weights(count, exponent):
+        # Степенное распределение: немногие товары и покупатели дают основную часть заказов
+        return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+    def _create_orders(self, count, days, users, products):
+        rnd = self.random
+        dates, day_weights = self._day_weights(max(days, 1))
+        shuffled_users = rnd.sample(users, len(users))
+        user_weights = self._rank_weights(len(users), 0.8)
+        shuffled_products = rnd.sample(products, len(products))
+        product_weights = self._rank_weights(len(products), 1.1)
+        week_ago = timezone.localdate() - timedelta(days=7)
+        tz = timezone.get_current_timezone()
+
+        total_items = 0
+        for batch_start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - batch_start)
+            orders, created = [], []
+            for day, user in zip(rnd.choices(dates, weights=day_weights, k=size),
+                                 rnd.choices(shuffled_users, weights=user_weights, k=size)):
+                status_weights = OLD_STATUS_WEIGHTS if day < week_ago else RECENT_STATUS_WEIGHTS
+                created_at = timezone.make_aware(
+                    datetime.combine(day, time(rnd.randint(9, 19), rnd.randint(0, 59))), tz,
+                )
+                created.append(created_at)
+                orders.append(Order(
+                    user=user,
+                    address=f'Москва, ул. Цветочная, {rnd.randint(1, 200)}',
+                    status=rnd.choices(list(status_weights), weights=list(status_weights.values()))[0],
+                ))
+            orders = self._bulk(Order, orders)
+            # auto_now_add/auto_now проставляют при вставке текущее время - возвращаем сгенерированные даты
+            for order, created_at in zip(orders, created):
+                order.created_at = order.updated_at = created_at
+            Order.objects.bulk_update(orders, ['created_at', 'updated_at'], batch_size=self.batch_size)
+
+            items = []
+            for order in orders:
+                lines = min(1 + int(rnd.expovariate(1.2)), 6)
+                for product in set(rnd.choices(shuffled_products, weights=product_weights, k=lines)):
+                    quantity = rnd.choice(ITEM_QUANTITIES)
+                    items.append(OrderItem(
+                        order=order, product=product, quantity=quantity,
+                        unit_price=product.price, line_total=product.price * quantity,
+                    ))
+            self._bulk(OrderItem, items)
+            total_items += len(items)
+        return count, total_items
+
+    def _create_reviews(self, count, users, products):
+        rnd = self.random
+        count = min(count, len(users) * len(products))
+        pairs = set()
+        while len(pairs) < count:
+            pairs.add((rnd.randrange(len(users)), rnd.randrange(len(products))))
+        reviews = [
+            Review(
+                user=users[user_index], product=products[product_index],
+                rating=rnd.choices(REVIEW_RATINGS, weights=REVIEW_RATING_WEIGHTS)[0],
+                comment='Отличные цветы, доставили вовремя.',
+            )
+            for user_index, product_index in pairs
+        ]
+        self._bulk(Review, reviews)
+        reconcile_ratings(Product.objects.filter(created_by=products[0].created_by))
+        return len(reviews)
+
+    def _create_carts(self, count, users, products):
+        rnd = self.random
+        carts = self._bulk(Cart, [Cart(user=user) for user in rnd.sample(users, min(count, len(users)))])
+        in_stock = [product for product in products if product.stock > 0] or products
+        items = [
+            CartItem(cart=cart, product=product, quantity=rnd.choice(ITEM_QUANTITIES[:5]))
+            for cart in carts
+            for product in rnd.sample(in_stock, min(rnd.randint(1, 4), len(in_stock)))
+        ]
+        self._bulk(CartItem, items)
+        return len(items)
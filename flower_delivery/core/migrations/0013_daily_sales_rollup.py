@@ -0,0 +1,89 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:12
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 500
+
+
+def build_rollup(apps, schema_editor):
+    """Заполняет сводку по доставленным заказам (как rebuild_sales_rollup на момент этой миграции)."""
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    DailySales = apps.get_model('core', 'DailySales')
+    DailyCategorySales = apps.get_model('core', 'DailyCategorySales')
+
+    days = defaultdict(lambda: {'total_orders': 0, 'total_sales': Decimal('0')})
+    order_counts = (
+        Order.objects.filter(status='delivered').annotate(day=TruncDate('created_at'))
+        .values('day').annotate(count=Count('id'))
+    )
+    for row in order_counts:
+        days[row['day']]['total_orders'] = row['count']
+
+    # Цены в позициях заказов появляются в 0014, до этого сумма считается по цене товара
+    category_rows = (
+        OrderItem.objects.filter(order__status='delivered').annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category')
+        .annotate(line_quantity=Sum('quantity'), line_sales=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField()))
+    )
+    categories = []
+    for row in category_rows:
+        sales = row['line_sales'] or 0
+        days[row['day']]['total_sales'] += sales
+        categories.append(DailyCategorySales(
+            date=row['day'], category=row['product__category'],
+            total_quantity=row['line_quantity'], total_sales=sales,
+        ))
+
+    DailySales.objects.bulk_create(
+        [DailySales(date=day, **values) for day, values in days.items()], batch_size=BATCH_SIZE
+    )
+    DailyCategorySales.objects.bulk_create(categories, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_alter_report_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_orders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(choices=[('roses', 'Розы'), ('tulips', 'Тюльпаны'), ('orchids', 'Орхидеи'), ('bouquets', 'Букеты'), ('other', 'Другие')], max_length=50)),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Продажи категории за день',
+                'verbose_name_plural': 'Продажи по категориям и дням',
+                'ordering': ['date', 'category'],
+                'unique_together': {('date', 'category')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill_prices(apps, schema_editor):
+    """Заполняет цену позиций текущей ценой товара пакетами по первичному ключу."""
+    OrderItem = apps.get_model('core', 'OrderItem')
+    last_pk = 0
+    while True:
+        rows = list(
+            OrderItem.objects.filter(pk__gt=last_pk, unit_price__isnull=True)
+            .order_by('pk')
+            .values_list('pk', 'quantity', 'product__price')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        items = [
+            OrderItem(pk=pk, unit_price=price, line_total=price * quantity)
+            for pk, quantity, price in rows
+        ]
+        OrderItem.objects.bulk_update(items, ['unit_price', 'line_total'])
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 500
+
+
+def build_product_rollup(apps, schema_editor):
+    """Заполняет дневные счётчики товаров по доставленным заказам."""
+    OrderItem = apps.get_model('core', 'OrderItem')
+    ProductDailySales = apps.get_model('core', 'ProductDailySales')
+    rows = (
+        OrderItem.objects.filter(order__status='delivered').annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id').annotate(line_quantity=Sum('quantity'), line_sales=Sum('line_total'))
+    )
+    ProductDailySales.objects.bulk_create(
+        [
+            ProductDailySales(date=row['day'], product_id=row['product_id'], total_quantity=row['line_quantity'],
+                              total_sales=row['line_sales'] or 0)
+            for row in rows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_orderitem_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='popularity_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи по товарам и дням',
+                'ordering': ['date', 'product'],
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.RunPython(build_product_rollup, migrations.RunPython.noop),
+    ]
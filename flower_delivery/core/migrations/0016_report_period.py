@@ -0,0 +1,65 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:23
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_periods(apps, schema_editor):
+    """
+    Старые отчёты содержали итоги за день создания. Период проставляется последнему отчёту
+    за каждый день, остальные дубли остаются без периода. День считается в текущем часовом поясе,
+    как timezone.localdate в core.reports.
+    """
+    Report = apps.get_model('core', 'Report')
+    latest = {}
+    for pk, created_at in Report.objects.order_by('created_at', 'pk').values_list('pk', 'created_at'):
+        latest[timezone.localdate(created_at)] = pk
+    reports = [Report(pk=pk, period_start=day, period_end=day) for day, pk in latest.items()]
+    Report.objects.bulk_update(reports, ['period_start', 'period_end'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_product_daily_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Отметка генерации отчётов',
+                'verbose_name_plural': 'Отметки генерации отчётов',
+            },
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='granularity',
+            field=models.CharField(choices=[('day', 'День'), ('week', 'Неделя'), ('month', 'Месяц')], default='day', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='period_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='period_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_periods, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='report',
+            constraint=models.UniqueConstraint(fields=('granularity', 'period_start'), name='unique_report_period'),
+        ),
+    ]
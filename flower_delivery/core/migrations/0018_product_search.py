@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# DDL и заполнение индекса зафиксированы здесь, а не взяты из core.search,
+# чтобы последующие изменения модуля не меняли эту миграцию
+SEARCH_TABLE = 'core_product_search'
+BATCH_SIZE = 1000
+
+
+def _normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def _index_rows(products, categories):
+    return [
+        (product.pk, _normalize(product.name), _normalize(product.description),
+         _normalize(str(categories.get(product.category, product.category))))
+        for product in products
+    ]
+
+
+def _write_rows(cursor, vendor, rows):
+    if vendor == 'sqlite':
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)', rows,
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'C') "
+            f"|| setweight(to_tsvector('russian', %s), 'B'))",
+            rows,
+        )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+            f'name, description, category, tokenize="unicode61 remove_diacritics 2")'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            f'product_id integer PRIMARY KEY REFERENCES core_product (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(f'CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)')
+    else:
+        return
+
+    Product = apps.get_model('core', 'Product')
+    categories = dict(Product._meta.get_field('category').choices or ())
+    products = Product.objects.only('id', 'name', 'description', 'category').order_by('id')
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for product in products.iterator(chunk_size=BATCH_SIZE):
+            batch.append(product)
+            if len(batch) == BATCH_SIZE:
+                _write_rows(cursor, vendor, _index_rows(batch, categories))
+                batch = []
+        if batch:
+            _write_rows(cursor, vendor, _index_rows(batch, categories))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
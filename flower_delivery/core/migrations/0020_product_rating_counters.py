@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Review = apps.get_model('core', 'Review')
+    stats = Review.objects.order_by().values('product').annotate(total=Sum('rating'), count=Count('pk'))
+    products = [
+        Product(pk=row['product'], rating_sum=row['total'], rating_count=row['count'],
+                current_rating=row['total'] / row['count'])
+        for row in stats
+    ]
+    Product.objects.bulk_update(products, ['rating_sum', 'rating_count', 'current_rating'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_product_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
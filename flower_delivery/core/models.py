@@ -8,7 +8,6 @@ from django.conf import settings
 from django.db.models import Sum, F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db.models import Avg
 
 
 # Telegram Bot Integration
@@ -16,7 +15,8 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
 class ProductManager(models.Manager):
     def popular(self):
-        return self.filter(is_popular=True)
+        # Флаг и оценка пересчитываются фоновой задачей core.tasks.update_popular_products
+        return self.filter(is_popular=True).order_by('-popularity_score', 'id')
 
 # Модель товара
 class Product(models.Model):
@@ -28,17 +28,25 @@ class Product(models.Model):
         ('other', _('Другие')),
     ]
 
+    # Артикул: ключ сопоставления при массовой загрузке (core.product_import)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
+    # Уменьшенные копии изображения, строятся фоновой задачей (core.images)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, default='roses')
     is_popular = models.BooleanField(default=False)
+    popularity_score = models.FloatField(default=0)  # Продажи с затуханием по давности
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     rating = models.DecimalField(max_digits=2, decimal_places=1, default=5.0)
     objects = ProductManager()
     stock = models.PositiveIntegerField(default=0)  # Поле для отслеживания количества на складе
+    # Средний рейтинг по отзывам и его составляющие, обновляются атомарно при записи отзыва (core.ratings)
     current_rating = models.FloatField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -56,13 +64,19 @@ class Product(models.Model):
             raise ValidationError(_('Количество на складе не может быть отрицательным.'))
 
     def update_current_rating(self):
-        avg_rating = self.reviews.aggregate(avg=Avg('rating'))['avg'] or 0
-        self.current_rating = avg_rating
-        self.save(update_fields=['current_rating'])
+        # Полный пересчёт по отзывам; при обычной записи отзыва рейтинг меняется инкрементально
+        from .ratings import reconcile_ratings
+        reconcile_ratings(Product.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['current_rating', 'rating_sum', 'rating_count'])
 
     class Meta:
         verbose_name = _('Продукт')
         verbose_name_plural = _('Продукты')
+        # Порядок каталога и постраничный вывод по ключу (core.catalog)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_category_name_id_idx'),
+        ]
 
 # Модель корзины
 class Cart(models.Model):
@@ -100,6 +114,29 @@ class CartItem(models.Model):
         verbose_name_plural = _('Элементы корзины')
         unique_together = ('cart', 'product')
 
+# Временное резервирование товара за корзиной (core.reservations)
+class StockReservation(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    # Владелец резерва: 'user:<id>' или 'anon:<токен из cookie корзины>'
+    owner = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} для {self.owner} до {self.expires_at}"
+
+    class Meta:
+        verbose_name = _('Резерв товара')
+        verbose_name_plural = _('Резервы товаров')
+        unique_together = ('product', 'owner')
+        indexes = [
+            # Сумма действующих резервов товара и выборка истёкших для очистки
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+            models.Index(fields=['owner'], name='reservation_owner_idx'),
+        ]
+
 # Модель заказа
 # core/models.py
 
@@ -134,7 +171,8 @@ class Order(models.Model):
     get_products_display.short_description = "Товары"
 
     def get_total_price(self):
-        return sum(item.product.price * item.quantity for item in self.items.all())
+        # Использует prefetch_related('items'), если он есть; иначе - один запрос без join к Product
+        return sum(item.line_total for item in self.items.all())
 
     def colored_status(self):
         status_colors = {
@@ -162,12 +200,21 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Цена фиксируется на момент оформления заказа, чтобы изменение цены товара не меняло старые заказы
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
 
     def __str__(self):
         return f'{self.quantity} x {self.product.name}'
 
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        self.line_total = self.unit_price * self.quantity
+        super().save(*args, **kwargs)
+
     def get_total_price(self):
-        return self.product.price * self.quantity
+        return self.line_total
 
     def update_status(self, new_status):
         if new_status in dict(self.STATUS_CHOICES):
@@ -194,12 +241,10 @@ class Review(models.Model):
         if not (1 <= self.rating <= 5):
             raise ValidationError('Рейтинг должен быть от 1 до 5')
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.product.update_current_rating()
-
     class Meta:
         unique_together = ('product', 'user')
+        # Отзывы товара от новых к старым (core.reviews)
+        indexes = [models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx')]
         verbose_name = _('Отзыв')
         verbose_name_plural = _('Отзывы')
 
@@ -215,14 +260,95 @@ class UserProfile(models.Model):
 
 
 class Report(models.Model):
+    GRANULARITY_CHOICES = [
+        ('day', _('День')),
+        ('week', _('Неделя')),
+        ('month', _('Месяц')),
+    ]
+
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Период отчёта (границы включительно); у старых отчётов, созданных до появления периодов, может быть пустым
+    period_start = models.DateField(null=True, blank=True)
+    period_end = models.DateField(null=True, blank=True)
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES, default='day')
     total_sales = models.DecimalField(max_digits=10, decimal_places=2)
     total_orders = models.PositiveIntegerField()
     total_customers = models.PositiveIntegerField()
 
     def __str__(self):
-        return f"Отчёт за {self.created_at.strftime('%Y-%m-%d')}"
+        if self.period_start and self.period_start != self.period_end:
+            return f"Отчёт за {self.period_start:%Y-%m-%d} - {self.period_end:%Y-%m-%d}"
+        return f"Отчёт за {(self.period_start or self.created_at):%Y-%m-%d}"
 
     class Meta:
         verbose_name = _('Отчёт')
-        verbose_name_plural = _('Отчёты')
\ No newline at end of file
+        verbose_name_plural = _('Отчёты')
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'period_start'], name='unique_report_period'),
+        ]
+
+
+# Отметка, до которой изменения заказов уже учтены в сохранённых отчётах (generate_reports --incremental)
+class ReportWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    class Meta:
+        verbose_name = _('Отметка генерации отчётов')
+        verbose_name_plural = _('Отметки генерации отчётов')
+
+
+# Дневная сводка продаж: обновляется инкрементально при переходе заказа в статус "delivered" и обратно
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Продажи за {self.date}: {self.total_sales}"
+
+    class Meta:
+        ordering = ['date']
+        verbose_name = _('Продажи за день')
+        verbose_name_plural = _('Продажи по дням')
+
+
+# Дневная сводка продаж в разрезе категорий товаров
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.CharField(max_length=50, choices=Product.CATEGORY_CHOICES)
+    total_quantity = models.IntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Продажи категории {self.category} за {self.date}: {self.total_sales}"
+
+    class Meta:
+        ordering = ['date', 'category']
+        unique_together = ('date', 'category')
+        verbose_name = _('Продажи категории за день')
+        verbose_name_plural = _('Продажи по категориям и дням')
+
+
+# Дневные счётчики продаж по товарам (количество и выручка) для топов и расчёта популярности
+class ProductDailySales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    total_quantity = models.IntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Продажи товара {self.product_id} за {self.date}: {self.total_quantity}"
+
+    class Meta:
+        ordering = ['date', 'product']
+        unique_together = ('date', 'product')
+        verbose_name = _('Продажи товара за день')
+        verbose_name_plural = _('Продажи по товарам и дням')
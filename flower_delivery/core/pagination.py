@@ -0,0 +1,143 @@
+# core/pagination.py
+"""
+Постраничный вывод по ключу (keyset): следующая страница выбирается условием
+«после последней показанной строки» по упорядочивающим полям, а не через OFFSET.
+Стоимость страницы не зависит от её глубины и не требует COUNT(*), но номера страниц
+неизвестны - вместо них в ссылках передаётся непрозрачный курсор.
+
+Упорядочивающие поля должны однозначно задавать порядок (последним полем - id)
+и быть покрыты индексом вместе с полями фильтра, например (category, name, id).
+Поле с префиксом «-» сортируется по убыванию, например ('-created_at', '-id').
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+CURSOR_LAST = 'l'
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder обрезает время до миллисекунд - в ключе нужна полная точность
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, key=None):
+    payload = {'d': direction}
+    if key is not None:
+        payload['k'] = list(key)
+    data = json.dumps(payload, cls=_CursorEncoder, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key_length):
+    """Возвращает (направление, ключ) или None, если курсор повреждён."""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, key = payload['d'], payload.get('k')
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if direction == CURSOR_LAST and key is None:
+        return direction, None
+    if direction in (CURSOR_NEXT, CURSOR_PREVIOUS) and isinstance(key, list) and len(key) == key_length:
+        return direction, key
+    return None
+
+
+def _field(name):
+    """Имя поля и признак сортировки по убыванию."""
+    return (name[1:], True) if name.startswith('-') else (name, False)
+
+
+def _after(ordering, key, backwards=False):
+    # (a, b, c) > (x, y, z): a >= x AND (a > x OR (b >= y AND (b > y OR c > z))).
+    # Внешнее условие a >= x позволяет базе начать чтение индекса с нужной позиции.
+    # Для полей по убыванию и при чтении назад сравнения меняются на обратные
+    field, descending = _field(ordering[0])
+    lookup = 'lt' if descending != backwards else 'gt'
+    strict = Q(**{f'{field}__{lookup}': key[0]})
+    if len(ordering) == 1:
+        return strict
+    return Q(**{f'{field}__{lookup}e': key[0]}) & (strict | _after(ordering[1:], key[1:], backwards))
+
+
+class KeysetPage:
+    """Страница с интерфейсом, который использует pagination.html."""
+    is_keyset = True
+
+    def __init__(self, object_list, has_previous, has_next, ordering):
+        self.object_list = object_list
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.ordering = ordering
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    # Пустая страница (строки удалены после выдачи курсора) ссылок на соседние не даёт
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def _key(self, obj):
+        return [getattr(obj, _field(name)[0]) for name in self.ordering]
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(CURSOR_PREVIOUS, self._key(self.object_list[0])) if self.has_previous() else None
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(CURSOR_NEXT, self._key(self.object_list[-1])) if self.has_next() else None
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(CURSOR_LAST)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        """Страница по курсору из ссылки; без курсора или с повреждённым курсором - первая."""
+        decoded = decode_cursor(cursor, len(self.ordering))
+        direction, key = decoded or (None, None)
+        backwards = direction in (CURSOR_PREVIOUS, CURSOR_LAST)
+
+        queryset = self.queryset
+        if key is not None:
+            queryset = queryset.filter(_after(self.ordering, key, backwards))
+        ordering = list(self.ordering)
+        if backwards:
+            ordering = [field if descending else f'-{field}' for field, descending in map(_field, ordering)]
+        # Лишняя строка показывает, есть ли страница дальше в направлении чтения
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            # Пришли по ссылке со следующей страницы (или на последнюю) - она существует
+            return KeysetPage(rows, has_previous=has_more, has_next=direction == CURSOR_PREVIOUS, ordering=self.ordering)
+        return KeysetPage(rows, has_previous=key is not None, has_next=has_more, ordering=self.ordering)
@@ -0,0 +1,171 @@
+# core/pdf.py
+"""
+Генерация PDF-отчётов по продажам.
+
+PDF строится в фоновой задаче Celery (core.tasks.generate_sales_report_pdf) и сохраняется
+в хранилище под именем, зависящим от параметров отчёта и версии данных, поэтому
+повторный запрос того же отчёта отдаёт уже готовый файл.
+"""
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, JsonResponse
+from django.urls import reverse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .charts import line_chart_png
+from .reports import report_data_version, run_report
+
+PDF_FONT = 'DejaVuSans'
+PDF_ARTIFACT_DIR = 'reports/pdf'
+PDF_PENDING_TIMEOUT = 10 * 60
+
+_font_lock = threading.Lock()
+_font_registered = False
+
+
+def register_pdf_font():
+    """Регистрирует шрифт с поддержкой кириллицы один раз на процесс."""
+    global _font_registered
+    if _font_registered:
+        return
+    with _font_lock:
+        if not _font_registered:
+            font_path = os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans.ttf')
+            pdfmetrics.registerFont(TTFont(PDF_FONT, font_path))
+            _font_registered = True
+
+
+def pdf_artifact_key(query):
+    """Ключ артефакта: хэш параметров отчёта и текущей версии его данных."""
+    payload = json.dumps({
+        'start': query.start.isoformat() if query.start else None,
+        'end': query.end.isoformat() if query.end else None,
+        'statuses': query.statuses,
+        'group_by': query.group_by,
+        'version': report_data_version(query),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def pdf_artifact_path(key):
+    return f'{PDF_ARTIFACT_DIR}/sales_{key}.pdf'
+
+
+def render_sales_report_pdf(report):
+    """Возвращает содержимое PDF-отчёта в байтах."""
+    register_pdf_font()
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    p.setFont(PDF_FONT, 12)
+
+    query = report.query
+    period = f"с {query.start or '...'} по {query.end or '...'}" if query.start or query.end else "за всё время"
+    p.drawString(100, 800, f"Отчет по продажам {period}")
+
+    # Общие показатели
+    p.drawString(100, 780, f"Общий объем продаж: {report.total_sales}")
+    p.drawString(100, 760, f"Общее количество заказов: {report.total_orders}")
+    p.drawString(100, 740, f"Общее количество клиентов: {report.total_customers}")
+
+    y = 700
+    if report.series:
+        chart = line_chart_png(
+            [point.label for point in report.series],
+            [point.total_sales for point in report.series],
+            title='Продажи по дням', xlabel='Дата', ylabel='Общая сумма продаж',
+        )
+        p.drawImage(ImageReader(BytesIO(chart)), 60, 470, width=480, height=220)
+        y = 440
+        p.drawString(100, y, "Продажи по дням:")
+        y -= 20
+        for point in report.series:
+            p.drawString(100, y, f"{point.label}: {point.total_sales}")
+            y -= 20
+            if y < 50:
+                p.showPage()
+                p.setFont(PDF_FONT, 12)
+                y = 800
+    else:
+        p.drawString(100, y, "Нет данных о продажах за выбранный период.")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def build_sales_report_pdf(query, key=None):
+    """Строит PDF для отчёта и сохраняет его в хранилище, если такого артефакта ещё нет."""
+    path = pdf_artifact_path(key or pdf_artifact_key(query))
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(render_sales_report_pdf(run_report(query))))
+    return path
+
+
+def _pending_cache_key(key):
+    return f'sales_report_pdf_pending:{key}'
+
+
+def _failed_cache_key(key):
+    return f'sales_report_pdf_failed:{key}'
+
+
+def mark_pdf_failed(key):
+    cache.delete(_pending_cache_key(key))
+    cache.set(_failed_cache_key(key), True, PDF_PENDING_TIMEOUT)
+
+
+def mark_pdf_done(key):
+    cache.delete(_pending_cache_key(key))
+
+
+def pdf_status(key):
+    """Состояние артефакта: ready, pending, failed или missing."""
+    if default_storage.exists(pdf_artifact_path(key)):
+        return 'ready'
+    if cache.get(_pending_cache_key(key)):
+        return 'pending'
+    if cache.get(_failed_cache_key(key)):
+        return 'failed'
+    return 'missing'
+
+
+def sales_report_pdf_response(query):
+    """
+    Отдаёт готовый PDF, если он уже построен для этих параметров и данных,
+    иначе ставит задачу на генерацию и сразу возвращает 202 со ссылкой на статус.
+    """
+    from .tasks import generate_sales_report_pdf
+
+    key = pdf_artifact_key(query)
+    path = pdf_artifact_path(key)
+    if default_storage.exists(path):
+        response = FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="sales_report.pdf"'
+        return response
+
+    # Ставим задачу один раз, пока предыдущая не завершилась
+    if cache.add(_pending_cache_key(key), True, PDF_PENDING_TIMEOUT):
+        cache.delete(_failed_cache_key(key))
+        generate_sales_report_pdf.delay(
+            key=key,
+            start=query.start.isoformat() if query.start else None,
+            end=query.end.isoformat() if query.end else None,
+            statuses=list(query.statuses),
+        )
+
+    status_url = reverse('sales_report_pdf_status', args=[key])
+    response = JsonResponse({'status': 'pending', 'status_url': status_url}, status=202)
+    response['Location'] = status_url
+    return response
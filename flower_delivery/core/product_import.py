@@ -0,0 +1,198 @@
+# core/product_import.py
+"""
+Массовая загрузка и обновление товаров из CSV или JSON (команда import_products, админка).
+
+Строки сопоставляются с товарами по артикулу (Product.sku) и обрабатываются пачками:
+одним запросом читаются существующие товары пачки, новые добавляются bulk_create,
+изменившиеся - bulk_update только по изменившимся полям, совпадающие не записываются.
+Колонки, кроме sku, необязательны: файл «sku,price,stock» обновляет только цены и остатки.
+Для новых товаров нужны name и price.
+
+bulk_create/bulk_update не вызывают сигналы, поэтому кэш каталога сбрасывается и поисковый
+индекс обновляется явно - один раз на пачку.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .caching import invalidate
+from .catalog import CATALOG_CACHE
+from .models import Product
+from . import search
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FORMATS = ('csv', 'json')
+# Поля, которые можно загрузить; sku - ключ сопоставления
+IMPORT_FIELDS = ('name', 'description', 'price', 'category', 'stock')
+REQUIRED_FOR_CREATE = ('name', 'price')
+# Изменение этих полей требует обновить поисковый индекс
+SEARCH_FIELDS = {'name', 'description', 'category'}
+# Не больше стольких ошибок хранится в отчёте
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'Строка {line}: {message}')
+
+
+def detect_format(filename):
+    return 'json' if filename.lower().endswith(('.json', '.jsonl')) else 'csv'
+
+
+def read_rows(stream, file_format='csv'):
+    """
+    Построчно читает текстовый поток, возвращает пары (номер строки, словарь).
+    JSON - массив объектов или JSON Lines (по объекту в строке).
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if not first:
+        return
+    if first == '[':
+        # Массив целиком: JSON не читается по частям стандартной библиотекой
+        rows = json.loads(first + stream.read())
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+        return
+    for number, line in enumerate(_prepend(first, stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            # Строку не разобрать - parse_row сообщит об ошибке в ней, загрузка продолжится
+            yield number, line
+
+
+def _prepend(first, stream):
+    # Возвращает уже прочитанный первый символ в начало первой строки
+    lines = iter(stream)
+    yield first + next(lines, '')
+    yield from lines
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def parse_row(row):
+    """Проверяет строку файла, возвращает (sku, {поле: значение}) только по заполненным колонкам."""
+    if not isinstance(row, dict):
+        raise ImportRowError('ожидался объект с полями товара')
+    sku = _text(row.get('sku'))
+    if not sku:
+        raise ImportRowError('не указан sku')
+    if len(sku) > Product._meta.get_field('sku').max_length:
+        raise ImportRowError('слишком длинный sku')
+
+    values = {}
+    for name in IMPORT_FIELDS:
+        raw = row.get(name)
+        if raw is None or (_text(raw) == '' and name != 'description'):
+            continue
+        value = _text(raw)
+        if name == 'price':
+            try:
+                value = Decimal(value.replace(',', '.')).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                raise ImportRowError(f'некорректная цена «{raw}»')
+            if value <= 0:
+                raise ImportRowError('цена должна быть положительной')
+        elif name == 'stock':
+            try:
+                value = int(value)
+            except ValueError:
+                raise ImportRowError(f'некорректный остаток «{raw}»')
+            if value < 0:
+                raise ImportRowError('остаток не может быть отрицательным')
+        elif name == 'category' and value not in dict(Product.CATEGORY_CHOICES):
+            raise ImportRowError(f'неизвестная категория «{raw}»')
+        elif name == 'name' and len(value) > Product._meta.get_field('name').max_length:
+            raise ImportRowError('слишком длинное название')
+        values[name] = value
+    return sku, values
+
+
+def _apply_batch(batch, user, result, dry_run):
+    existing = Product.objects.filter(sku__in=batch.keys()).only('id', 'sku', *IMPORT_FIELDS).in_bulk(field_name='sku')
+    to_create, to_update, update_fields = [], [], set()
+    for sku, (line, values) in batch.items():
+        product = existing.get(sku)
+        if product is None:
+            missing = [name for name in REQUIRED_FOR_CREATE if name not in values]
+            if missing:
+                result.add_error(line, f"для нового товара нужны поля: {', '.join(missing)}")
+                continue
+            to_create.append(Product(sku=sku, created_by=user, **{'description': '', **values}))
+            continue
+        changed = {name for name, value in values.items() if getattr(product, name) != value}
+        if not changed:
+            result.unchanged += 1
+            continue
+        for name in changed:
+            setattr(product, name, values[name])
+        to_update.append(product)
+        update_fields |= changed
+
+    result.inserted += len(to_create)
+    result.updated += len(to_update)
+    if dry_run or not (to_create or to_update):
+        return
+
+    with transaction.atomic():
+        created = Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update, sorted(update_fields))
+        reindex = list(created) + (to_update if update_fields & SEARCH_FIELDS else [])
+        if reindex:
+            search.index_products(reindex)
+        invalidate(CATALOG_CACHE)
+
+
+def import_products(rows, user, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Загружает строки (пары (номер строки, словарь), см. read_rows). Новые товары создаются
+    от имени user. При dry_run только считает, что было бы добавлено и изменено.
+    """
+    result = ImportResult()
+    batch = {}
+    for line, row in rows:
+        try:
+            sku, values = parse_row(row)
+        except ImportRowError as e:
+            result.add_error(line, str(e))
+            continue
+        if sku in batch:
+            # Повтор артикула в пачке: последняя строка дополняет и перекрывает предыдущие
+            values = {**batch[sku][1], **values}
+        batch[sku] = (line, values)
+        if len(batch) >= batch_size:
+            _apply_batch(batch, user, result, dry_run)
+            batch = {}
+    if batch:
+        _apply_batch(batch, user, result, dry_run)
+    return result
@@ -0,0 +1,56 @@
+# core/ratings.py
+"""
+Рейтинг товаров по отзывам.
+
+Product хранит сумму и количество оценок (rating_sum, rating_count) и средний рейтинг
+current_rating. При сохранении и удалении отзыва (core.signals) они меняются одним
+UPDATE с F()-выражениями, без пересчёта Avg по всем отзывам товара. Расхождения
+(массовые загрузки, правки в обход ORM) исправляет reconcile_ratings / команда reconcile_ratings.
+"""
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .caching import invalidate
+from .catalog import CATALOG_CACHE
+from .models import Product, Review
+
+
+def _average(rating_sum, rating_count):
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)), Value(0.0))
+
+
+def apply_rating(product_id, rating, sign=1):
+    """Добавляет (sign=1) или убирает (sign=-1) оценку товара."""
+    delta_sum, delta_count = sign * rating, sign
+    # В правой части UPDATE все колонки берутся до изменения, поэтому среднее считается от новых значений явно
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=F('rating_sum') + delta_sum,
+        rating_count=F('rating_count') + delta_count,
+        current_rating=_average(F('rating_sum') + delta_sum, F('rating_count') + delta_count),
+    )
+
+
+def reconcile_ratings(products=None, batch_size=500):
+    """
+    Пересчитывает сумму и количество оценок по отзывам у товаров, где они разошлись.
+    Возвращает количество исправленных товаров.
+    """
+    products = Product.objects.all() if products is None else products
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    actual_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')[:1]), 0,
+                          output_field=IntegerField())
+    actual_count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')[:1]), 0,
+                            output_field=IntegerField())
+    drifted = list(
+        products.annotate(actual_sum=actual_sum, actual_count=actual_count)
+        .filter(~Q(rating_sum=F('actual_sum')) | ~Q(rating_count=F('actual_count'))
+                | ~Q(current_rating=_average(F('actual_sum'), F('actual_count'))))
+        .values_list('pk', flat=True)
+    )
+    for start in range(0, len(drifted), batch_size):
+        Product.objects.filter(pk__in=drifted[start:start + batch_size]).update(
+            rating_sum=actual_sum, rating_count=actual_count, current_rating=_average(actual_sum, actual_count),
+        )
+    if drifted:
+        invalidate(CATALOG_CACHE)
+    return len(drifted)
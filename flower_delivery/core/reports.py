@@ -0,0 +1,400 @@
+# core/reports.py
+"""
+Единый движок отчётов по продажам.
+
+Отчёт описывается спецификацией ReportQuery (период, статусы заказов, группировка)
+и строится функцией run_report за фиксированное число SQL-запросов:
+итоги, количество уникальных клиентов и временной ряд/разбивка - по одному запросу.
+Для доставленных заказов итоги и ряды читаются из дневных сводок (core.rollups),
+для остальных статусов - агрегируются по OrderItem.
+"""
+import logging
+from dataclasses import dataclass, field
+import calendar
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .caching import get_or_compute, register_namespace, versioned_key
+from .models import DailyCategorySales, DailySales, Order, OrderItem, Product, ProductDailySales, Report, ReportWatermark
+
+logger = logging.getLogger(__name__)
+
+GROUP_DAY = 'day'
+GROUP_WEEK = 'week'
+GROUP_MONTH = 'month'
+GROUP_CATEGORY = 'category'
+GROUP_PRODUCT = 'product'
+
+TIME_GROUPINGS = {
+    GROUP_DAY: TruncDay,
+    GROUP_WEEK: TruncWeek,
+    GROUP_MONTH: TruncMonth,
+}
+GROUPINGS = (GROUP_DAY, GROUP_WEEK, GROUP_MONTH, GROUP_CATEGORY, GROUP_PRODUCT)
+
+DELIVERED_ONLY = ('delivered',)
+
+# Версия кэша отчётов увеличивается при любой записи Order/OrderItem/Report (см. core.signals)
+REPORTS_CACHE = register_namespace('reports')
+REPORT_CACHE_TIMEOUT = 60 * 60
+
+
+def parse_date(value):
+    """Разбирает дату ГГГГ-ММ-ДД; некорректные значения игнорируются."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        logger.error(f"Invalid date format: {value}")
+        return None
+
+
+@dataclass(frozen=True)
+class ReportQuery:
+    """Спецификация отчёта. Границы периода включительные, None - без ограничения."""
+    start: Optional[date] = None
+    end: Optional[date] = None
+    statuses: tuple = DELIVERED_ONLY
+    group_by: str = GROUP_DAY
+    limit: Optional[int] = None  # только для группировок по категориям и товарам
+
+    def __post_init__(self):
+        if self.group_by not in GROUPINGS:
+            raise ValueError(f"Неизвестная группировка: {self.group_by}")
+        valid_statuses = dict(Order.STATUS_CHOICES)
+        if not self.statuses or any(status not in valid_statuses for status in self.statuses):
+            raise ValueError(f"Некорректные статусы заказов: {self.statuses}")
+        object.__setattr__(self, 'statuses', tuple(sorted(self.statuses)))
+
+    @classmethod
+    def last_days(cls, days, **kwargs):
+        end = timezone.localdate()
+        return cls(start=end - timedelta(days=days), end=end, **kwargs)
+
+    @classmethod
+    def from_params(cls, params, default_days=None, **kwargs):
+        """Строит спецификацию из GET-параметров start_date/end_date."""
+        start = parse_date(params.get('start_date'))
+        end = parse_date(params.get('end_date'))
+        if not start and not end and default_days:
+            return cls.last_days(default_days, **kwargs)
+        return cls(start=start, end=end, **kwargs)
+
+    @property
+    def uses_rollup(self):
+        return self.statuses == DELIVERED_ONLY
+
+
+@dataclass
+class SeriesPoint:
+    key: object
+    label: str
+    total_sales: Decimal
+    total_orders: Optional[int] = None
+    total_quantity: Optional[int] = None
+
+
+@dataclass
+class SalesReport:
+    query: ReportQuery
+    total_sales: Decimal
+    total_orders: int
+    total_customers: int
+    series: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'total_sales': self.total_sales,
+            'total_orders': self.total_orders,
+            'total_customers': self.total_customers,
+        }
+
+
+def _filter_period(queryset, query, date_lookup):
+    if query.start:
+        queryset = queryset.filter(**{f'{date_lookup}__gte': query.start})
+    if query.end:
+        queryset = queryset.filter(**{f'{date_lookup}__lte': query.end})
+    return queryset
+
+
+def _label(key):
+    return key.strftime('%Y-%m-%d') if isinstance(key, (date, datetime)) else str(key)
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+TOP_BY_QUANTITY = 'quantity'
+TOP_BY_SALES = 'sales'
+
+
+def _product_rollup_series(query, by=TOP_BY_QUANTITY):
+    rows = _filter_period(ProductDailySales.objects.all(), query, 'date').values(
+        'product_id', name=F('product__name'),
+    ).annotate(sales=Sum('total_sales'), quantity=Sum('total_quantity'))
+    if by == TOP_BY_SALES:
+        rows = rows.order_by('-sales', '-quantity', 'product_id')
+    else:
+        rows = rows.order_by('-quantity', '-sales', 'product_id')
+    if query.limit:
+        rows = rows[:query.limit]
+    return [
+        SeriesPoint(key=row['product_id'], label=row['name'], total_sales=row['sales'], total_quantity=row['quantity'])
+        for row in rows
+    ]
+
+
+def top_products(start=None, end=None, limit=10, by=TOP_BY_QUANTITY):
+    """
+    Топ товаров по проданному количеству (by='quantity') или выручке (by='sales')
+    за произвольный период - одним запросом к дневным счётчикам товаров.
+    """
+    if by not in (TOP_BY_QUANTITY, TOP_BY_SALES):
+        raise ValueError(f"Неизвестный критерий топа: {by}")
+    return _product_rollup_series(ReportQuery(start=start, end=end, group_by=GROUP_PRODUCT, limit=limit), by=by)
+
+
+def _rollup_series(query):
+    if query.group_by == GROUP_PRODUCT:
+        return _product_rollup_series(query)
+
+    if query.group_by == GROUP_CATEGORY:
+        categories = dict(Product.CATEGORY_CHOICES)
+        rows = _filter_period(DailyCategorySales.objects.all(), query, 'date').values('category').annotate(
+            sales=Sum('total_sales'), quantity=Sum('total_quantity'),
+        ).order_by('-quantity', 'category')
+        if query.limit:
+            rows = rows[:query.limit]
+        return [
+            SeriesPoint(key=row['category'], label=str(categories.get(row['category'], row['category'])),
+                        total_sales=row['sales'], total_quantity=row['quantity'])
+            for row in rows
+        ]
+
+    rows = _filter_period(DailySales.objects.all(), query, 'date')
+    if query.group_by == GROUP_DAY:
+        rows = rows.values(bucket=F('date')).annotate(sales=Sum('total_sales'), orders=Sum('total_orders'))
+    else:
+        trunc = TIME_GROUPINGS[query.group_by]
+        rows = rows.annotate(bucket=trunc('date')).values('bucket').annotate(
+            sales=Sum('total_sales'), orders=Sum('total_orders'),
+        )
+    return [
+        SeriesPoint(key=_as_date(row['bucket']), label=_label(row['bucket']),
+                    total_sales=row['sales'], total_orders=row['orders'])
+        for row in rows.order_by('bucket')
+    ]
+
+
+def _source_series(query, items):
+    if query.group_by in TIME_GROUPINGS:
+        trunc = TIME_GROUPINGS[query.group_by]
+        rows = items.annotate(bucket=trunc('order__created_at')).values('bucket').annotate(
+            sales=Sum('line_total'), orders=Count('order', distinct=True), line_quantity=Sum('quantity'),
+        ).order_by('bucket')
+        return [
+            SeriesPoint(key=_as_date(row['bucket']), label=_label(_as_date(row['bucket'])),
+                        total_sales=row['sales'], total_orders=row['orders'], total_quantity=row['line_quantity'])
+            for row in rows
+        ]
+
+    if query.group_by == GROUP_CATEGORY:
+        categories = dict(Product.CATEGORY_CHOICES)
+        rows = items.values(bucket=F('product__category')).annotate(
+            sales=Sum('line_total'), orders=Count('order', distinct=True), line_quantity=Sum('quantity'),
+        )
+        label = lambda row: str(categories.get(row['bucket'], row['bucket']))
+    else:
+        rows = items.values(bucket=F('product_id'), name=F('product__name')).annotate(
+            sales=Sum('line_total'), orders=Count('order', distinct=True), line_quantity=Sum('quantity'),
+        )
+        label = lambda row: row['name']
+    rows = rows.order_by('-line_quantity', 'bucket')
+    if query.limit:
+        rows = rows[:query.limit]
+    return [
+        SeriesPoint(key=row['bucket'], label=label(row), total_sales=row['sales'],
+                    total_orders=row['orders'], total_quantity=row['line_quantity'])
+        for row in rows
+    ]
+
+
+def report_data_version(query):
+    """
+    Версия данных отчёта: меняется при любом изменении сводки (или заказов) за период.
+    Используется как часть ключа для кэшируемых артефактов отчёта.
+    """
+    if query.uses_rollup:
+        rows = _filter_period(DailySales.objects.all(), query, 'date')
+    else:
+        rows = _filter_period(Order.objects.filter(status__in=query.statuses), query, 'created_at__date')
+    state = rows.aggregate(updated=Max('updated_at'), count=Count('id'))
+    updated = state['updated'].isoformat() if state['updated'] else ''
+    return f"{state['count']}:{updated}"
+
+
+def run_report(query):
+    """Строит отчёт по спецификации: ровно три SQL-запроса независимо от объёма заказов."""
+    orders = _filter_period(Order.objects.filter(status__in=query.statuses), query, 'created_at__date')
+
+    if query.uses_rollup:
+        totals = _filter_period(DailySales.objects.all(), query, 'date').aggregate(
+            sales=Sum('total_sales'), orders=Sum('total_orders'),
+        )
+        total_customers = orders.aggregate(customers=Count('user', distinct=True))['customers']
+        series = _rollup_series(query)
+    else:
+        items = _filter_period(
+            OrderItem.objects.filter(order__status__in=query.statuses), query, 'order__created_at__date'
+        )
+        order_totals = orders.aggregate(orders=Count('id'), customers=Count('user', distinct=True))
+        totals = {
+            'sales': items.aggregate(sales=Sum('line_total'))['sales'],
+            'orders': order_totals['orders'],
+        }
+        total_customers = order_totals['customers']
+        series = _source_series(query, items)
+
+    report = SalesReport(
+        query=query,
+        total_sales=totals['sales'] or 0,
+        total_orders=totals['orders'] or 0,
+        total_customers=total_customers or 0,
+        series=series,
+    )
+    logger.debug(f"Report Data: {report}")
+    return report
+
+
+def cached_report(query, kind='sales'):
+    """run_report через кэш: ключ - тип отчёта, параметры запроса и версия данных."""
+    key = versioned_key(
+        REPORTS_CACHE, kind, query.start or '', query.end or '', ','.join(query.statuses), query.group_by, query.limit or '',
+    )
+    return get_or_compute(REPORTS_CACHE, key, lambda: run_report(query), REPORT_CACHE_TIMEOUT)
+
+
+# Сохранённые отчёты за периоды (модель Report): день, неделя или месяц
+
+PERIOD_GRANULARITIES = (GROUP_DAY, GROUP_WEEK, GROUP_MONTH)
+# Запас для транзакций, которые ещё не зафиксированы к моменту чтения заказов
+WATERMARK_LAG = timedelta(minutes=1)
+
+
+def period_bounds(day, granularity=GROUP_DAY):
+    """Границы периода (включительно), которому принадлежит день."""
+    if granularity == GROUP_DAY:
+        return day, day
+    if granularity == GROUP_WEEK:
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if granularity == GROUP_MONTH:
+        start = day.replace(day=1)
+        return start, day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    raise ValueError(f"Неизвестная периодичность отчёта: {granularity}")
+
+
+def period_starts(start, end, granularity=GROUP_DAY):
+    """Начала всех периодов, пересекающихся с интервалом [start, end]."""
+    starts = []
+    current = period_bounds(start, granularity)[0]
+    while current <= end:
+        starts.append(current)
+        current = period_bounds(current, granularity)[1] + timedelta(days=1)
+    return starts
+
+
+def compute_period_totals(granularity, period_start):
+    """
+    Итоги за период в виде простых значений: функция выполняется и в дочерних процессах
+    (generate_reports --backfill), поэтому принимает и возвращает только сериализуемые данные.
+    """
+    if isinstance(period_start, str):
+        period_start = parse_date(period_start)
+    start, end = period_bounds(period_start, granularity)
+    report = run_report(ReportQuery(start=start, end=end))
+    return {
+        'granularity': granularity,
+        'period_start': start,
+        'period_end': end,
+        'total_sales': report.total_sales,
+        'total_orders': report.total_orders,
+        'total_customers': report.total_customers,
+    }
+
+
+def save_period_report(totals):
+    """Создаёт или обновляет отчёт за период; повторный запуск не плодит дубли."""
+    report, _ = Report.objects.update_or_create(
+        granularity=totals['granularity'],
+        period_start=totals['period_start'],
+        defaults={
+            'period_end': totals['period_end'],
+            'total_sales': totals['total_sales'],
+            'total_orders': totals['total_orders'],
+            'total_customers': totals['total_customers'],
+        },
+    )
+    return report
+
+
+def generate_period_report(day, granularity=GROUP_DAY):
+    return save_period_report(compute_period_totals(granularity, period_bounds(day, granularity)[0]))
+
+
+def cached_period_reports():
+    """Все сохранённые отчёты для списка /reports/, через кэш отчётов."""
+    return get_or_compute(
+        REPORTS_CACHE, versioned_key(REPORTS_CACHE, 'period_reports'),
+        lambda: list(Report.objects.order_by('granularity', '-period_start', '-created_at')),
+        REPORT_CACHE_TIMEOUT,
+    )
+
+
+def missing_period_starts(start, end, granularity=GROUP_DAY):
+    """Периоды из интервала, для которых ещё нет сохранённого отчёта."""
+    starts = period_starts(start, end, granularity)
+    existing = set(Report.objects.filter(granularity=granularity, period_start__in=starts)
+                   .values_list('period_start', flat=True))
+    return [period_start for period_start in starts if period_start not in existing]
+
+
+def generate_incremental_reports(granularity=GROUP_DAY, now=None):
+    """
+    Пересчитывает отчёты только за периоды, в которых менялись заказы с прошлого запуска.
+    Изменённые дни берутся из Order.updated_at и из дневной сводки продаж: позиции доставленных
+    заказов и удаление заказов не меняют Order.updated_at, но обновляют строку DailySales за день
+    заказа (core.rollups). Отметка (ReportWatermark) хранит момент, до которого изменения уже
+    учтены; она сдвигается только после успешного сохранения всех отчётов.
+    Возвращает список обновлённых отчётов.
+    """
+    name = f'reports:{granularity}'
+    watermark = ReportWatermark.objects.filter(name=name).values_list('value', flat=True).first()
+    until = (now or timezone.now()) - WATERMARK_LAG
+
+    orders = Order.objects.filter(updated_at__lte=until)
+    rollup_days = DailySales.objects.filter(updated_at__lte=until)
+    if watermark:
+        orders = orders.filter(updated_at__gt=watermark)
+        rollup_days = rollup_days.filter(updated_at__gt=watermark)
+    days = set(orders.dates('created_at', 'day')) | set(rollup_days.values_list('date', flat=True))
+    starts = sorted({period_bounds(day, granularity)[0] for day in days})
+
+    with transaction.atomic():
+        reports = [save_period_report(compute_period_totals(granularity, start)) for start in starts]
+        ReportWatermark.objects.update_or_create(name=name, defaults={'value': until})
+    logger.info(f"Инкрементальная генерация отчётов ({granularity}): обновлено {len(reports)}")
+    return reports
@@ -0,0 +1,142 @@
+# core/reservations.py
+"""
+Временные резервы товаров за корзинами.
+
+Добавление в корзину и начало оформления заказа резервируют количество товара за владельцем
+корзины ('user:<id>' или 'anon:<токен>') на STOCK_RESERVATION_TTL секунд. Доступный остаток -
+Product.stock минус действующие резервы других владельцев: сумма по индексу (product, expires_at).
+При оформлении (core.checkout) остаток списывается с учётом чужих резервов, а резервы
+покупателя удаляются. Истёкшие резервы пачками удаляет периодическая задача
+core.tasks.release_expired_reservations; до этого они просто не учитываются.
+"""
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+RELEASE_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Shortage:
+    product_id: int
+    name: str
+    requested: int
+    available: int
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(f'{item.name}: доступно {item.available} из {item.requested}' for item in shortages))
+
+    def as_json(self):
+        return [asdict(item) for item in self.shortages]
+
+
+def reservation_ttl():
+    return timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def user_owner(user):
+    return f'user:{user.pk}'
+
+
+def anonymous_owner(token):
+    return f'anon:{token}'
+
+
+def live_reservations(owner=None):
+    """Действующие резервы; owner - исключить резервы этого владельца."""
+    reservations = StockReservation.objects.filter(expires_at__gt=timezone.now())
+    return reservations.exclude(owner=owner) if owner else reservations
+
+
+def held_by_others(product_ids, owner=None):
+    """{id товара: количество в действующих резервах других владельцев} - один запрос."""
+    return dict(
+        live_reservations(owner).filter(product_id__in=product_ids).order_by()
+        .values_list('product_id').annotate(total=Sum('quantity'))
+    )
+
+
+def held_subquery(owner=None):
+    """Сумма чужих действующих резервов товара для аннотаций и условий UPDATE (0, если резервов нет)."""
+    total = (
+        live_reservations(owner).filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(total=Sum('quantity')).values('total')[:1]
+    )
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def available_stock(product_ids, owner=None):
+    """{id товара: остаток, доступный владельцу}."""
+    held = held_by_others(product_ids, owner)
+    return {
+        product_id: max(stock - held.get(product_id, 0), 0)
+        for product_id, stock in Product.objects.filter(pk__in=product_ids).values_list('id', 'stock')
+    }
+
+
+def hold(owner, quantities):
+    """
+    Резервирует за владельцем {id товара: количество} на reservation_ttl() (заменяя прежние резервы
+    этих товаров). Количество 0 снимает резерв. Если чего-то не хватает, ничего не меняется и
+    выбрасывается InsufficientStock с нехваткой по каждой позиции. Возвращает множество id
+    найденных товаров (несуществующие пропускаются).
+    """
+    if not quantities:
+        return set()
+    with transaction.atomic():
+        # Блокировка строк товаров упорядочивает одновременные резервы одного товара
+        products = list(
+            Product.objects.select_for_update().filter(pk__in=quantities.keys()).order_by('id')
+            .values_list('id', 'name', 'stock')
+        )
+        held = held_by_others(quantities.keys(), owner)
+        shortages = [
+            Shortage(product_id, name, quantities[product_id], max(stock - held.get(product_id, 0), 0))
+            for product_id, name, stock in products
+            if quantities[product_id] > 0 and quantities[product_id] > stock - held.get(product_id, 0)
+        ]
+        if shortages:
+            raise InsufficientStock(sorted(shortages, key=lambda item: item.name))
+
+        expires_at = timezone.now() + reservation_ttl()
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(product_id=product_id, owner=owner, quantity=quantities[product_id],
+                                 expires_at=expires_at)
+                for product_id, _, _ in products if quantities[product_id] > 0
+            ],
+            update_conflicts=True, unique_fields=['product', 'owner'], update_fields=['quantity', 'expires_at'],
+        )
+        released = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if released:
+            release(owner, released)
+    return {product_id for product_id, _, _ in products}
+
+
+def release(owner, product_ids=None):
+    """Снимает резервы владельца (все или по товарам)."""
+    reservations = StockReservation.objects.filter(owner=owner)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    return reservations.delete()[0]
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE):
+    """Удаляет истёкшие резервы пачками, чтобы не держать длинную блокировку. Возвращает их число."""
+    now = timezone.now()
+    released = 0
+    while True:
+        ids = list(StockReservation.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return released
+        released += StockReservation.objects.filter(id__in=ids).delete()[0]
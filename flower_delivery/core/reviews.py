@@ -0,0 +1,83 @@
+# core/reviews.py
+"""
+Отзывы на странице товара.
+
+Отзывы выводятся от новых к старым страницами по ключу (created_at, id) без OFFSET,
+см. core.pagination; индекс (product, created_at, id) модели Review покрывает и фильтр, и порядок.
+Первая страница и распределение оценок кэшируются отдельно для каждого товара:
+версия пространства имён reviews:<id товара> увеличивается при сохранении и удалении
+его отзывов (core.signals), поэтому отзыв к одному товару не сбрасывает кэш остальных.
+"""
+from django.db.models import Count
+
+from .caching import get_or_compute, invalidate, register_namespace, versioned_key
+from .models import Review
+from .pagination import KeysetPaginator
+
+REVIEWS_CACHE = register_namespace('reviews')
+REVIEWS_CACHE_TIMEOUT = 60 * 60
+REVIEWS_PAGE_SIZE = 10
+REVIEWS_ORDERING = ('-created_at', '-id')
+RATING_VALUES = (5, 4, 3, 2, 1)
+
+
+def _product_namespace(product_id):
+    return f'{REVIEWS_CACHE}:{product_id}'
+
+
+def invalidate_product_reviews(product_id):
+    invalidate(_product_namespace(product_id))
+
+
+def _serialize(review):
+    # В кэш попадают только поля, нужные шаблону
+    return {
+        'username': review.user.username,
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at,
+    }
+
+
+def _histogram(product_id):
+    counts = dict(
+        Review.objects.filter(product_id=product_id).order_by()
+        .values_list('rating').annotate(count=Count('pk'))
+    )
+    total = sum(counts.values())
+    return total, [
+        {'rating': rating, 'count': counts.get(rating, 0),
+         'percent': round(counts.get(rating, 0) * 100 / total) if total else 0}
+        for rating in RATING_VALUES
+    ]
+
+
+def _reviews_page(product_id, cursor=None):
+    reviews = (
+        Review.objects.filter(product_id=product_id).select_related('user')
+        .only('rating', 'comment', 'created_at', 'user__username')
+    )
+    page = KeysetPaginator(reviews, REVIEWS_ORDERING, REVIEWS_PAGE_SIZE).get_page(cursor)
+    return {
+        'reviews': [_serialize(review) for review in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+def _first_page(product_id):
+    total, histogram = _histogram(product_id)
+    return {**_reviews_page(product_id), 'total': total, 'histogram': histogram}
+
+
+def product_reviews(product_id, cursor=None):
+    """
+    Страница отзывов товара с распределением оценок. Первая страница берётся из кэша,
+    следующие (по cursor) - из базы данных, распределение - всегда из кэша.
+    """
+    namespace = _product_namespace(product_id)
+    key = versioned_key(namespace, 'first_page')
+    first = get_or_compute(REVIEWS_CACHE, key, lambda: _first_page(product_id), REVIEWS_CACHE_TIMEOUT)
+    if not cursor:
+        return first
+    return {**_reviews_page(product_id, cursor), 'total': first['total'], 'histogram': first['histogram']}
@@ -0,0 +1,206 @@
+# core/rollups.py
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caching import invalidate
+from .reports import REPORTS_CACHE
+from .catalog import CATALOG_CACHE
+from .models import DailyCategorySales, DailySales, Order, OrderItem, Product, ProductDailySales
+
+logger = logging.getLogger(__name__)
+
+DELIVERED = 'delivered'
+
+
+def order_day(order):
+    """День заказа в текущем часовом поясе (так же считает lookup created_at__date)."""
+    return timezone.localdate(order.created_at)
+
+
+def _bump(model, lookup, deltas):
+    """Атомарно прибавляет deltas к строке сводки, создавая её при необходимости."""
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    changes['updated_at'] = timezone.now()
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        model.objects.filter(**lookup).update(**changes)
+
+
+def apply_to_rollup(day, orders=0, lines=None, products=None, sign=1):
+    """
+    Применяет изменение к сводке за день.
+    lines - словарь {категория: (количество, сумма)}, products - {id товара: (количество, сумма)}.
+    """
+    lines = lines or {}
+    products = products or {}
+    total_sales = sum((sales for _, sales in lines.values()), Decimal('0'))
+    if orders or total_sales:
+        _bump(DailySales, {'date': day}, {
+            'total_orders': sign * orders,
+            'total_sales': sign * total_sales,
+        })
+    for category, (quantity, sales) in lines.items():
+        _bump(DailyCategorySales, {'date': day, 'category': category}, {
+            'total_quantity': sign * quantity,
+            'total_sales': sign * sales,
+        })
+    for product_id, (quantity, sales) in products.items():
+        _bump(ProductDailySales, {'date': day, 'product_id': product_id}, {
+            'total_quantity': sign * quantity,
+            'total_sales': sign * sales,
+        })
+
+
+def order_lines(order):
+    """
+    Агрегирует позиции заказа одним запросом.
+    Возвращает пару словарей: по категориям и по товарам.
+    """
+    rows = order.items.values('product_id', 'product__category').annotate(
+        line_quantity=Sum('quantity'),
+        line_sales=Sum('line_total'),
+    )
+    lines = defaultdict(lambda: (0, Decimal('0')))
+    products = {}
+    for row in rows:
+        quantity, sales = lines[row['product__category']]
+        lines[row['product__category']] = (quantity + row['line_quantity'], sales + row['line_sales'])
+        products[row['product_id']] = (row['line_quantity'], row['line_sales'])
+    return dict(lines), products
+
+
+def apply_order(order, sign=1):
+    """Учитывает (sign=1) или исключает (sign=-1) доставленный заказ в сводке."""
+    lines, products = order_lines(order)
+    apply_to_rollup(order_day(order), orders=1, lines=lines, products=products, sign=sign)
+
+
+def apply_item(item, sign=1, with_product=True):
+    """
+    Учитывает отдельную позицию доставленного заказа в сводке.
+    with_product=False не трогает дневные счётчики товара (товар удаляется вместе с ними).
+    """
+    lines = {item.product.category: (item.quantity, item.line_total)}
+    products = {item.product_id: (item.quantity, item.line_total)} if with_product else None
+    apply_to_rollup(order_day(item.order), lines=lines, products=products, sign=sign)
+
+
+def rebuild_sales_rollup(start_date=None, end_date=None):
+    """
+    Полностью пересчитывает сводку за период (или за всю историю) по исходным заказам.
+    Возвращает количество пересчитанных дней.
+    """
+    orders = Order.objects.filter(status=DELIVERED)
+    items = OrderItem.objects.filter(order__status=DELIVERED)
+    daily = DailySales.objects.all()
+    by_category = DailyCategorySales.objects.all()
+    by_product = ProductDailySales.objects.all()
+    if start_date:
+        orders = orders.filter(created_at__date__gte=start_date)
+        items = items.filter(order__created_at__date__gte=start_date)
+        daily = daily.filter(date__gte=start_date)
+        by_category = by_category.filter(date__gte=start_date)
+        by_product = by_product.filter(date__gte=start_date)
+    if end_date:
+        orders = orders.filter(created_at__date__lte=end_date)
+        items = items.filter(order__created_at__date__lte=end_date)
+        daily = daily.filter(date__lte=end_date)
+        by_category = by_category.filter(date__lte=end_date)
+        by_product = by_product.filter(date__lte=end_date)
+
+    order_counts = orders.annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('id'))
+    category_rows = items.annotate(day=TruncDate('order__created_at')).values('day', 'product__category').annotate(
+        line_quantity=Sum('quantity'),
+        line_sales=Sum('line_total'),
+    )
+    product_rows = items.annotate(day=TruncDate('order__created_at')).values('day', 'product_id').annotate(
+        line_quantity=Sum('quantity'),
+        line_sales=Sum('line_total'),
+    )
+
+    days = defaultdict(lambda: {'total_orders': 0, 'total_sales': Decimal('0')})
+    for row in order_counts:
+        days[row['day']]['total_orders'] = row['count']
+    categories = []
+    for row in category_rows:
+        days[row['day']]['total_sales'] += row['line_sales'] or 0
+        categories.append(DailyCategorySales(
+            date=row['day'],
+            category=row['product__category'],
+            total_quantity=row['line_quantity'],
+            total_sales=row['line_sales'] or 0,
+        ))
+    products = [
+        ProductDailySales(
+            date=row['day'],
+            product_id=row['product_id'],
+            total_quantity=row['line_quantity'],
+            total_sales=row['line_sales'] or 0,
+        )
+        for row in product_rows
+    ]
+
+    with transaction.atomic():
+        daily.delete()
+        by_category.delete()
+        by_product.delete()
+        DailySales.objects.bulk_create(
+            [DailySales(date=day, **values) for day, values in days.items()], batch_size=500
+        )
+        DailyCategorySales.objects.bulk_create(categories, batch_size=500)
+        ProductDailySales.objects.bulk_create(products, batch_size=500)
+
+    invalidate(REPORTS_CACHE)
+    logger.info(f"Сводка продаж пересчитана: {len(days)} дн.")
+    return len(days)
+
+
+POPULARITY_HALF_LIFE_DAYS = 14
+POPULARITY_WINDOW_DAYS = 90
+POPULAR_PRODUCTS_LIMIT = 8
+
+
+def update_popular_products(half_life_days=POPULARITY_HALF_LIFE_DAYS, window_days=POPULARITY_WINDOW_DAYS,
+                            limit=POPULAR_PRODUCTS_LIMIT, today=None):
+    """
+    Пересчитывает popularity_score и is_popular по дневным счётчикам товаров.
+    Продажи за день весят 0.5 ** (возраст в днях / half_life_days), учитываются последние window_days дней;
+    популярными становятся limit товаров с наибольшей положительной оценкой.
+    Возвращает список id популярных товаров.
+    """
+    today = today or timezone.localdate()
+    rows = ProductDailySales.objects.filter(
+        date__gt=today - timedelta(days=window_days), date__lte=today, total_quantity__gt=0,
+    ).values_list('product_id', 'date', 'total_quantity')
+
+    scores = defaultdict(float)
+    for product_id, day, quantity in rows.iterator(chunk_size=2000):
+        scores[product_id] += quantity * 0.5 ** ((today - day).days / half_life_days)
+    popular = [product_id for product_id, _ in sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]]
+
+    with transaction.atomic():
+        Product.objects.exclude(pk__in=scores.keys()).exclude(popularity_score=0, is_popular=False).update(
+            popularity_score=0, is_popular=False,
+        )
+        changed = list(Product.objects.filter(pk__in=scores.keys()).only('id', 'popularity_score', 'is_popular'))
+        for product in changed:
+            product.popularity_score = round(scores[product.pk], 4)
+            product.is_popular = product.pk in popular
+        Product.objects.bulk_update(changed, ['popularity_score', 'is_popular'], batch_size=500)
+    # Массовые обновления не вызывают сигналы - отметки «Популярно» в каталоге сбрасываем явно
+    invalidate(CATALOG_CACHE)
+
+    logger.info(f"Популярность товаров пересчитана: {len(scores)} с продажами, популярных {len(popular)}")
+    return popular
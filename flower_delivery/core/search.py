@@ -0,0 +1,214 @@
+# core/search.py
+"""
+Полнотекстовый поиск товаров по названию, описанию и категории.
+
+Индекс - отдельная таблица core_product_search, которая обновляется при сохранении
+и удалении товара (core.signals) и целиком перестраивается rebuild_search_index()
+после массовых загрузок (bulk_create сигналы не вызывает):
+- SQLite: виртуальная таблица FTS5 (rowid = id товара), ранжирование bm25;
+- PostgreSQL: колонка tsvector с GIN-индексом и словарём russian, ранжирование ts_rank.
+На остальных СУБД поиск выполняется через icontains без ранжирования.
+
+Запрос разбивается на слова, у русских слов отбрасываются окончания, и каждое слово
+ищется как префикс: «розы» находит «роза» и «розовый», «тюл» - «тюльпаны».
+"""
+import hashlib
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .caching import get_or_compute, versioned_key
+from .catalog import CATALOG_CACHE
+from .models import Product
+
+SEARCH_TABLE = 'core_product_search'
+SEARCH_LIMIT = 60
+SUGGEST_LIMIT = 8
+# Список товаров в админке фильтруется по id найденных, их число ограничено параметрами SQL-запроса
+ADMIN_SEARCH_LIMIT = 1000
+SUGGEST_CACHE_TIMEOUT = 10 * 60
+# Не больше стольких слов из запроса, остальные отбрасываются
+MAX_TERMS = 8
+MIN_STEM_LENGTH = 3
+
+# Веса колонок для bm25 (SQLite) и setweight (PostgreSQL): название, описание, категория
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0)
+
+# Окончания русских слов, от длинных к коротким (упрощённый стеммер)
+RUSSIAN_ENDINGS = (
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ий', 'ый', 'ой', 'ая', 'яя',
+    'ое', 'ее', 'ые', 'ие', 'ом', 'ем', 'ах', 'ях', 'ов', 'ев', 'ей', 'ам', 'ям', 'ую', 'юю', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+)
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def search_backend():
+    """Вид индекса для текущей СУБД: 'sqlite', 'postgresql' или None."""
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else None
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def stem(word):
+    if not _CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def query_terms(query):
+    """Основы слов запроса для поиска по префиксу."""
+    terms = []
+    for word in _WORD_RE.findall(normalize(query)):
+        term = stem(word)
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _category_label(product):
+    # Варианты берутся из поля, чтобы функция работала и с моделью из миграции
+    choices = dict(product._meta.get_field('category').choices or ())
+    return str(choices.get(product.category, product.category))
+
+
+def _index_rows(products):
+    return [
+        (product.pk, normalize(product.name), normalize(product.description), normalize(_category_label(product)))
+        for product in products
+    ]
+
+
+def _write_rows(cursor, rows):
+    backend = search_backend()
+    if backend == 'sqlite':
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)', rows,
+        )
+    elif backend == 'postgresql':
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'C') "
+            f"|| setweight(to_tsvector('russian', %s), 'B')) "
+            f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            rows,
+        )
+
+
+def index_product(product):
+    """Добавляет или обновляет товар в поисковом индексе."""
+    with connection.cursor() as cursor:
+        _write_rows(cursor, _index_rows([product]))
+
+
+def index_products(products):
+    """Добавляет или обновляет товары в индексе одной пачкой (после bulk_create/bulk_update)."""
+    if search_backend() is None:
+        return
+    with connection.cursor() as cursor:
+        _write_rows(cursor, _index_rows(products))
+
+
+def remove_product(product_id):
+    backend = search_backend()
+    if backend is None:
+        return
+    column = 'rowid' if backend == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {column} = %s', [product_id])
+
+
+def rebuild_search_index(products=None, batch_size=1000):
+    """
+    Перестраивает индекс по всем товарам (или по переданному queryset).
+    Возвращает количество проиндексированных товаров.
+    """
+    if search_backend() is None:
+        return 0
+    if products is None:
+        products = Product.objects.all()
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        products = products.only('id', 'name', 'description', 'category').order_by('id')
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) == batch_size:
+                _write_rows(cursor, _index_rows(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            _write_rows(cursor, _index_rows(batch))
+            count += len(batch)
+    return count
+
+
+def _ranked_ids(terms, limit):
+    limit_sql = ' LIMIT %s' if limit else ''
+    if search_backend() == 'sqlite':
+        # Каждое слово - префиксная фраза FTS5; кавычки исключают синтаксис запроса
+        match = ' AND '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        sql = (f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+               f'ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid{limit_sql}')
+        params = [match]
+    else:
+        # Словарь russian сам приводит слово к основе, :* делает его префиксом
+        match = ' & '.join(f'{term}:*' for term in terms)
+        sql = (f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('russian', %s) "
+               f"ORDER BY ts_rank(document, to_tsquery('russian', %s)) DESC, product_id{limit_sql}")
+        params = [match, match]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + ([limit] if limit else []))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_product_ids(query, limit=SEARCH_LIMIT):
+    """Id товаров, найденных по запросу, от наиболее релевантных; limit=None - без ограничения."""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if search_backend() is not None:
+        return _ranked_ids(terms, limit)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    ids = Product.objects.filter(condition).order_by('name', 'id').values_list('id', flat=True)
+    return list(ids[:limit] if limit else ids)
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """Найденные товары в порядке релевантности."""
+    ids = search_product_ids(query, limit)
+    products = Product.objects.in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Подсказки для строки поиска; кэшируются до изменения каталога."""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    digest = hashlib.sha1(' '.join(terms).encode()).hexdigest()
+    key = versioned_key(CATALOG_CACHE, 'suggest', digest, limit)
+
+    def compute():
+        ids = search_product_ids(query, limit)
+        products = Product.objects.only('id', 'name', 'price').in_bulk(ids)
+        return [
+            {'id': pk, 'name': products[pk].name, 'price': str(products[pk].price)}
+            for pk in ids if pk in products
+        ]
+
+    return get_or_compute(CATALOG_CACHE, key, compute, SUGGEST_CACHE_TIMEOUT)
@@ -1,11 +1,17 @@
 # core\signals.py
 from django.conf import settings
-from .models import Order, UserProfile
+from .models import Order, OrderItem, Product, Report, Review, UserProfile
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.contrib.auth.signals import user_logged_in
 from django.contrib.auth.models import User
 from .utils import send_telegram_message
+from . import cart, ratings, reviews, rollups
+from .caching import invalidate
+from .reports import REPORTS_CACHE
+from .catalog import CATALOG_CACHE
+from . import search
 from telegram import Bot
 
 logger = logging.getLogger(__name__)
@@ -47,4 +53,116 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+# Поддержка дневной сводки продаж: запоминаем прежний статус заказа перед сохранением
+@receiver(pre_save, sender=Order)
+def remember_previous_order_status(sender, instance, **kwargs):
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+@receiver(post_save, sender=Order)
+def update_sales_rollup_on_status_change(sender, instance, **kwargs):
+    was_delivered = getattr(instance, '_previous_status', None) == rollups.DELIVERED
+    is_delivered = instance.status == rollups.DELIVERED
+    if was_delivered != is_delivered:
+        rollups.apply_order(instance, sign=1 if is_delivered else -1)
+
+@receiver(pre_delete, sender=Order)
+def update_sales_rollup_on_order_delete(sender, instance, **kwargs):
+    # Суммы по позициям вычитаются в обработчике удаления OrderItem (каскад)
+    if instance.status == rollups.DELIVERED:
+        rollups.apply_to_rollup(rollups.order_day(instance), orders=1, sign=-1)
+
+@receiver(pre_save, sender=OrderItem)
+def remember_previous_order_item(sender, instance, **kwargs):
+    instance._previous_item = None
+    if instance.pk:
+        instance._previous_item = OrderItem.objects.select_related('product').filter(pk=instance.pk).first()
+
+@receiver(post_save, sender=OrderItem)
+def update_sales_rollup_on_item_save(sender, instance, **kwargs):
+    if instance.order.status != rollups.DELIVERED:
+        return
+    previous = getattr(instance, '_previous_item', None)
+    if previous is not None:
+        rollups.apply_item(previous, sign=-1)
+    rollups.apply_item(instance, sign=1)
+
+@receiver(post_delete, sender=OrderItem)
+def update_sales_rollup_on_item_delete(sender, instance, origin=None, **kwargs):
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order is not None and order.status == rollups.DELIVERED:
+        instance.order = order
+        # При удалении самого товара его дневные счётчики удаляются каскадом - не создаём их заново
+        deleting_product = isinstance(origin, Product) or getattr(origin, 'model', None) is Product
+        rollups.apply_item(instance, sign=-1, with_product=not deleting_product)
+
+
+# Рейтинг товара: запоминаем прежнюю оценку, чтобы применить только разницу
+@receiver(pre_save, sender=Review)
+def remember_previous_review(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_review_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.product_id, instance.rating):
+        return
+    if previous is not None:
+        ratings.apply_rating(previous[0], previous[1], sign=-1)
+    ratings.apply_rating(instance.product_id, instance.rating)
+
+@receiver(post_delete, sender=Review)
+def update_product_rating_on_review_delete(sender, instance, **kwargs):
+    ratings.apply_rating(instance.product_id, instance.rating, sign=-1)
+
+
+# Любая запись заказов и сохранённых отчётов делает недействительным кэш отчётов
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def invalidate_reports_cache(sender, **kwargs):
+    invalidate(REPORTS_CACHE)
+
+
+# Каталог зависит от товаров (цены, остатки, популярность) и отзывов (рейтинг)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate(CATALOG_CACHE)
+
+
+# Первая страница отзывов и распределение оценок кэшируются по товару (core.reviews)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_reviews_cache(sender, instance, **kwargs):
+    reviews.invalidate_product_reviews(instance.product_id)
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None and previous[0] != instance.product_id:
+        reviews.invalidate_product_reviews(previous[0])
+
+
+# Поисковый индекс товаров (core.search); массовые загрузки перестраивают его целиком
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    search.index_product(instance)
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+# Анонимная корзина из cookie переносится в корзину пользователя при входе (core.cart)
+@receiver(user_logged_in)
+def merge_anonymous_cart_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        cart.merge_anonymous_cart(request, user)
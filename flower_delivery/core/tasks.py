@@ -1,15 +1,48 @@
+from datetime import timedelta
+
 from celery import shared_task
 from django.core.mail import send_mail
-from .utils import generate_sales_report_by_period
+from django.utils import timezone
+from .reports import ReportQuery, run_report, parse_date
+from .pdf import build_sales_report_pdf, mark_pdf_done, mark_pdf_failed
+from . import images, reservations, rollups
 
 @shared_task
 def send_daily_sales_report():
-    report = generate_sales_report_by_period(1)
+    # Отчёт за вчерашний день
+    yesterday = timezone.localdate() - timedelta(days=1)
+    report = run_report(ReportQuery(start=yesterday, end=yesterday))
     send_mail(
         'Ежедневный отчет по продажам',
-        f'Общий объем продаж: {report["total_sales"]}\n'
-        f'Общее количество заказов: {report["total_orders"]}\n'
-        f'Общее количество клиентов: {report["total_customers"]}',
+        f'Общий объем продаж: {report.total_sales}\n'
+        f'Общее количество заказов: {report.total_orders}\n'
+        f'Общее количество клиентов: {report.total_customers}',
         'info@flowerdelivery.ru',
         ['manager@flowerdelivery.ru']
     )
+
+@shared_task
+def generate_sales_report_pdf(key, start=None, end=None, statuses=None):
+    query = ReportQuery(start=parse_date(start), end=parse_date(end), statuses=tuple(statuses or ('delivered',)))
+    try:
+        path = build_sales_report_pdf(query, key=key)
+    except Exception:
+        mark_pdf_failed(key)
+        raise
+    mark_pdf_done(key)
+    return path
+
+@shared_task
+def update_popular_products():
+    # Флаг is_popular по продажам за последние дни с затуханием по давности
+    return rollups.update_popular_products()
+
+@shared_task
+def generate_product_image_derivatives(product_id):
+    # Копии изображения товара для каталога, карточки и корзины
+    return images.generate_product_derivatives(product_id)
+
+@shared_task
+def release_expired_reservations():
+    # Истёкшие резервы товаров уже не учитываются в остатках, задача только удаляет строки
+    return reservations.release_expired()
@@ -1,10 +1,63 @@
 from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from core import images
 
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def query_transform(context, **kwargs):
-    query = context['request'].GET.copy()
+    # base_query задают кэшируемые фрагменты, чтобы ссылки не зависели от лишних параметров запроса
+    base_query = context.get('base_query')
+    query = (base_query if base_query is not None else context['request'].GET).copy()
     for key, value in kwargs.items():
-        query[key] = value
+        # None убирает параметр (например, page при переходе по курсору)
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
     return query.urlencode()
+
+
+# Размер по умолчанию для атрибута sizes: какую ширину занимает изображение на странице
+PICTURE_SIZES = {
+    'thumb': '160px',
+    'card': '(max-width: 768px) 100vw, 33vw',
+    'detail': '(max-width: 768px) 100vw, 50vw',
+}
+
+
+@register.simple_tag
+def product_picture(product, size='card', **attrs):
+    """
+    Изображение товара: <picture> с копиями WebP/JPEG в srcset, если они построены,
+    иначе исходный файл или заглушка. Остальные аргументы становятся атрибутами <img>.
+    """
+    attrs.setdefault('alt', product.name)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    sizes = images.product_derivatives(product)
+    if sizes is None or size not in sizes:
+        src = product.image.url if product.image else static('images/placeholder.png')
+        return format_html('<img src="{}"{}>', src, _attributes(attrs))
+
+    # Браузер выбирает копию по sizes и плотности экрана; копии одной ширины (маленький исходник) не повторяются
+    variants = list({sizes[name]['width']: sizes[name] for name in images.IMAGE_DERIVATIVES if name in sizes}.values())
+    sizes_attr = attrs.pop('sizes', PICTURE_SIZES.get(size, '100vw'))
+
+    def srcset(key):
+        return ', '.join(f"{images.derivative_url(variant[key])} {variant['width']}w" for variant in variants)
+
+    selected = sizes[size]
+    attrs.setdefault('width', selected['width'])
+    attrs.setdefault('height', selected['height'])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        srcset('webp'), sizes_attr, images.derivative_url(selected['jpeg']), srcset('jpeg'), sizes_attr,
+        _attributes(attrs),
+    )
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
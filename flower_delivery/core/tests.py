@@ -1,11 +1,57 @@
 # core/tests.py
-import sys
+import io
+import json
 import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from html import unescape
+from io import BytesIO
+from unittest import mock
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Product, Order, OrderItem
+from django.utils import timezone
+from PIL import Image
+
+from . import caching, reservations, search
+from . import reviews as product_reviews_module
+from .benchmarks import ENDPOINTS, run_benchmarks
+from .cart import ANONYMOUS_CART_COOKIE
+from .catalog import catalog_facets
+from .charts import PLOTLY_JS_VERSION, line_chart_url
+from .checkout import InsufficientStock, place_order
+from .facets import CatalogFilters
+from .images import generate_product_derivatives, product_derivatives
+from .models import (
+    Cart, CartItem, DailyCategorySales, DailySales, Order, OrderItem, Product, ProductDailySales, Report, Review,
+    StockReservation,
+)
+from .pagination import KeysetPaginator
+from .product_import import import_products, read_rows
+from .ratings import reconcile_ratings
+from .reports import (
+    GROUP_CATEGORY, GROUP_MONTH, GROUP_PRODUCT, WATERMARK_LAG, ReportQuery, cached_report,
+    generate_incremental_reports, period_bounds, run_report, top_products,
+)
+from .rollups import rebuild_sales_rollup, update_popular_products
+from .tasks import generate_product_image_derivatives, generate_sales_report_pdf
+
 
 class OrderTest(TestCase):
     @classmethod
@@ -67,10 +113,6 @@ class OrderTest(TestCase):
         response = self.client.get(reverse('repeat_order', args=[9999]))
         self.assertEqual(response.status_code, 404)
 
-# core/tests.py
-
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
 
 class ReportTest(TestCase):
     def setUp(self):
@@ -107,3 +149,1107 @@ class ReportsTestCase(TestCase):
         response = self.client.get(reverse('popular_products_report'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Тестовый продукт')
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.roses = Product.objects.create(name='Розы', price=100, category='roses', created_by=self.user)
+        self.tulips = Product.objects.create(name='Тюльпаны', price=50, category='tulips', created_by=self.user)
+        self.order = Order.objects.create(user=self.user, address='Адрес')
+        OrderItem.objects.create(order=self.order, product=self.roses, quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.tulips, quantity=3)
+        self.today = timezone.localdate()
+
+    def test_rollup_follows_delivered_status(self):
+        self.assertFalse(DailySales.objects.exists())
+
+        self.order.update_status('delivered')
+        day = DailySales.objects.get(date=self.today)
+        self.assertEqual(day.total_sales, Decimal('350'))
+        self.assertEqual(day.total_orders, 1)
+        roses = DailyCategorySales.objects.get(date=self.today, category='roses')
+        self.assertEqual((roses.total_quantity, roses.total_sales), (2, Decimal('200')))
+
+        self.order.update_status('canceled')
+        day.refresh_from_db()
+        self.assertEqual((day.total_sales, day.total_orders), (0, 0))
+
+    def test_items_added_to_delivered_order_and_delete(self):
+        order = Order.objects.create(user=self.user, status='delivered')
+        OrderItem.objects.create(order=order, product=self.roses, quantity=1)
+        self.assertEqual(DailySales.objects.get(date=self.today).total_sales, Decimal('100'))
+
+        order.delete()
+        day = DailySales.objects.get(date=self.today)
+        self.assertEqual((day.total_sales, day.total_orders), (0, 0))
+
+    def test_rebuild_and_report_read_rollup(self):
+        self.order.update_status('delivered')
+        DailySales.objects.all().delete()
+        call_command('rebuild_sales_rollup', stdout=open(os.devnull, 'w'))
+
+        report = run_report(ReportQuery())
+        self.assertEqual(report.total_sales, Decimal('350'))
+        self.assertEqual(report.total_orders, 1)
+        self.assertEqual([(p.key, p.total_sales) for p in report.series], [(self.today, Decimal('350'))])
+
+
+class ReportEngineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        other = User.objects.create_user(username='other', password='password')
+        self.roses = Product.objects.create(name='Розы', price=100, category='roses', created_by=self.user)
+        tulips = Product.objects.create(name='Тюльпаны', price=50, category='tulips', created_by=self.user)
+        for user, status in ((self.user, 'delivered'), (other, 'delivered'), (other, 'pending')):
+            order = Order.objects.create(user=user, status=status)
+            OrderItem.objects.create(order=order, product=self.roses, quantity=1)
+            OrderItem.objects.create(order=order, product=tulips, quantity=2)
+
+    def test_fixed_number_of_queries_for_every_grouping(self):
+        for group_by in (GROUP_MONTH, GROUP_CATEGORY, GROUP_PRODUCT):
+            for statuses in (('delivered',), ('delivered', 'pending')):
+                with self.subTest(group_by=group_by, statuses=statuses), self.assertNumQueries(3):
+                    run_report(ReportQuery(statuses=statuses, group_by=group_by))
+
+    def test_totals_match_between_rollup_and_source(self):
+        rollup = run_report(ReportQuery(group_by=GROUP_CATEGORY))
+        source = run_report(ReportQuery(group_by=GROUP_PRODUCT))
+        self.assertEqual(rollup.total_sales, Decimal('400'))
+        self.assertEqual(source.total_sales, Decimal('400'))
+        self.assertEqual((rollup.total_orders, rollup.total_customers), (2, 2))
+        self.assertEqual([(p.label, p.total_quantity) for p in source.series], [('Тюльпаны', 4), ('Розы', 2)])
+
+        everything = run_report(ReportQuery(statuses=('delivered', 'pending'), group_by=GROUP_MONTH))
+        self.assertEqual((everything.total_sales, everything.total_orders), (Decimal('600'), 3))
+
+    def test_query_spec_validation_and_params(self):
+        with self.assertRaises(ValueError):
+            ReportQuery(group_by='year')
+        with self.assertRaises(ValueError):
+            ReportQuery(statuses=('lost',))
+        query = ReportQuery.from_params({'start_date': '2024-01-01', 'end_date': 'bad'})
+        self.assertEqual((str(query.start), query.end), ('2024-01-01', None))
+
+
+class OrderItemPriceSnapshotTest(TestCase):
+    def test_price_change_does_not_revalue_orders(self):
+        user = User.objects.create_user(username='buyer', password='password')
+        product = Product.objects.create(name='Розы', price=100, created_by=user)
+        order = Order.objects.create(user=user, status='delivered')
+        item = OrderItem.objects.create(order=order, product=product, quantity=3)
+        self.assertEqual((item.unit_price, item.line_total), (100, 300))
+
+        product.price = 150
+        product.save()
+        order = Order.objects.get(pk=order.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(order.get_total_price(), 300)
+        self.assertEqual(run_report(ReportQuery(group_by=GROUP_PRODUCT)).total_sales, 300)
+
+
+class SalesLinesExportTest(TestCase):
+    def test_streams_every_order_line(self):
+        admin = User.objects.create_superuser(username='admin', password='adminpassword')
+        product = Product.objects.create(name='Розы', price=100, category='roses', created_by=admin)
+        for quantity in (1, 2, 3):
+            order = Order.objects.create(user=admin, status='delivered')
+            OrderItem.objects.create(order=order, product=product, quantity=quantity)
+        Order.objects.create(user=admin, status='pending')
+
+        self.client.force_login(admin)
+        response = self.client.get('/admin/core/report/download_csv/')
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = content.lstrip('\ufeff').splitlines()
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[0].startswith('Номер заказа;Дата;Статус'))
+        self.assertTrue(rows[-1].endswith(';Розы;Розы;3;100.00;300.00'))
+
+
+class SalesReportPdfTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+        self.admin = User.objects.create_superuser(username='admin', password='adminpassword')
+        product = Product.objects.create(name='Розы', price=100, created_by=self.admin)
+        order = Order.objects.create(user=self.admin, status='delivered')
+        OrderItem.objects.create(order=order, product=product, quantity=2)
+        self.client.force_login(self.admin)
+
+    def test_pdf_is_generated_in_background_and_reused(self):
+        url = '/admin/core/report/download_pdf/'
+        with mock.patch.object(generate_sales_report_pdf, 'delay') as delay:
+            response = self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(delay.call_count, 1)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        generate_sales_report_pdf(**delay.call_args.kwargs)
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], 'ready')
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+        with mock.patch.object(generate_sales_report_pdf, 'delay') as delay:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        delay.assert_not_called()
+
+    def test_new_data_produces_new_artifact(self):
+        with mock.patch.object(generate_sales_report_pdf, 'delay') as delay:
+            first = self.client.get('/reports/sales/download/pdf/').json()['status_url']
+            generate_sales_report_pdf(**delay.call_args.kwargs)
+            order = Order.objects.create(user=self.admin, status='delivered')
+            OrderItem.objects.create(order=order, product=Product.objects.get(), quantity=1)
+            second = self.client.get('/reports/sales/download/pdf/').json()['status_url']
+        self.assertNotEqual(first, second)
+
+
+class ChartServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.client.force_login(self.admin)
+
+    def test_chart_png_is_cached_by_input(self):
+        url = line_chart_url(['2024-01-01', '2024-01-02'], [10, 20], 'Продажи', 'Дата', 'Сумма')
+        self.assertEqual(url, line_chart_url(['2024-01-01', '2024-01-02'], [10, 20], 'Продажи', 'Дата', 'Сумма'))
+        self.assertNotEqual(url, line_chart_url(['2024-01-01'], [10], 'Продажи', 'Дата', 'Сумма'))
+
+        with mock.patch('core.charts.render_line_chart_png', return_value=b'png') as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertEqual(second.content, b'png')
+        self.assertEqual(self.client.get('/reports/charts/unknown.png').status_code, 404)
+
+    def test_sales_report_links_plotly_js_instead_of_inlining(self):
+        product = Product.objects.create(name='Розы', price=100, created_by=self.admin)
+        order = Order.objects.create(user=self.admin, status='delivered')
+        OrderItem.objects.create(order=order, product=product, quantity=1)
+
+        response = self.client.get(reverse('sales_report'))
+        js_url = reverse('plotly_js', args=[PLOTLY_JS_VERSION])
+        self.assertContains(response, f'<script src="{js_url}"></script>', html=False)
+        self.assertLess(len(response.content), 100_000)
+
+        js = self.client.get(js_url)
+        self.assertEqual(js['Content-Type'], 'application/javascript; charset=utf-8')
+        self.assertIn('immutable', js['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('plotly_js', args=['0.0.0'])).status_code, 404)
+
+
+class ProductSalesCountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.roses = Product.objects.create(name='Розы', price=100, category='roses', created_by=self.user)
+        self.tulips = Product.objects.create(name='Тюльпаны', price=50, category='tulips', created_by=self.user)
+        self.order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=self.order, product=self.roses, quantity=1)
+        OrderItem.objects.create(order=self.order, product=self.tulips, quantity=3)
+        self.today = timezone.localdate()
+
+    def test_counters_follow_delivery_and_serve_top_n(self):
+        self.assertFalse(ProductDailySales.objects.exists())
+        self.order.update_status('delivered')
+        tulips = ProductDailySales.objects.get(date=self.today, product=self.tulips)
+        self.assertEqual((tulips.total_quantity, tulips.total_sales), (3, Decimal('150')))
+
+        with self.assertNumQueries(1):
+            by_quantity = top_products(start=self.today, end=self.today, limit=1)
+        self.assertEqual([(p.label, p.total_quantity) for p in by_quantity], [('Тюльпаны', 3)])
+        self.assertEqual([p.label for p in top_products(by='sales')], ['Тюльпаны', 'Розы'])
+
+        ProductDailySales.objects.all().delete()
+        rebuild_sales_rollup()
+        self.assertEqual(ProductDailySales.objects.get(product=self.roses).total_sales, Decimal('100'))
+
+        self.order.update_status('canceled')
+        self.assertEqual([p.total_quantity for p in top_products()], [0, 0])
+
+    def test_deleting_sold_product(self):
+        self.order.update_status('delivered')
+        self.roses.delete()
+        self.assertFalse(Product.objects.filter(pk=self.roses.pk).exists())
+        self.assertEqual(list(ProductDailySales.objects.values_list('product', flat=True)), [self.tulips.pk])
+        self.assertEqual(DailySales.objects.get(date=self.today).total_sales, Decimal('150'))
+
+        Product.objects.filter(pk=self.tulips.pk).delete()
+        self.assertFalse(ProductDailySales.objects.exists())
+
+    def test_popularity_decays_with_age(self):
+        ProductDailySales.objects.create(date=self.today - timedelta(days=60), product=self.roses, total_quantity=10)
+        ProductDailySales.objects.create(date=self.today, product=self.tulips, total_quantity=2)
+        Product.objects.filter(pk=self.roses.pk).update(is_popular=True)
+
+        self.assertEqual(update_popular_products(limit=1, today=self.today), [self.tulips.pk])
+        self.assertEqual(list(Product.objects.popular()), [self.tulips])
+        self.roses.refresh_from_db()
+        self.assertLess(self.roses.popularity_score, 2)
+
+
+class PeriodReportsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.product = Product.objects.create(name='Розы', price=100, created_by=self.user)
+        self.order = Order.objects.create(user=self.user, status='delivered')
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+        self.today = timezone.localdate()
+
+    def test_period_bounds(self):
+        self.assertEqual(period_bounds(date(2024, 2, 14), 'week'), (date(2024, 2, 12), date(2024, 2, 18)))
+        self.assertEqual(period_bounds(date(2024, 2, 14), 'month'), (date(2024, 2, 1), date(2024, 2, 29)))
+
+    def test_generate_reports_upserts_period(self):
+        out = open(os.devnull, 'w')
+        call_command('generate_reports', stdout=out)
+        call_command('generate_reports', stdout=out)
+        report = Report.objects.get()
+        self.assertEqual((report.period_start, report.period_end, report.granularity), (self.today, self.today, 'day'))
+        self.assertEqual(report.total_sales, Decimal('200'))
+
+        day = self.today.isoformat()
+        call_command('generate_reports', '--backfill', day, day, '--granularity', 'month', '--workers', '1', stdout=out)
+        self.assertEqual(Report.objects.filter(granularity='month').count(), 1)
+
+    def test_incremental_mode_processes_changed_orders_only(self):
+        later = timezone.now() + timedelta(minutes=5)
+        self.assertEqual([r.total_sales for r in generate_incremental_reports(now=later)], [Decimal('200')])
+        self.assertEqual(generate_incremental_reports(now=later), [])
+
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        order.update_status('delivered')
+        Order.objects.filter(pk=order.pk).update(updated_at=later)
+        reports = generate_incremental_reports(now=later + timedelta(minutes=5))
+        self.assertEqual([r.total_sales for r in reports], [Decimal('300')])
+        self.assertEqual(Report.objects.count(), 1)
+
+    def test_incremental_mode_sees_item_edits_and_deleted_orders(self):
+        lag = WATERMARK_LAG
+        generate_incremental_reports(now=timezone.now() + lag)
+        item = self.order.items.get()
+        item.quantity = 3
+        item.save()
+        self.assertEqual([r.total_sales for r in generate_incremental_reports(now=timezone.now() + lag)],
+                         [Decimal('300')])
+
+        self.order.delete()
+        self.assertEqual([r.total_sales for r in generate_incremental_reports(now=timezone.now() + lag)], [0])
+
+
+class ReportCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.product = Product.objects.create(name='Розы', price=100, created_by=self.admin)
+        order = Order.objects.create(user=self.admin, status='delivered')
+        OrderItem.objects.create(order=order, product=self.product, quantity=2)
+
+    def test_report_cached_until_orders_change(self):
+        self.assertEqual(cached_report(ReportQuery()).total_sales, Decimal('200'))
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_report(ReportQuery()).total_sales, Decimal('200'))
+
+        order = Order.objects.create(user=self.admin, status='delivered')
+        OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        self.assertEqual(cached_report(ReportQuery()).total_sales, Decimal('300'))
+        self.assertEqual(caching.cache_stats()['reports'], {'hits': 1, 'misses': 2, 'waits': 0})
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            threading.Event().wait(0.3)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.get_or_compute('reports', 'stampede', compute)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['value'] * 4))
+        self.assertEqual(caching.cache_stats()['reports']['waits'], 3)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.assertEqual(self.client.get('/metrics/cache/').status_code, 403)
+        response = self.client.get('/metrics/cache/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'flower_cache_events_total{namespace="reports",event="hits"}')
+
+
+class LoadBenchmarkTest(TestCase):
+    def test_seed_and_benchmark_within_query_budgets(self):
+        call_command('seed_load_data', users=15, products=20, orders=150, reviews=40, carts=15,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(Order.objects.count(), 150)
+        self.assertTrue(DailySales.objects.exists())
+
+        data = run_benchmarks(iterations=1)
+        self.assertEqual(set(data['results']), {endpoint.name for endpoint in ENDPOINTS})
+        for name, result in data['results'].items():
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(result['queries'], result['max_queries_budget'])
+                self.assertNotIn('статус', ' '.join(result['failures']))
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.product = Product.objects.create(name='Розы', price=100, category='roses', stock=5, created_by=self.user)
+
+    def test_anonymous_catalog_served_from_cache(self):
+        self.assertContains(self.client.get('/?category=roses'), 'Розы')
+        with self.assertNumQueries(0):
+            response = self.client.get('/?category=roses&utm_source=mail')
+        self.assertContains(response, 'Розы')
+        self.assertNotContains(response, 'utm_source')
+
+        self.product.stock = 3
+        self.product.name = 'Белые розы'
+        self.product.save()
+        self.assertContains(self.client.get('/?category=roses'), 'Белые розы')
+
+    def test_authenticated_fragment_cached_separately_and_follows_reviews(self):
+        self.assertContains(self.client.get('/'), 'войдите')
+        self.client.force_login(self.user)
+        response = self.client.get('/')
+        self.assertNotContains(response, 'войдите')
+        self.assertContains(response, 'data-current-rating="0')
+
+        Review.objects.create(product=self.product, user=self.user, rating=4)
+        self.assertContains(self.client.get('/'), 'data-current-rating="4')
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='florist', password='password')
+        # Повторяющиеся названия: порядок однозначен только вместе с id
+        for i in range(14):
+            Product.objects.create(name=f'Букет {i % 5}', price=100, category='roses' if i % 2 else 'tulips',
+                                   stock=5, created_by=self.user)
+        self.expected = list(Product.objects.order_by('name', 'id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(Product.objects.all(), ('name', 'id'), 4)
+        pages, page = [], paginator.get_page()
+        self.assertFalse(page.has_previous())
+        while True:
+            pages.append([product.id for product in page])
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(ids) for ids in pages], [4, 4, 4, 2])
+
+        page = paginator.get_page(page.previous_cursor)
+        self.assertEqual([product.id for product in page], pages[2])
+        self.assertTrue(page.has_next())
+        last = paginator.get_page(page.last_cursor)
+        self.assertEqual([product.id for product in last], self.expected[-4:])
+        self.assertFalse(last.has_next())
+        self.assertEqual([product.id for product in paginator.get_page('не курсор')], pages[0])
+
+    def test_query_cost_does_not_depend_on_depth(self):
+        paginator = KeysetPaginator(Product.objects.filter(category='roses'), ('name', 'id'), 2)
+        page = paginator.get_page()
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                page = paginator.get_page(page.next_cursor)
+
+    @override_settings(CATALOG_KEYSET_PAGINATION=True)
+    def test_catalog_links_use_cursor(self):
+        names = []
+        url = '/?category=tulips'
+        while url:
+            response = self.client.get(url)
+            self.assertNotContains(response, 'page=')
+            names += re.findall(r'<h5 class="card-title">(.*?)</h5>', response.content.decode())
+            next_link = re.search(r'href="\?([^"]*)" aria-label="Следующая"', response.content.decode())
+            url = '/?' + unescape(next_link.group(1)) if next_link else None
+        expected = Product.objects.filter(category='tulips').order_by('name', 'id').values_list('name', flat=True)
+        self.assertEqual(names, list(expected))
+        # Старые ссылки с номером страницы продолжают работать
+        self.assertContains(self.client.get('/?category=tulips&page=2'), 'card-title')
+
+    @override_settings(CATALOG_KEYSET_PAGINATION=True)
+    def test_invalid_cursors_share_first_page_cache(self):
+        first = self.client.get('/?category=tulips').content
+        with CaptureQueriesContext(connection) as captured:
+            for cursor in ('мусор', 'eyJkIjoibiJ9', 'x' * 40):
+                self.assertEqual(self.client.get('/', {'category': 'tulips', 'cursor': cursor}).content, first)
+        self.assertFalse([query for query in captured if 'core_product' in query['sql']])
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='searcher', password='password', is_staff=True, is_superuser=True)
+        self.red = Product.objects.create(name='Красная роза', description='Одна роза на длинном стебле',
+                                          price=150, category='roses', created_by=self.user)
+        self.bouquet = Product.objects.create(name='Весенний букет', description='Тюльпаны и розовые пионы',
+                                              price=2500, category='bouquets', created_by=self.user)
+        self.orchid = Product.objects.create(name='Орхидея в горшке', description='Белая орхидея, ёмкость в подарок',
+                                             price=1200, category='orchids', created_by=self.user)
+
+    def test_prefix_and_morphology_with_ranking(self):
+        # Совпадение в названии важнее совпадения в описании
+        self.assertEqual(search.search_product_ids('розы'), [self.red.id, self.bouquet.id])
+        self.assertEqual(search.search_product_ids('тюл'), [self.bouquet.id])
+        self.assertEqual(search.search_product_ids('орхидеи емкость'), [self.orchid.id])
+        # Категория индексируется названием: «Букеты»
+        self.assertEqual(search.search_product_ids('букеты'), [self.bouquet.id])
+        self.assertEqual(search.search_product_ids('"*) OR'), [])
+
+    def test_index_follows_product_changes(self):
+        self.red.name = 'Алая гвоздика'
+        self.red.description = 'Гвоздика'
+        self.red.save()
+        self.assertEqual(search.search_product_ids('гвозд'), [self.red.id])
+        self.assertNotIn(self.red.id, search.search_product_ids('красная'))
+        self.orchid.delete()
+        self.assertEqual(search.search_product_ids('орхидея'), [])
+
+    def test_search_page_suggest_and_admin(self):
+        response = self.client.get(reverse('product_search'), {'q': 'роза'})
+        self.assertContains(response, 'Красная роза')
+        self.assertContains(response, 'Найдено товаров: 2')
+
+        self.assertEqual(self.client.get(reverse('search_suggest'), {'q': 'орх'}).json()['results'][0]['url'],
+                         reverse('product_detail', args=[self.orchid.id]))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('search_suggest'), {'q': 'орх'})
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:core_product_changelist'), {'q': 'пионы'})
+        self.assertContains(response, 'Весенний букет')
+        self.assertNotContains(response, 'Красная роза')
+
+
+def _upload(name, size=(2000, 1000)):
+    buffer = BytesIO()
+    Image.new('RGBA', size, (200, 30, 60, 128)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ProductImageDerivativesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = User.objects.create_superuser(username='manager', password='password')
+        self.client.force_login(self.admin)
+        self.product = Product.objects.create(name='Пионы', price=900, category='other', created_by=self.admin,
+                                              image=_upload('peonies.png'))
+
+    def test_form_schedules_task_only_for_new_image(self):
+        data = {'name': 'Пионы', 'description': 'Свежие', 'price': 900}
+        with mock.patch.object(generate_product_image_derivatives, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('edit_product', args=[self.product.id]), data)
+            delay.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('edit_product', args=[self.product.id]), {**data, 'image': _upload('new.png')})
+        delay.assert_called_once_with(self.product.id)
+
+    def test_derivatives_are_content_hashed_and_rendered_with_srcset(self):
+        self.assertContains(self.client.get('/'), self.product.image.url)
+        self.assertTrue(generate_product_derivatives(self.product.id))
+        self.product.refresh_from_db()
+        sizes = product_derivatives(self.product)
+        self.assertEqual([sizes[name]['width'] for name in ('thumb', 'card', 'detail')], [160, 480, 1200])
+        self.assertEqual(sizes['card']['height'], 240)
+        # Повторная генерация из того же исходника даёт те же имена
+        generate_product_derivatives(self.product.id)
+        self.product.refresh_from_db()
+        self.assertEqual(product_derivatives(self.product), sizes)
+
+        response = self.client.get('/')
+        # Копии отдаются из хранилища (MEDIA_URL), а не через представление Django
+        webp_url = default_storage.url(f"products/derivatives/{sizes['card']['webp']}")
+        self.assertContains(response, f'{webp_url} 480w')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertTrue(webp_url.startswith(settings.MEDIA_URL))
+
+        # Копии прежнего изображения не используются после замены
+        self.product.image = _upload('other.png', size=(300, 300))
+        self.product.save()
+        self.assertIsNone(product_derivatives(self.product))
+
+
+class ProductRatingCountersTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.buyers = [User.objects.create_user(username=f'buyer{i}', password='password') for i in range(3)]
+        self.product = Product.objects.create(name='Лилии', price=700, created_by=self.owner)
+
+    def assertRating(self, rating_sum, rating_count, current_rating):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(self.product.current_rating, current_rating)
+
+    def test_counters_follow_review_writes_without_aggregation(self):
+        with CaptureQueriesContext(connection) as captured:
+            Review.objects.create(product=self.product, user=self.buyers[0], rating=5)
+        self.assertFalse([query for query in captured if 'AVG(' in query['sql'].upper()])
+        Review.objects.create(product=self.product, user=self.buyers[1], rating=2)
+        self.assertRating(7, 2, 3.5)
+
+        # rate_product обновляет существующую оценку через update_or_create
+        self.client.force_login(self.buyers[1])
+        self.client.post(reverse('rate_product', args=[self.product.id]), '{"rating": 4}', content_type='application/json')
+        self.assertRating(9, 2, 4.5)
+
+        Review.objects.get(user=self.buyers[0]).delete()
+        self.assertRating(4, 1, 4.0)
+        Review.objects.all().delete()
+        self.assertRating(0, 0, 0.0)
+
+    def test_reconcile_fixes_drift(self):
+        Review.objects.create(product=self.product, user=self.buyers[0], rating=3)
+        Review.objects.bulk_create([Review(product=self.product, user=self.buyers[1], rating=5)])
+        self.assertRating(3, 1, 3.0)
+
+        self.assertEqual(reconcile_ratings(), 1)
+        self.assertRating(8, 2, 4.0)
+        self.assertEqual(reconcile_ratings(), 0)
+
+
+class CatalogApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='partner', password='password')
+        self.products = [
+            Product.objects.create(name=f'Тюльпаны {i}', price=100 + i, category='tulips', stock=i, created_by=self.user)
+            for i in range(5)
+        ]
+        Product.objects.create(name='Роза', price=150, category='roses', stock=3, created_by=self.user)
+
+    def test_list_pagination_fields_and_detail(self):
+        response = self.client.get(reverse('api_category_products', args=['tulips']), {'limit': 3, 'fields': 'id,name'})
+        data = response.json()
+        self.assertEqual(data['results'][0], {'id': self.products[0].id, 'name': 'Тюльпаны 0'})
+        self.assertIsNone(data['previous'])
+        second = self.client.get(data['next']).json()
+        self.assertEqual([item['name'] for item in second['results']], ['Тюльпаны 3', 'Тюльпаны 4'])
+        self.assertIsNone(second['next'])
+
+        self.assertEqual(len(self.client.get(reverse('api_product_list')).json()['results']), 6)
+        detail = self.client.get(reverse('api_product_detail', args=[self.products[1].id])).json()
+        self.assertEqual((detail['price'], detail['stock'], detail['in_stock']), ('101.00', 1, True))
+
+        self.assertEqual(self.client.get(reverse('api_product_list'), {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_product_detail', args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_category_products', args=['cacti'])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('api_product_list')).status_code, 405)
+
+    def test_conditional_requests_return_304_without_queries(self):
+        url = reverse('api_product_list')
+        response = self.client.get(url)
+        etag, modified = response['ETag'], response['Last-Modified']
+        self.assertTrue(etag.startswith('"'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertNotEqual(self.client.get(url, {'fields': 'id'})['ETag'], etag)
+
+        self.products[0].price = 90
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        prices = {item['id']: item['price'] for item in response.json()['results']}
+        self.assertEqual(prices[self.products[0].id], '90.00')
+
+
+class CatalogFacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='facets', password='password')
+        Product.objects.create(name='Розы дешёвые', price=300, category='roses', stock=5, created_by=self.user,
+                               current_rating=4.5)
+        Product.objects.create(name='Розы дорогие', price=2000, category='roses', stock=0, created_by=self.user)
+        Product.objects.create(name='Тюльпаны', price=400, category='tulips', stock=2, created_by=self.user,
+                               current_rating=3)
+
+    def counts(self, filters, facet):
+        options = next(item for item in catalog_facets(filters) if item['name'] == facet)['options']
+        return {option['value']: option['count'] for option in options}
+
+    def test_filters_are_canonical(self):
+        first = CatalogFilters.from_query(QueryDict('price=0-500&category=tulips&category=roses&utm=1&category=cacti'))
+        second = CatalogFilters.from_query(QueryDict('category=roses&category=tulips&price=0-500'))
+        self.assertEqual(first, second)
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(first.query().urlencode(), 'category=roses&category=tulips&price=0-500')
+        self.assertEqual(first.toggle('category', 'tulips').query().urlencode(), 'category=roses&price=0-500')
+
+    def test_counts_exclude_own_facet_and_use_one_query(self):
+        filters = CatalogFilters.from_query(QueryDict('category=roses&in_stock=1'))
+        with self.assertNumQueries(1):
+            categories = self.counts(filters, 'category')
+        # Счётчики категорий учитывают наличие, но не выбранную категорию
+        self.assertEqual((categories['roses'], categories['tulips']), (1, 1))
+        self.assertEqual(self.counts(filters, 'price')['0-500'], 1)
+        self.assertEqual(self.counts(filters, 'in_stock')['1'], 1)
+        self.assertEqual(self.counts(filters, 'rating')['4'], 1)
+        with self.assertNumQueries(0):
+            catalog_facets(CatalogFilters.from_query(QueryDict('in_stock=1&category=roses')))
+
+    def test_catalog_page_filters_and_shares_cache(self):
+        response = self.client.get('/', {'category': ['tulips', 'roses'], 'price': '0-500'})
+        self.assertContains(response, 'Розы дешёвые')
+        self.assertContains(response, '<h5 class="card-title">Тюльпаны</h5>', html=False)
+        self.assertNotContains(response, 'Розы дорогие')
+        self.assertContains(response, '<link rel="canonical" href="http://testserver/?category=roses&amp;category=tulips&amp;price=0-500">',
+                            html=False)
+        with self.assertNumQueries(0):
+            self.client.get('/?price=0-500&category=roses&category=tulips&ref=ads')
+        response = self.client.get('/?in_stock=1&rating=4')
+        self.assertContains(response, '<h5 class="card-title">Розы дешёвые</h5>', html=False)
+        self.assertNotContains(response, '<h5 class="card-title">Тюльпаны</h5>', html=False)
+
+
+class ProductReviewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='florist', password='password')
+        self.product = Product.objects.create(name='Гортензии', price=900, created_by=self.owner)
+        now = timezone.now()
+        for i in range(12):
+            user = User.objects.create_user(username=f'reviewer{i}', password='password')
+            review = Review.objects.create(product=self.product, user=user, rating=i % 5 + 1, comment=f'Отзыв {i}')
+            # Одинаковое время у пар отзывов: порядок внутри пары задаёт id
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(minutes=i // 2))
+
+    def test_keyset_pages_newest_first(self):
+        first = product_reviews_module.product_reviews(self.product.id)
+        self.assertEqual(first['total'], 12)
+        self.assertEqual([row['count'] for row in first['histogram']], [2, 2, 2, 3, 3])
+        self.assertEqual(len(first['reviews']), product_reviews_module.REVIEWS_PAGE_SIZE)
+        self.assertEqual(first['reviews'][0]['comment'], 'Отзыв 1')
+        self.assertIsNone(first['previous_cursor'])
+
+        with CaptureQueriesContext(connection) as captured:
+            second = product_reviews_module.product_reviews(self.product.id, first['next_cursor'])
+        # Одна выборка страницы с пользователями, распределение оценок - из кэша
+        self.assertEqual(len(captured), 1)
+        self.assertEqual([row['comment'] for row in second['reviews']], ['Отзыв 11', 'Отзыв 10'])
+        self.assertIsNone(second['next_cursor'])
+        back = product_reviews_module.product_reviews(self.product.id, second['previous_cursor'])
+        self.assertEqual(back['reviews'], first['reviews'])
+
+    def test_first_page_cached_and_invalidated_by_review_writes(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertFalse([query for query in captured if 'core_review' in query['sql']])
+        self.assertContains(response, 'Отзыв 1')
+        self.assertContains(response, 'reviews_cursor=')
+
+        other = Product.objects.create(name='Пионы', price=500, created_by=self.owner)
+        other_url = reverse('product_detail', args=[other.id])
+        self.client.get(other_url)
+        Review.objects.create(product=self.product, user=self.owner, rating=5, comment='Свежий отзыв')
+        response = self.client.get(url)
+        self.assertContains(response, 'Свежий отзыв')
+        self.assertContains(response, 'Отзывы (13)')
+        # Кэш другого товара не сброшен
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(other_url)
+        self.assertFalse([query for query in captured if 'core_review' in query['sql']])
+
+
+class ProductImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='importer', password='password')
+        self.existing = Product.objects.create(sku='R-001', name='Роза', description='Красная', price=100,
+                                               stock=5, created_by=self.admin)
+
+    def test_diff_by_sku_with_bulk_writes(self):
+        data = io.StringIO(
+            'sku,name,price,stock,category\n'
+            'R-001,,100.00,7,\n'
+            'T-002,Тюльпан жёлтый,80,10,tulips\n'
+            'X-003,,50,1,\n'
+            'B-004,Букет,abc,1,\n'
+        )
+        with CaptureQueriesContext(connection) as captured:
+            result = import_products(read_rows(data), self.admin)
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.failed), (1, 1, 0, 2))
+        self.assertEqual(sorted(error.split(':')[0] for error in result.errors), ['Строка 4', 'Строка 5'])
+        # Одна выборка существующих и по одному INSERT/UPDATE на пачку, без сохранения по строке
+        updates = [query for query in captured if query['sql'].startswith('UPDATE "core_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"stock"', updates[0]['sql'])
+        self.assertNotIn('"name"', updates[0]['sql'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.stock, self.existing.name), (7, 'Роза'))
+        self.assertEqual(Product.objects.get(sku='T-002').category, 'tulips')
+        self.assertEqual(search.search_product_ids('тюльпан'), [Product.objects.get(sku='T-002').id])
+
+        # Повторная загрузка тех же значений ничего не записывает
+        again = import_products(read_rows(io.StringIO('[{"sku": "R-001", "price": "100", "stock": 7}]'), 'json'),
+                                self.admin)
+        self.assertEqual((again.inserted, again.updated, again.unchanged), (0, 0, 1))
+
+    def test_new_product_with_description(self):
+        data = io.StringIO(
+            'sku,name,description,price,category,stock\n'
+            'N-001,Лилия,Белая лилия,150,other,4\n'
+        )
+        result = import_products(read_rows(data), self.admin)
+        self.assertEqual((result.inserted, result.failed), (1, 0))
+        self.assertEqual(Product.objects.get(sku='N-001').description, 'Белая лилия')
+
+    def test_command_and_admin_upload(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'products.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"sku": "R-001", "price": "120.50"}\n{"sku": "O-005", "name": "Орхидея", "price": 900}\n')
+        out = io.StringIO()
+        call_command('import_products', path, '--dry-run', stdout=out)
+        self.assertIn('Добавлено: 1, обновлено: 1', out.getvalue())
+        self.assertFalse(Product.objects.filter(sku='O-005').exists())
+        call_command('import_products', path, stdout=io.StringIO())
+        self.existing.refresh_from_db()
+        self.assertEqual(str(self.existing.price), '120.50')
+
+        self.client.force_login(self.admin)
+        upload = SimpleUploadedFile('stock.csv', 'sku,stock\nR-001,0\nO-005,3\n'.encode('utf-8'))
+        response = self.client.post(reverse('admin:core_product_import'), {'file': upload})
+        self.assertContains(response, 'Обновлено: 2')
+        self.assertEqual(Product.objects.get(sku='O-005').stock, 3)
+
+
+class AnonymousCartTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='shop', password='password')
+        self.roses = Product.objects.create(name='Розы', price=100, stock=10, created_by=self.owner)
+        self.tulips = Product.objects.create(name='Тюльпаны', price=50, stock=10, created_by=self.owner)
+
+    def test_anonymous_cart_lives_in_cookie(self):
+        self.client.post(reverse('add_to_cart', args=[self.roses.id]), {'quantity': 2})
+        self.client.post(reverse('add_to_cart', args=[self.roses.id]), {'quantity': 1})
+        self.assertIn(ANONYMOUS_CART_COOKIE, self.client.cookies)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('view_cart'))
+        self.assertContains(response, 'Розы')
+        self.assertEqual(response.context['cart_total'], 300)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+        # Подделанная cookie не принимается
+        self.client.cookies[ANONYMOUS_CART_COOKIE] = '{"%d": 100}' % self.tulips.id
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart_items'], [])
+
+    def test_cart_merged_into_user_cart_on_login(self):
+        user = User.objects.create_user(username='buyer', password='password')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.roses, quantity=1)
+        self.client.post(reverse('add_to_cart', args=[self.roses.id]), {'quantity': 2})
+        self.client.post(reverse('add_to_cart', args=[self.tulips.id]), {'quantity': 4})
+
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'password'})
+        self.assertEqual(response.cookies[ANONYMOUS_CART_COOKIE].value, '')
+        quantities = dict(CartItem.objects.filter(cart__user=user).values_list('product__name', 'quantity'))
+        self.assertEqual(quantities, {'Розы': 3, 'Тюльпаны': 4})
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_merge_keeps_lines_that_fit_and_reports_shortages(self):
+        user = User.objects.create_user(username='buyer', password='password')
+        self.client.post(reverse('add_to_cart', args=[self.roses.id]), {'quantity': 6})
+        self.client.post(reverse('add_to_cart', args=[self.tulips.id]), {'quantity': 2})
+        Product.objects.filter(pk=self.roses.pk).update(stock=4)
+
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'password'}, follow=True)
+        quantities = dict(CartItem.objects.filter(cart__user=user).values_list('product__name', 'quantity'))
+        self.assertEqual(quantities, {'Розы': 4, 'Тюльпаны': 2})
+        self.assertIn('Розы: доступно 4 из 6', ' '.join(str(message) for message in response.context['messages']))
+
+
+class AtomicCheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='customer', password='password')
+        self.products = [
+            Product.objects.create(name=f'Букет {i}', price=100 + i, stock=5, created_by=self.user) for i in range(6)
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, count, quantity=2):
+        CartItem.objects.bulk_create(
+            [CartItem(cart=self.cart, product=product, quantity=quantity) for product in self.products[:count]]
+        )
+
+    def test_order_placed_with_constant_queries_and_stock_decremented(self):
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as small:
+            place_order(self.user, self.cart, 'Москва')
+        self.fill_cart(6)
+        with CaptureQueriesContext(connection) as large:
+            order = place_order(self.user, self.cart, 'Москва')
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(order.items.count(), 6)
+        self.assertEqual(order.get_total_price(), sum(2 * product.price for product in self.products))
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [1] + [3] * 5)
+        self.assertFalse(self.cart.items.exists())
+
+    @mock.patch('core.views.is_within_working_hours', return_value=True)
+    def test_shortage_rolls_back_and_reports_each_line(self, _):
+        self.fill_cart(3, quantity=4)
+        Product.objects.filter(pk=self.products[0].pk).update(stock=1)
+        Product.objects.filter(pk=self.products[2].pk).update(stock=3)
+        with self.assertRaises(InsufficientStock):
+            place_order(self.user, self.cart, 'Москва')
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout'), {'address': 'Москва'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            [(line['name'], line['requested'], line['available']) for line in response.json()['shortages']],
+            [('Букет 0', 4, 1), ('Букет 2', 4, 3)],
+        )
+        # Остаток товара, которого хватало, не списан; заказ не создан, корзина цела
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 3)
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='warehouse', password='password')
+        self.alice = User.objects.create_user(username='alice', password='password')
+        self.bob = User.objects.create_user(username='bob', password='password')
+        self.product = Product.objects.create(name='Последние пионы', price=300, stock=5, created_by=self.owner)
+
+    def add(self, user, quantity):
+        self.client.force_login(user)
+        return self.client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': quantity},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_holds_reduce_available_stock_until_expiry(self):
+        self.assertEqual(self.add(self.alice, 4).status_code, 200)
+        response = self.add(self.bob, 2)
+        self.assertEqual((response.status_code, response.json()['available']), (409, 1))
+        self.assertEqual(reservations.available_stock([self.product.id]), {self.product.id: 1})
+        self.assertEqual(reservations.available_stock([self.product.id], reservations.user_owner(self.alice)),
+                         {self.product.id: 5})
+
+        StockReservation.objects.filter(owner=reservations.user_owner(self.alice)).update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add(self.bob, 2).status_code, 200)
+        self.assertEqual(reservations.release_expired(batch_size=1), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('owner', 'quantity')),
+                         [(reservations.user_owner(self.bob), 2)])
+
+    def test_release_succeeds_when_others_hold_more_than_stock(self):
+        self.add(self.alice, 2)
+        self.add(self.bob, 3)
+        Product.objects.filter(pk=self.product.pk).update(stock=2)
+        reservations.hold(reservations.user_owner(self.alice), {self.product.id: 0})
+        self.assertEqual(list(StockReservation.objects.values_list('owner', flat=True)),
+                         [reservations.user_owner(self.bob)])
+
+    def test_checkout_converts_own_holds_and_respects_others(self):
+        self.add(self.alice, 3)
+        bob_cart = Cart.objects.create(user=self.bob)
+        CartItem.objects.create(cart=bob_cart, product=self.product, quantity=3)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.bob, bob_cart, 'Москва')
+        self.assertEqual(raised.exception.shortages[0].available, 2)
+
+        place_order(self.alice, Cart.objects.get(user=self.alice), 'Москва')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class CartSummaryCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shopper', password='password')
+        self.products = [
+            Product.objects.create(name=f'Ромашки {i}', price=100 * (i + 1), stock=10, created_by=self.user)
+            for i in range(4)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        self.items = CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product=product, quantity=1) for product in self.products]
+        )
+        self.client.force_login(self.user)
+
+    def cart_queries(self, captured):
+        return [query['sql'] for query in captured if 'core_cartitem' in query['sql']]
+
+    def test_cart_rendered_from_single_query_and_cached(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('view_cart'))
+        self.assertEqual(len(self.cart_queries(captured)), 1)
+        self.assertEqual(response.context['cart_total'], 1000)
+        self.assertContains(response, 'id="cart-badge">4</span>', html=False)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('view_cart'))
+        self.assertEqual(self.cart_queries(captured), [])
+
+        # Изменение цены (версия каталога) и добавление в корзину обновляют сводку
+        self.products[0].price = 150
+        self.products[0].save()
+        self.client.post(reverse('add_to_cart', args=[self.products[1].id]), {'quantity': 2})
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_total'], 1450)
+        self.assertContains(response, 'id="cart-badge">6</span>', html=False)
+
+    def test_update_cart_item_returns_summary_totals(self):
+        self.client.get(reverse('view_cart'))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('update_cart_item', args=[self.items[2].id]), '{"quantity": 3}',
+                                        content_type='application/json')
+        self.assertFalse([sql for sql in self.cart_queries(captured) if 'SUM(' in sql.upper()])
+        data = response.json()
+        self.assertEqual((data['cart_total'], data['item_total'], data['cart_count']), ('1600.00', '900.00', 6))
+
+
+class CartBatchUpdateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='batcher', password='password')
+        self.products = [
+            Product.objects.create(name=f'Пионы {i}', price=100, stock=5, created_by=self.user)
+            for i in range(6)
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+        self.items = CartItem.objects.bulk_create(
+            [CartItem(cart=self.cart, product=product, quantity=1) for product in self.products[:3]]
+        )
+
+    def batch(self, operations):
+        return self.client.post(reverse('update_cart_batch'), json.dumps({'operations': operations}),
+                                content_type='application/json')
+
+    def test_mixed_operations_use_constant_queries(self):
+        self.client.force_login(self.user)
+        operations = [
+            {'item_id': self.items[0].id, 'quantity': 4},
+            {'item_id': self.items[1].id, 'quantity': 0},
+            {'product_id': self.products[3].id, 'quantity': 2},
+        ]
+        with CaptureQueriesContext(connection) as small:
+            response = self.batch(operations)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['cart']['count'], data['cart']['total']), (7, '700.00'))
+        self.assertEqual(dict(self.cart.items.values_list('product_id', 'quantity')), {
+            self.products[0].id: 4, self.products[2].id: 1, self.products[3].id: 2,
+        })
+
+        operations = [{'product_id': product.id, 'quantity': 2} for product in self.products]
+        with CaptureQueriesContext(connection) as large:
+            self.batch(operations)
+        self.assertLessEqual(len(large), len(small))
+
+    def test_shortage_rejects_whole_batch(self):
+        self.client.force_login(self.user)
+        response = self.batch([
+            {'item_id': self.items[0].id, 'quantity': 3},
+            {'product_id': self.products[4].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([item['product_id'] for item in response.json()['shortages']], [self.products[4].id])
+        self.assertEqual(sorted(self.cart.items.values_list('quantity', flat=True)), [1, 1, 1])
+        self.assertEqual(self.batch([{'item_id': 0, 'quantity': 1}]).status_code, 400)
+
+    def test_remove_oversold_line_with_other_updates(self):
+        other = User.objects.create_user(username='other', password='password')
+        reservations.hold(reservations.user_owner(other), {self.products[0].id: 5})
+        Product.objects.filter(pk=self.products[0].pk).update(stock=2)
+        self.client.force_login(self.user)
+        response = self.batch([
+            {'item_id': self.items[0].id, 'quantity': 0},
+            {'item_id': self.items[1].id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(self.cart.items.values_list('product_id', 'quantity')),
+                         {self.products[1].id: 3, self.products[2].id: 1})
+
+    def test_anonymous_cart_uses_product_ids(self):
+        response = self.batch([
+            {'product_id': self.products[0].id, 'quantity': 2},
+            {'product_id': self.products[1].id, 'quantity': 1},
+            {'product_id': self.products[1].id, 'quantity': 0},
+        ])
+        self.assertEqual(response.json()['cart']['count'], 2)
+        self.assertEqual(self.batch([{'item_id': self.items[0].id, 'quantity': 1}]).status_code, 400)
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual([line['quantity'] for line in response.context['cart_items']], [2])
+
+
+class RepeatOrderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='office', password='password')
+        self.products = [
+            Product.objects.create(name=f'Тюльпаны {i}', price=50, stock=10, created_by=self.user)
+            for i in range(8)
+        ]
+        self.client.force_login(self.user)
+
+    def make_order(self, lines):
+        order = Order.objects.create(user=self.user, address='Москва')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, unit_price=product.price,
+                      line_total=product.price * quantity)
+            for product, quantity in lines
+        ])
+        return order
+
+    def test_upserts_lines_with_constant_queries(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+        small = self.make_order([(self.products[0], 1), (self.products[1], 3)])
+        large = self.make_order([(product, 1) for product in self.products])
+
+        with CaptureQueriesContext(connection) as small_queries:
+            response = self.client.get(reverse('repeat_order', args=[small.id]))
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')),
+                         {self.products[0].id: 3, self.products[1].id: 3})
+
+        with CaptureQueriesContext(connection) as large_queries:
+            self.client.get(reverse('repeat_order', args=[large.id]))
+        self.assertEqual(len(large_queries), len(small_queries))
+        self.assertEqual(cart.items.count(), 8)
+
+    def test_shortage_leaves_cart_unchanged(self):
+        order = self.make_order([(self.products[0], 1), (self.products[1], 11)])
+        response = self.client.get(reverse('repeat_order', args=[order.id]))
+        self.assertRedirects(response, reverse('order_history'), fetch_redirect_response=False)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertFalse(StockReservation.objects.exists())
@@ -1,6 +1,6 @@
 # core\urls.py
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib.auth import views as auth_views
 from django.conf.urls.static import static
 from django.conf import settings
@@ -13,11 +13,19 @@ urlpatterns = [
     path('', views.product_list, name='catalog'),
     path('product/<int:product_id>/', views.product_detail, name='product_detail'),
     path('add_review/<int:product_id>/', views.add_review, name='add_review'),
+    path('search/', views.product_search, name='product_search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+
+    # JSON API каталога (только чтение)
+    path('api/v1/products/', api.product_list, name='api_product_list'),
+    path('api/v1/products/<int:product_id>/', api.product_detail, name='api_product_detail'),
+    path('api/v1/categories/<str:category>/products/', api.category_products, name='api_category_products'),
 
     # Маршруты для работы с корзиной
     path('cart/', views.view_cart, name='view_cart'),
     path('add_to_cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
+    path('cart/batch/', views.update_cart_batch, name='update_cart_batch'),
     path('cart/remove/<int:item_id>/', views.remove_cart_item, name='remove_cart_item'),
 
     # Маршруты для оформления заказа
@@ -75,6 +83,11 @@ urlpatterns = [
     path('reports/sales/download/csv/', views.download_sales_report_csv, name='download_sales_report_csv'),
     path('reports/sales/download/pdf/', views.download_sales_report_pdf, name='download_sales_report_pdf'),
     path('download_sales_report_pdf/', views.download_sales_report_pdf, name='download_sales_report_pdf'),
+    path('reports/sales/pdf/<str:key>/status/', views.sales_report_pdf_status, name='sales_report_pdf_status'),
+    path('reports/sales/pdf/<str:key>/', views.sales_report_pdf_download, name='sales_report_pdf_download'),
+    path('reports/charts/<str:key>.png', views.chart_png_view, name='chart_png'),
+    path('vendor/plotly-<str:version>.min.js', views.plotly_js, name='plotly_js'),
+    path('metrics/cache/', views.cache_metrics, name='cache_metrics'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
     path('order/history/', views.order_history, name='order_history'),
     path('order/success/<int:order_id>/', views.order_success, name='order_success'),
@@ -2,8 +2,7 @@
 import logging
 import requests
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.paginator import Paginator
-from .models import Product, Cart, CartItem, Order, OrderItem, Review, Report
+from .models import Product, CartItem, Order, Review
 from .forms import UserRegisterForm, UserUpdateForm, ProductForm
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.models import User
@@ -11,28 +10,31 @@ from django.http import HttpResponseRedirect, JsonResponse
 from django.core.mail import send_mail
 from django.conf import settings
 from .forms import StockUpdateForm
-from .utils import generate_sales_report
-import csv
 from reportlab.lib.pagesizes import letter
-from datetime import timedelta
 from django.http import HttpResponse
 from reportlab.pdfgen import canvas
-from io import BytesIO
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Sum, Count, F
+from django.db.models import Count
 from django.utils import timezone
 from datetime import datetime
 from .forms import UserProfileForm
 import json
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Avg
 from django.views.decorators.http import require_POST
 from django.db.utils import IntegrityError
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
-from .models import Product, Review
+from django.urls import reverse
+from django.template.loader import render_to_string
 from .forms import ReviewForm
+from .catalog import canonical_query, catalog_page_html
+from .facets import CatalogFilters
+from . import search
+from .reviews import product_reviews
+from . import cart as cart_service
+from .checkout import EmptyCart, InsufficientStock, place_order
+from . import reservations
+from .images import schedule_image_derivatives
 
 logger = logging.getLogger(__name__)
 
@@ -70,57 +72,53 @@ def update_stock(request, product_id):
     return render(request, 'update_stock.html', {'form': form, 'product': product})
 
 def product_list(request):
-    category = request.GET.get('category')
-    products = Product.objects.filter(category=category) if category else Product.objects.all()
-    # Используйте один из предложенных вариантов ниже
-    products = products.order_by('name').select_related('created_by')  # Вариант 1
-    # или
-    # products = products.order_by('name').only('id', 'name', 'price', 'created_by_id')  # Вариант 2
-    paginator = Paginator(products, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'catalog.html', {'page_obj': page_obj, 'products': page_obj.object_list, 'is_paginated': True})
-
-
-def get_or_create_cart(request):
-    """Функция для получения или создания корзины, привязанной к пользователю или сессии"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        # Используем идентификатор сессии
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session=session_id)
-    return cart
+    # Список товаров кэшируется фрагментом по фильтрам и странице (см. core.catalog)
+    filters = CatalogFilters.from_query(request.GET)
+    return render(request, 'catalog.html', {
+        'catalog_html': catalog_page_html(request, filters),
+        'canonical_query': canonical_query(request, filters),
+    })
+
+
+def product_search(request):
+    query = request.GET.get('q', '').strip()
+    products = search.search_products(query) if query else []
+    catalog_html = render_to_string('catalog_products.html', {
+        'products': products,
+        'user': request.user,
+        'empty_message': 'По вашему запросу ничего не найдено.' if query else 'Введите запрос для поиска.',
+    })
+    return render(request, 'search.html', {'catalog_html': catalog_html, 'query': query, 'found': len(products)})
+
+
+def search_suggest(request):
+    """Подсказки для строки поиска (JSON)."""
+    results = search.suggest(request.GET.get('q', ''))
+    for item in results:
+        item['url'] = reverse('product_detail', args=[item['id']])
+    return JsonResponse({'results': results})
+
 
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = get_or_create_cart(request)
     try:
         quantity = int(request.POST.get('quantity', 1))
         if quantity <= 0:
             raise ValueError("Количество должно быть положительным числом.")
-        if product.stock < quantity:  # Предположим, что есть поле stock для количества товара на складе
-            raise ValueError("Недостаточно товара на складе.")
+        # Анонимная корзина хранится в cookie, корзина пользователя - в базе (core.cart);
+        # количество в корзине резервируется с учётом чужих резервов (core.reservations)
+        cart_quantity = cart_service.add_product(request, product, quantity)
+    except InsufficientStock as e:
+        available = e.shortages[0].available
+        messages.error(request, f"Недостаточно товара на складе. Доступно для заказа: {available} шт.")
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'error': 'insufficient_stock', 'available': available}, status=409)
+        return redirect('view_cart')
     except ValueError as e:
         messages.error(request, str(e))
         return redirect('view_cart')
 
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        from django.db.models import F
-        cart_item.quantity = F('quantity') + quantity
-    else:
-        cart_item.quantity = quantity
-    cart_item.save()
-
-    # Очистка кэша корзины, если используется кэширование
-    from django.core.cache import cache
-    cache.delete(f'cart_{request.user.id}' if request.user.is_authenticated else f'session_{request.session.session_key}')
-
-    message = f'Товар "{product.name}" добавлен в корзину. Количество: {cart_item.quantity}.'
+    message = f'Товар "{product.name}" добавлен в корзину. Количество: {cart_quantity}.'
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({'message': message})
 
@@ -132,9 +130,8 @@ def view_cart(request):
     if not is_within_working_hours():
         messages.warning(request, "Заказы принимаются только в рабочее время (с 9:00 до 18:00).")
 
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
-    return render(request, 'cart.html', {'cart': cart, 'cart_items': cart_items})
+    summary = cart_service.cart_summary(request)
+    return render(request, 'cart.html', {'cart_items': summary['lines'], 'cart_total': summary['total']})
 
 @login_required
 def update_cart_item(request, item_id):
@@ -145,22 +142,45 @@ def update_cart_item(request, item_id):
             new_quantity = int(data.get('quantity', 1))
             if new_quantity <= 0:
                 raise ValueError("Количество должно быть положительным.")
-            cart_item.quantity = new_quantity
-            cart_item.save()
-
-            cart_total = cart_item.cart.get_total()
-            item_total = cart_item.get_total_price()
-
-            return JsonResponse({'success': True, 'cart_total': cart_total, 'item_total': item_total})
+            reservations.hold(reservations.user_owner(request.user), {cart_item.product_id: new_quantity})
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=new_quantity)
+            cart_service.invalidate_cart_summary(request.user)
+
+            # Суммы - из той же сводки, что и страница корзины (один запрос вместо агрегатов)
+            summary = cart_service.cart_summary(request)
+            item_total = next((line['total'] for line in summary['lines'] if line['id'] == cart_item.id), 0)
+            return JsonResponse({'success': True, 'cart_total': summary['total'], 'item_total': item_total,
+                                 'cart_count': summary['count']})
+        except InsufficientStock as e:
+            return JsonResponse({'success': False, 'error': 'insufficient_stock', 'available': e.shortages[0].available})
         except (ValueError, json.JSONDecodeError) as e:
             logger.error(f"Ошибка обновления корзины: {e}")
             return JsonResponse({'success': False, 'error': 'Invalid quantity'})
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
+@require_POST
+def update_cart_batch(request):
+    """
+    Пакетное изменение корзины (JSON): {"operations": [{"item_id" или "product_id": ..., "quantity": N}]},
+    quantity 0 удаляет позицию. Изменения применяются все или ни одного; в ответе - новое состояние корзины.
+    """
+    try:
+        operations = json.loads(request.body).get('operations')
+        summary = cart_service.apply_operations(request, operations)
+    except InsufficientStock as e:
+        return JsonResponse({'success': False, 'error': 'insufficient_stock', 'shortages': e.as_json()}, status=409)
+    except (ValueError, AttributeError) as e:
+        # CartError и некорректный JSON
+        message = str(e) if isinstance(e, cart_service.CartError) else 'Некорректный запрос'
+        return JsonResponse({'success': False, 'error': message}, status=400)
+    return JsonResponse({'success': True, 'cart': cart_service.summary_json(summary)})
+
 @login_required
 def remove_cart_item(request, item_id):
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     cart_item.delete()
+    cart_service.invalidate_cart_summary(request.user)
+    reservations.release(reservations.user_owner(request.user), [cart_item.product_id])
     messages.success(request, 'Товар удалён из корзины.')
     return redirect('view_cart')
 
@@ -178,7 +198,7 @@ def checkout(request):
         return redirect('view_cart')
 
 
-    cart = get_or_create_cart(request)
+    cart = cart_service.get_user_cart(request.user)
     if not cart.items.exists():
         logger.info("Attempt to checkout with an empty cart.")
         messages.error(request, 'Ваша корзина пуста. Пожалуйста, добавьте товары перед оформлением заказа.')
@@ -189,39 +209,51 @@ def checkout(request):
         comments = request.POST.get('comments', '')
         logger.info(f"Received address: {address}, comments: {comments}")
 
+        is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
         try:
-            # Создание заказа
-            order = Order.objects.create(user=request.user, address=address, comments=comments)
-            for item in cart.items.all():
-                OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity)
-
-            # Очистка корзины после оформления заказа
-            cart.items.all().delete()
+            # Заказ, списание остатков и очистка корзины - одна транзакция (core.checkout)
+            order = place_order(request.user, cart, address, comments)
             messages.success(request, 'Ваш заказ успешно оформлен.')
+            if is_ajax:
+                return JsonResponse({'success': True, 'order_id': order.id,
+                                     'redirect': reverse('order_success', args=[order.id])})
             return redirect('order_success', order_id=order.id)
 
+        except InsufficientStock as e:
+            logger.info(f"Недостаточно товара при оформлении заказа: {e}")
+            if is_ajax:
+                return JsonResponse({'success': False, 'error': 'insufficient_stock', 'shortages': e.as_json()},
+                                    status=409)
+            for shortage in e.shortages:
+                messages.error(request, f'«{shortage.name}»: доступно {shortage.available} шт., '
+                                        f'в корзине {shortage.requested} шт.')
+            return redirect('view_cart')
+
+        except EmptyCart:
+            messages.error(request, 'Ваша корзина пуста. Пожалуйста, добавьте товары перед оформлением заказа.')
+            return redirect('view_cart')
+
         except Exception as e:
             # Логирование ошибки и сообщение для пользователя
             logger.error(f"Ошибка при оформлении заказа: {e}")
             messages.error(request, 'Ошибка при оформлении заказа. Попробуйте позже.')
 
-    return render(request, 'checkout.html', {'cart': cart})
-
-@login_required
-def repeat_order(request, order_id):
-    """Функция для повторного заказа."""
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    new_order = Order.objects.create(user=order.user, address=order.address, comments=order.comments)
-
-    for item in order.items.all():
-        OrderItem.objects.create(order=new_order, product=item.product, quantity=item.quantity)
+    else:
+        # Начало оформления: позиции корзины резервируются на время заполнения формы
+        try:
+            cart_service.hold_cart(request.user)
+        except InsufficientStock as e:
+            for shortage in e.shortages:
+                messages.error(request, f'«{shortage.name}»: доступно {shortage.available} шт., '
+                                        f'в корзине {shortage.requested} шт.')
+            return redirect('view_cart')
 
-    messages.success(request, 'Повторный заказ успешно оформлен.')
-    return redirect('order_history')
+    summary = cart_service.cart_summary(request)
+    return render(request, 'checkout.html', {'cart_items': summary['lines'], 'cart_total': summary['total']})
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).prefetch_related('items__product').order_by('-created_at')
     return render(request, 'order_history.html', {'orders': orders})
 
 @login_required
@@ -250,7 +282,8 @@ def add_review(request, product_id):
 
 def product_detail(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    return render(request, 'product_detail.html', {'product': product})
+    reviews = product_reviews(product.id, request.GET.get('reviews_cursor'))
+    return render(request, 'product_detail.html', {'product': product, 'reviews': reviews})
 
 def register(request):
     if request.method == 'POST':
@@ -266,7 +299,7 @@ def register(request):
 @login_required
 def profile(request):
     # Получаем заказы текущего пользователя
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).prefetch_related('items').order_by('-created_at')
     return render(request, 'profile.html', {'orders': orders})
 
 def about(request):
@@ -283,6 +316,7 @@ def add_product(request):
             product = form.save(commit=False)
             product.created_by = request.user
             product.save()
+            schedule_image_derivatives(product)
             messages.success(request, 'Товар успешно добавлен.')
             return redirect('catalog')
     else:
@@ -298,7 +332,9 @@ def edit_product(request, product_id):
     if request.method == 'POST':
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            form.save()
+            product = form.save()
+            if 'image' in form.changed_data:
+                schedule_image_derivatives(product)
             messages.success(request, 'Товар успешно обновлён.')
             return redirect('catalog')
     else:
@@ -436,24 +472,20 @@ def suggest_address(request):
 
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    total_price = sum(item.get_total_price() for item in order.items.all())
+    order = get_object_or_404(Order.objects.prefetch_related('items__product'), id=order_id, user=request.user)
+    total_price = order.get_total_price()
     return render(request, 'order_detail.html', {'order': order, 'total_price': total_price})
 
 
+@login_required
 def repeat_order(request, order_id):
-    """Функция для повторного заказа"""
+    """Функция для повторного заказа: позиции заказа добавляются в корзину (core.cart.add_order_lines)"""
     original_order = get_object_or_404(Order, id=order_id, user=request.user)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-
-    for item in original_order.items.all():
-        # Проверяем, есть ли уже этот товар в корзине
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=item.product)
-        if not created:
-            cart_item.quantity += item.quantity  # Увеличиваем количество, если товар уже есть
-        else:
-            cart_item.quantity = item.quantity  # Иначе добавляем новое количество
-        cart_item.save()
+    try:
+        cart_service.add_order_lines(request.user, original_order)
+    except InsufficientStock as e:
+        messages.error(request, f'Недостаточно товара для повтора заказа: {e}')
+        return redirect('order_history')
 
     messages.success(request, 'Товары из заказа были добавлены в вашу корзину.')
     return redirect('view_cart')
@@ -465,58 +497,24 @@ def is_manager(user):
 # core/views.py
 
 from django.contrib.auth.decorators import user_passes_test
-from .utils import generate_sales_report_by_custom_period
-import plotly.express as px
-import plotly.io as pio
+from .reports import ReportQuery, cached_period_reports, cached_report, GROUP_PRODUCT
+from .exports import sales_lines_csv_response
+from .pdf import pdf_artifact_path, pdf_status, sales_report_pdf_response
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from .caching import metrics_text
+from .charts import chart_png, plotly_js_source, plotly_js_url, plotly_line_html, PLOTLY_JS_VERSION
+from django.views.decorators.cache import cache_control
 from django.shortcuts import render
 from datetime import datetime
 
 def is_manager(user):
     return user.is_superuser or user.groups.filter(name='Менеджеры').exists()
 
-def sales_report(request):
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-
-    if start_date_str and end_date_str:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-    else:
-        start_date = None
-        end_date = None
-
-    report = generate_sales_report(start_date=start_date, end_date=end_date)
-
-    # Подготовка данных для графика
-    dates = [entry['date'].strftime('%Y-%m-%d') for entry in report['daily_sales']]
-    sales = [float(entry['total_sales']) for entry in report['daily_sales']]
-
-    fig = px.line(x=dates, y=sales, labels={'x': 'Дата', 'y': 'Сумма продаж'}, title='Продажи по дням')
-    graph_html = fig.to_html(full_html=False)
-
-    return render(request, 'admin/sales_report.html', {
-        'report': report,
-        'graph_html': graph_html,
-        'start_date': start_date_str,
-        'end_date': end_date_str,
-    })
-
+@staff_member_required
 def download_sales_report_csv(request):
-    report = generate_sales_report_by_custom_period()
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-
-    # Используем UTF-8 с BOM для корректного отображения в Excel
-    response.write('\ufeff'.encode('utf8'))
-    writer = csv.writer(response)
-
-    writer.writerow(['Показатель', 'Значение'])
-    writer.writerow(['Общий объем продаж', report['total_sales']])
-    writer.writerow(['Общее количество заказов', report['total_orders']])
-    writer.writerow(['Общее количество клиентов', report['total_customers']])
-
-    return response
+    # Построчная выгрузка позиций заказов за период (по умолчанию - последние 30 дней)
+    return sales_lines_csv_response(ReportQuery.from_params(request.GET, default_days=30))
 
 
 def generate_pdf(request):
@@ -539,136 +537,97 @@ def generate_pdf(request):
     return response
 
 
+@staff_member_required
 def download_sales_report_pdf(request):
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
+    # PDF строится в фоне; готовый файл для тех же параметров и данных отдаётся сразу
+    return sales_report_pdf_response(ReportQuery.from_params(request.GET, default_days=30))
 
-    if start_date_str and end_date_str:
-        # Парсим даты из строк
-        naive_start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        naive_end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
 
-        # Преобразуем в осознанные объекты datetime
-        start_date = timezone.make_aware(naive_start_date)
-        end_date = timezone.make_aware(naive_end_date)
-    else:
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=30)
-        report = generate_sales_report_by_custom_period(start_date, end_date)
-        period_description = "за последние 30 дней"
-
-    # Создание PDF отчёта
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-
-    # Заголовок
-    p.drawString(100, 750, f"Отчёт по продажам {period_description}")
-
-    # Данные отчёта
-    p.drawString(100, 720, f"Общий объём продаж: {report['total_sales']} руб.")
-    p.drawString(100, 700, f"Общее количество заказов: {report['total_orders']}")
-    p.drawString(100, 680, f"Общее количество клиентов: {report['total_customers']}")
-
-    # Создание графика с Plotly
-    data = {
-        "Показатель": ["Продажи", "Заказы", "Клиенты"],
-        "Значение": [report['total_sales'], report['total_orders'], report['total_customers']]
-    }
-    fig = px.bar(data, x="Показатель", y="Значение", title="Отчёт по продажам")
-    graph_buffer = BytesIO()
-    fig.write_image(graph_buffer, format='png')
-    graph_buffer.seek(0)
+@staff_member_required
+def sales_report_pdf_status(request, key):
+    status = pdf_status(key)
+    data = {'status': status}
+    if status == 'ready':
+        data['download_url'] = reverse('sales_report_pdf_download', args=[key])
+    return JsonResponse(data)
 
-    # Добавление графика в PDF
-    p.drawImage(graph_buffer, 100, 400, width=400, height=200)
 
-    # Завершение PDF
-    p.showPage()
-    p.save()
-
-    # Сохранение PDF
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
+@staff_member_required
+def sales_report_pdf_download(request, key):
+    path = pdf_artifact_path(key)
+    if not default_storage.exists(path):
+        raise Http404("Отчёт ещё не готов.")
+    response = FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf')
     response['Content-Disposition'] = 'attachment; filename="sales_report.pdf"'
     return response
 
 
 @staff_member_required
-def reports_list(request):
-    reports = Report.objects.order_by('-created_at')
-    return render(request, 'reports/reports_list.html', {'reports': reports})
+@cache_control(private=True, max_age=24 * 60 * 60)
+def chart_png_view(request, key):
+    png = chart_png(key)
+    if png is None:
+        raise Http404("График не найден.")
+    return HttpResponse(png, content_type='image/png')
 
-@staff_member_required
-def sales_report(request):
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
 
-    if start_date_str and end_date_str:
-        # Парсим даты из строк
-        naive_start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        naive_end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+@cache_control(public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+def plotly_js(request, version):
+    # Версия в URL позволяет кэшировать файл браузером бессрочно
+    if version != PLOTLY_JS_VERSION:
+        raise Http404
+    return HttpResponse(plotly_js_source(), content_type='application/javascript; charset=utf-8')
 
-        # Преобразуем в осознанные объекты datetime
-        start_date = timezone.make_aware(naive_start_date)
-        end_date = timezone.make_aware(naive_end_date)
-    else:
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=30)
 
-    # Генерируем отчёт по выбранному периоду
-    report = generate_sales_report_by_custom_period(start_date, end_date)
+def cache_metrics(request):
+    # Счётчики кэша для Prometheus: доступны сотрудникам или по токену METRICS_TOKEN
+    token = settings.METRICS_TOKEN
+    authorized = request.user.is_staff or (token and request.headers.get('Authorization') == f'Bearer {token}')
+    if not authorized:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    # Данные для графика
-    data = {
-        "Показатель": ["Продажи", "Заказы", "Клиенты"],
-        "Значение": [report['total_sales'], report['total_orders'], report['total_customers']]
-    }
 
-    # Генерация графика с Plotly
-    fig = px.bar(data, x="Показатель", y="Значение", title="Отчет по продажам")
-    graph_html = fig.to_html(full_html=False)
+@staff_member_required
+def reports_list(request):
+    reports = cached_period_reports()
+    return render(request, 'reports/reports_list.html', {'reports': reports})
+
+@staff_member_required
+def sales_report(request):
+    # Отчёт по выбранному периоду (по умолчанию - последние 30 дней)
+    report = cached_report(ReportQuery.from_params(request.GET, default_days=30))
+
+    # График продаж по дням (plotly.js подключается отдельным файлом)
+    if report.series:
+        graph_html = plotly_line_html(
+            [point.label for point in report.series],
+            [point.total_sales for point in report.series],
+            title='Продажи по дням', xlabel='Дата', ylabel='Сумма продаж',
+        )
+    else:
+        graph_html = "<p>Нет данных для отображения графика.</p>"
 
     # Передаём данные в шаблон
     return render(request, 'admin/sales_report.html', {
         'report': report,
         'graph_html': graph_html,
-        'start_date': start_date.strftime('%Y-%m-%d'),
-        'end_date': end_date.strftime('%Y-%m-%d'),
+        'plotly_js_url': plotly_js_url(),
+        'start_date': report.query.start.strftime('%Y-%m-%d') if report.query.start else None,
+        'end_date': report.query.end.strftime('%Y-%m-%d') if report.query.end else None,
     })
 
 @staff_member_required
 def popular_products_report(request):
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-
-    if start_date_str and end_date_str:
-        start_date = timezone.datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = timezone.datetime.strptime(end_date_str, '%Y-%m-%d')
-    else:
-        end_date = timezone.now()
-        start_date = end_date - timezone.timedelta(days=30)
-
-    order_items = OrderItem.objects.filter(
-        order__created_at__range=[start_date, end_date],
-        order__status='delivered'
-    ).values(
-        'product__name'
-    ).annotate(
-        total_quantity=Sum('quantity'),
-        total_sales=Sum(F('quantity') * F('product__price'))
-    ).order_by('-total_quantity')
+    report = cached_report(ReportQuery.from_params(request.GET, default_days=30, group_by=GROUP_PRODUCT))
 
     context = {
-        'order_items': order_items,
-        'start_date': start_date.date(),
-        'end_date': end_date.date(),
+        'order_items': report.series,
+        'start_date': report.query.start,
+        'end_date': report.query.end,
     }
     return render(request, 'reports/popular_products_report.html', context)
 
-def catalog(request):
-    products = Product.objects.annotate(current_rating=Avg('reviews__rating'))
-    return render(request, 'catalog.html', {'products': products})
-
 @csrf_exempt
 @login_required
 def rate_product(request, product_id):
@@ -687,7 +646,7 @@ def rate_product(request, product_id):
                 defaults={'rating': rating}
             )
 
-            # Метод save в модели Review обновит current_rating продукта
+            # Рейтинг товара обновляется сигналом при сохранении отзыва (core.ratings)
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -13,5 +13,13 @@ app.conf.beat_schedule = {
         'task': 'core.tasks.send_daily_sales_report',
         'schedule': crontab(hour=8, minute=0),  # Каждый день в 8 утра
     },
+    'update-popular-products': {
+        'task': 'core.tasks.update_popular_products',
+        'schedule': crontab(hour=3, minute=30),  # Каждый день ночью
+    },
+    'release-expired-reservations': {
+        'task': 'core.tasks.release_expired_reservations',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+    },
 }
 
@@ -32,6 +32,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Анонимная корзина в подписанной cookie (core.cart)
+    'core.cart.AnonymousCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -50,6 +52,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.cart.cart_context',
             ],
         },
     },
@@ -127,6 +130,19 @@ COOKIE_CONSENT_AGE_DAYS = 365
 DADATA_API_KEY = env('DADATA_API_KEY', default='')
 DADATA_SECRET_KEY = env('DADATA_SECRET_KEY', default='')
 
+# Кэш: в продакшене - общий Redis (CACHE_URL=redis://localhost:6379/1), иначе память процесса
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Токен для сбора метрик кэша (/metrics/cache/) без входа в админку
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Постраничный вывод каталога по курсору (без OFFSET) вместо номеров страниц
+CATALOG_KEYSET_PAGINATION = env.bool('CATALOG_KEYSET_PAGINATION', default=False)
+
+# Сколько секунд товар в корзине зарезервирован за покупателем (core.reservations)
+STOCK_RESERVATION_TTL = env.int('STOCK_RESERVATION_TTL', default=15 * 60)
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 1209600  # Две недели
 
@@ -142,4 +158,6 @@ WORKING_DAYS = [0, 1, 2, 3, 4, 5, 6]  # Понедельник - Суббота
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_TASK_SERIALIZER = 'json'
+# Для локальной разработки без брокера задачи можно выполнять синхронно
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
\ No newline at end of file
@@ -93,7 +93,9 @@ async def confirm_order(update: Update, context: CallbackContext) -> int:
 
     user, _ = await sync_to_async(User.objects.get_or_create)(username=query.from_user.username)
     order = await sync_to_async(Order.objects.create)(user=user, address=address)
-    await sync_to_async(OrderItem.objects.create)(order=order, product=product, quantity=quantity)
+    await sync_to_async(OrderItem.objects.create)(
+        order=order, product=product, quantity=quantity, unit_price=product.price
+    )
     
     await notify_admin(order)
 